@@ -1,13 +1,16 @@
 import os
+import re
 import subprocess
+from Infra.results_store import ResultsStore
 
 class FIO:
     def __init__(self, path: str, machine: str):
         self.name = "FIO"
         self.machine_name = machine
+        self.root = os.getcwd()
         
     def run(self):
-        current = os.getcwd()
+        current = self.root
         
         print("Running FIO Tests...")
         tests = [
@@ -20,7 +23,8 @@ class FIO:
             ["randwrite", "1k"],
             ["randread", "1k"]
         ]
-        file = open('Outputs/FIO_results_' + self.machine_name +'.txt', 'w')
+        file = open(os.path.join(self.root, 'Outputs', 'FIO_results_' + self.machine_name +'.txt'), 'w')
+        store = ResultsStore(os.path.join(self.root, 'Outputs', 'results.db'), self.machine_name)
 
         for test in tests:
             results = subprocess.run(
@@ -30,14 +34,26 @@ class FIO:
                 stderr=subprocess.PIPE,
             )
             res = results.stdout.decode('utf-8').split()[2].strip(",()")
+            bandwidth = self.parse_bandwidth(res)
+            if bandwidth is not None:
+                store.add(self.name, {"rw": test[0], "bs": test[1]}, {"bandwidth_mbps": bandwidth})
             res = test[0] + " BS=" + test[1] + ": " + res
             print(res)
             file.write(res + '\n')
         
         file.close()   
         results = subprocess.run(
-            "rm Outputs/test*",
+            "rm " + self.root + "/Outputs/test*",
             shell=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
+
+    # "2097MB/s" or "1953MiB/s" -> MB/s
+    def parse_bandwidth(self, res):
+        match = re.match(r"(?:bw=)?([\d.]+)([kKMGT]?)(i?)B/s", res)
+        if match is None:
+            return None
+        base = 1024 if match.group(3) else 1000
+        scale = {"": 0, "k": 1, "K": 1, "M": 2, "G": 3, "T": 4}[match.group(2)]
+        return float(match.group(1)) * base ** scale / 1e6
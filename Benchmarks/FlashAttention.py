@@ -1,31 +1,43 @@
 import subprocess
 import os
+import re
+from Infra.results_store import ResultsStore
 
 class FlashAttention:
     def __init__(self, path:str, machine: str):
         
         self.name='FlashAttention'
         self.machine_name = machine
+        self.root = os.getcwd()
+        self.path = os.path.join(self.root, 'flash-attention')
 
         self.buffer = []
     
        
-    def run(self):
-        current = os.getcwd()
-        
-        path ='flash-attention'
-        isdir = os.path.isdir(path)
+    def download(self):
+        isdir = os.path.isdir(self.path)
         if not isdir:
-            results = subprocess.run('git clone https://github.com/Dao-AILab/flash-attention.git',shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        
-        build_path = os.path.join(current, 'flash-attention/benchmarks')
-        os.chdir(build_path)
+            results = subprocess.run('git clone https://github.com/Dao-AILab/flash-attention.git ' + self.path,shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def run(self):
+        self.download()
+        build_path = os.path.join(self.path, 'benchmarks')
         print("Running Flash Attention...")
-        results = subprocess.run('python3 benchmark_flash_attention.py | grep -A 2 "batch_size=2, seqlen=8192 ###"',shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        os.chdir(current)
-        file = open("Outputs/FlashAttention_" + self.machine_name + ".txt", "w")
+        results = subprocess.run('python3 benchmark_flash_attention.py | grep -A 2 "batch_size=2, seqlen=8192 ###"',shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=build_path)
+        file = open(os.path.join(self.root, "Outputs", "FlashAttention_" + self.machine_name + ".txt"), "w")
         res = results.stdout.decode('utf-8').split("\n")
         print(res[1])
         print(res[2])
         file.write(res[1] + "\n")
-        file.write(res[2]) 
+        file.write(res[2])
+        file.close()
+
+        # lines like "Flash2 fwd: 300.12 TFLOPs/s, bwd: 250.34 TFLOPs/s, fwd + bwd: 265.87 TFLOPs/s"
+        store = ResultsStore(os.path.join(self.root, "Outputs", "results.db"), self.machine_name)
+        for line in res[1:3]:
+            impl = line.split(" ", 1)[0]
+            metrics = {}
+            for name, value in re.findall(r"([\w+ ]+?): ([\d.]+) TFLOPs/s", line[len(impl):]):
+                metrics[name.strip().replace(" + ", "_").replace(" ", "_") + "_tflops"] = float(value)
+            if metrics:
+                store.add(self.name, {"impl": impl, "batch_size": 2, "seqlen": 8192}, metrics) 
@@ -5,26 +5,53 @@ import subprocess
 import datetime
 import time
 import csv 
+import threading
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
 import torch
 from matplotlib.ticker import FormatStrFormatter
 from Infra import tools
+from Infra import gemm_compare
+from Infra import gpus
+from Infra import telemetry
+from Infra.build_cache import BuildCache
+from Infra.point_index import PointIndex
+from Infra.results_store import ResultsStore
+from Infra.sampling import adaptive_sample
+from Benchmarks.GEMMWorker import GEMMWorker
 from prettytable import PrettyTable
 
 
+# a cublaslt_gemm/worker result line: M N K Batch Time(us) TFLOPS, all numeric
+def valid_result(fields) -> bool:
+    if len(fields) != 6:
+        return False
+    try:
+        [float(f) for f in fields]
+    except ValueError:
+        return False
+    return True
+
+
 class GEMMCublastLt:
     def __init__(self, path: str, machine: str, b: int = 1, i: int = 1000, w: int = 10000):
         self.name = "GEMMCublasLt"
         config = self.get_config(path)
         self.m, self.n, self.k, self.duration, self.datatype = self.config_conversion(config)
+        self.batched = config["inputs"].get("batched", False)
+        self.multi_gpu = config["inputs"].get("multi_gpu", False)
+        self.per_gpu = config["inputs"].get("per_gpu", False)
+        self.workers = {}
+        self.sampling = config["inputs"].get("sampling", {"mode": "grid"})
         self.b = b
         self.i = i
         self.w = w
-        self.bindir = ''
+        self.root = os.getcwd()
+        self.bindir = os.path.join(self.root, "bin")
         self.machine_name = machine
         self.buffer = []
+        self.results = ResultsStore(os.path.join(self.root, "Outputs", "results.db"), machine)
 
         # A100 does not support fp8
         if "A100" in machine:
@@ -65,7 +92,7 @@ class GEMMCublastLt:
         bindir = tools.create_dir("bin")
         self.bindir = bindir
 
-        path = "superbenchmark"
+        path = os.path.join(self.root, "superbenchmark")
         isdir = os.path.isdir(path)
         if not isdir:
             results = subprocess.run(
@@ -80,35 +107,33 @@ class GEMMCublastLt:
             )
             print(results.stderr.decode('utf-8'))
 
-        current = os.getcwd()
-
         build_path = os.path.join(
-            current,
+            self.root,
             "superbenchmark/superbench/benchmarks/micro_benchmarks/cublaslt_gemm",
         )
-        os.chdir(build_path)
+        cache = BuildCache(self.name, path, tools.gpu_arch(self.machine_name), ["cmake -S ./", "make"])
+        if cache.fetch(bindir):
+            return
 
         results = subprocess.run(
-            ["cmake", "-S", "./"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            ["cmake", "-S", "./"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=build_path
         )
         print(results.stderr.decode('utf-8'))
         results = subprocess.run(
-            ["make"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            ["make"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=build_path
         )
         print(results.stderr.decode('utf-8'))
         results = subprocess.run(
             ["mv", "cublaslt_gemm", bindir],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            cwd=build_path,
         )
-        os.chdir(current)
+        cache.store(bindir, ["cublaslt_gemm"])
 
-    # if no shmoo data found, run shmoo. if found, use existing shmoo data
+    # runs the points of the shmoo that are not in the result index yet, then plots
     def run_shmoo(self):
-        if os.path.isfile('Outputs/GEMMCublasLt_Shmoo_'+ self.machine_name +'_' +self.datatype+'.csv'):
-            self.buffer = self.parse_csv('Outputs/GEMMCublasLt_Shmoo_'+ self.machine_name +'_' +self.datatype+'.csv')
-        else:
-            self.buffer = self.run() 
+        self.buffer = self.run()
 
         self.plot_shmoo()   
 
@@ -117,109 +142,302 @@ class GEMMCublastLt:
 
         # res = subprocess.run(["sudo", "nvidia-smi", "-ac", "3201,1980"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         # print(res.stdout.decode('utf-8'))
-        cmd = (
-            f"nvidia-smi --query-gpu=timestamp,utilization.gpu,"
-            + f"power.draw,enforced.power.limit,clocks.current.sm,"
-            + f"clocks.current.memory,temperature.gpu --format=csv --id=0 -lms 100 -f Outputs/{self.name}_power.csv"
-        )
-
-
-        cmd = shlex.split(cmd)
-    
-        power_results = subprocess.Popen(
-            cmd,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            start_new_session=True,
+        with telemetry.TelemetrySampler(period=0.1) as sampler:
+            gemm_data = self.run_gemm()
+        sampler.to_csv(os.path.join(self.root, "Outputs", f"{self.name}_power.csv"))
+
+        # samples and GEMM results share the monotonic clock, GEMMs run on the first GPU
+        times, values = sampler.samples()
+        gpu = values[:, 0]
+        power_data = np.column_stack([
+            times,
+            gpu[:, sampler.field("power.draw")],
+            gpu[:, sampler.field("clocks.current.sm")],
+            gpu[:, sampler.field("enforced.power.limit")],
+            gpu[:, sampler.field("temperature.gpu")],
+        ]).tolist()
+        self.plot_power_data(gemm_data, power_data)
+
+
+    # starts a persistent GEMM worker when batched mode is enabled in config.json,
+    # returns None so callers fall back to one ./cublaslt_gemm process per shape
+    def start_worker(self, gpu=None):
+        if not self.batched:
+            return None
+        worker = GEMMWorker(self.datatype, self.i, self.w, gpu=gpu)
+        if not worker.start():
+            print("Falling back to cublaslt_gemm per shape")
+            return None
+        print(f"GPU {gpu}: GEMMs run in the torch worker (_scaled_mm/bmm), not cublaslt_gemm")
+        return worker
+
+    # what ran the GEMMs of a GPU: the torch worker, or cublaslt_gemm when batched
+    # mode is off or the worker failed. results of the two are recorded apart
+    def backend(self, worker) -> str:
+        return "torch" if worker is not None and worker.proc is not None else "cublaslt"
+
+    # runs a single GEMM and returns its output line
+    def gemm(self, worker, m, n, k, extra_args=None, gpu=None) -> str:
+        if worker is not None and worker.proc is not None:
+            log = worker.run(m, n, k, self.b)
+            if log is not None:
+                return log
+            print("GEMM worker exited, falling back to cublaslt_gemm")
+            worker.stop()
+        results = subprocess.run(
+            [
+                os.path.join(self.bindir, "cublaslt_gemm"),
+                "-m",
+                str(m),
+                "-n",
+                str(n),
+                "-k",
+                str(k),
+                "-b",
+                str(self.b),
+                "-i",
+                str(self.i),
+                "-w",
+                str(self.w),
+                "-t",
+                self.datatype,
+            ] + (extra_args or []),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=None if gpu is None else gpus.pinned_env(gpu),
         )
+        return results.stdout.decode("utf-8")
+
+    # runs the shapes on all visible GPUs at once (only the first one if multi_gpu is
+    # off in config.json), one worker per GPU. shapes are split by estimated FLOPs so
+    # every GPU gets about the same amount of work. on_result(shape, gpu, log, backend)
+    # is called as soon as a shape finishes. returns (gpu, log, backend) for every
+    # shape, in shape order
+    def run_sharded(self, shapes, extra_args=None, on_result=None) -> list:
+        devices = gpus.visible_gpus()
+        if not self.multi_gpu:
+            devices = devices[:1]
+        shards = gpus.shard_by_cost(list(range(len(shapes))), lambda i: 2 * shapes[i][0] * shapes[i][1] * shapes[i][2] * self.b, len(devices))
+        results = [None] * len(shapes)
+
+        def run_shard(gpu, shard):
+            if gpu not in self.workers:
+                self.workers[gpu] = self.start_worker(gpu)
+            for i in shard:
+                m, n, k = shapes[i]
+                log = self.gemm(self.workers[gpu], m, n, k, extra_args, gpu)
+                # a worker that failed is stopped before the fallback, so this is per shape
+                backend = self.backend(self.workers[gpu])
+                results[i] = (gpu, log, backend)
+                if on_result is not None:
+                    on_result(shapes[i], gpu, log, backend)
+
+        threads = [threading.Thread(target=run_shard, args=(gpu, shard)) for gpu, shard in zip(devices, shards) if shard]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    # runs every shape on every visible GPU at the same time, one worker per GPU.
+    # returns (gpu, log, backend) for every GPU and shape
+    def run_everywhere(self, shapes, extra_args=None) -> list:
+        def run_gpu(gpu):
+            if gpu not in self.workers:
+                self.workers[gpu] = self.start_worker(gpu)
+            logs = []
+            for m, n, k in shapes:
+                log = self.gemm(self.workers[gpu], m, n, k, extra_args, gpu)
+                logs.append((log, self.backend(self.workers[gpu])))
+            return logs
+
+        logs = gpus.fan_out(run_gpu)
+        return [(gpu, log, backend) for gpu, gpu_logs in logs.items() if gpu_logs for log, backend in gpu_logs]
+
+    # node-level spread of [M, N, K, Batch, Time(us), TFLOPS, GPU, Backend] rows that ran on
+    # every GPU: min/median/max TFLOPS per shape, and per GPU the geometric mean of
+    # its TFLOPS over the shape medians, which flags GPUs that are slow throughout
+    def report_per_gpu(self, buffer):
+        shapes = {}
+        for row in buffer:
+            if valid_result(row[:6]):
+                shapes.setdefault((int(row[0]), int(row[1]), int(row[2])), {})[row[6]] = float(row[5])
+        table1 = PrettyTable()
+        table1.title = "TFLOPS per GPU"
+        table1.field_names = ["M", "N", "K", "Min", "Median", "Max", "Slow GPUs"]
+        ratios = {}
+        for (m, n, k), tflops in shapes.items():
+            stats = gpus.spread(tflops)
+            table1.add_row([m, n, k, stats["min"], stats["median"], stats["max"], ", ".join(stats["outliers"])])
+            for gpu, val in tflops.items():
+                if stats["median"] and val > 0:
+                    ratios.setdefault(gpu, []).append(np.log(val / stats["median"]))
+        print(table1)
 
-        gemm_data = self.run_gemm()
-
-        cmd = "pkill -9 nvidia-smi"
-        cmd = shlex.split(cmd)
-        subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        power_results.communicate()
-
-        self.plot_power_data(gemm_data, self.parse_power_data("GEMMCublasLt_power.csv"))
-
+        scores = {gpu: float(np.exp(np.mean(r))) for gpu, r in ratios.items()}
+        slow = gpus.spread(scores)["outliers"]
+        failed = [gpu for gpu in gpus.visible_gpus() if gpu not in scores]
+        table2 = PrettyTable()
+        table2.field_names = ["GPU", "TFLOPS vs median GPU", "Slow"]
+        with open(os.path.join(self.root, 'Outputs', 'GEMMCublasLt_per_gpu_' + self.machine_name + '_' + self.datatype + '.csv'), 'w') as csvFile:
+            writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(["GPU", "TFLOPS vs median GPU", "Slow"])
+            for gpu, score in scores.items():
+                writer.writerow([gpu, round(score, 4), gpu in slow])
+                table2.add_row([gpu, round(score, 4), "yes" if gpu in slow else ""])
+            for gpu in failed:
+                writer.writerow([gpu, None, "failed"])
+                table2.add_row([gpu, None, "failed"])
+        print(table2)
+
+    def stop_workers(self):
+        for worker in self.workers.values():
+            if worker is not None:
+                worker.stop()
+        self.workers = {}
+
+    # (backend, hash) of the executables whose results are accepted for a point, preferred
+    # first. batched mode falls back to cublaslt_gemm, so its results are accepted too
+    def executor_hashes(self) -> list:
+        binary_hash = tools.file_hash(os.path.join(self.bindir, "cublaslt_gemm"))
+        if self.batched:
+            return [("torch", tools.file_hash(GEMMWorker.script)), ("cublaslt", binary_hash)]
+        return [("cublaslt", binary_hash)]
+
+    def point_key(self, m, n, k, fingerprint, binary_hash) -> dict:
+        return {
+            "m": m,
+            "n": n,
+            "k": k,
+            "batch": self.b,
+            "datatype": self.datatype,
+            "iterations": self.i,
+            "warmup": self.w,
+            "machine": fingerprint,
+            "binary": binary_hash,
+        }
+
+    # the [M, N, K, Batch, Time(us), TFLOPS, GPU, Backend] row of a point in the index.
+    # the backend follows from the executable the row was measured with
+    def lookup(self, index, m, n, k, fingerprint, hashes):
+        for backend, binary_hash in hashes:
+            row = index.get(self.point_key(m, n, k, fingerprint, binary_hash))
+            # rows stored before results were checked may be broken, measure those again
+            if row is not None and len(row) >= 7 and valid_result(row[:6]):
+                return row[:7] + [backend]
+        return None
+
+    # measures the given (m, n, k) points, skipping the ones already in the index.
+    # every finished point is flushed to the index right away
+    def measure(self, points) -> dict:
+        results = {}
+        missing = []
+        for p in points:
+            results[p] = self.lookup(self.index, *p, self.fingerprint, self.hashes)
+            if results[p] is None:
+                missing.append(p)
+        if not missing:
+            return results
+
+        binary_hash = tools.file_hash(os.path.join(self.bindir, "cublaslt_gemm"))
+        worker_hash = tools.file_hash(GEMMWorker.script)
+
+        def on_result(shape, gpu, log, backend):
+            # failed, empty or garbage output (a crashed or missing binary) leaves the
+            # point unmeasured
+            if not valid_result(log.split()):
+                return
+            row = log.split() + [gpu, backend]
+            results[shape] = row
+            self.index.add(self.point_key(*shape, self.fingerprint, worker_hash if backend == "torch" else binary_hash), row)
+            self.record(row, "shmoo")
+
+        self.run_sharded(missing, ["-r", "1", "-s", "-1", "-e", "1"], on_result)
+        return results
+
+    # the shape the M, N and K shmoos cross at: each shmoo sweeps one dim and
+    # keeps the other two at the end of their range
+    def fixed_point(self) -> dict:
+        return {"m": self.m[-1], "n": self.n[-1], "k": self.k[-1]}
+
+    def grid_points(self) -> list:
+        fixed = self.fixed_point()
+        points = []
+        for i in range(len(self.m)):
+            for j in range(len(self.n)):
+                for t in range(len(self.k)):
+                    a = self.m[i] == fixed["m"]
+                    b = self.n[j] == fixed["n"]
+                    c = self.k[t] == fixed["k"]
+
+                    if (a and b) or (b and c) or (a and c):
+                        points.append((self.m[i], self.n[j], self.k[t]))
+        return points
+
+    # bisects each of the M, N and K shmoos only where TFLOPS changes by more than
+    # the configured tolerance, see Infra/sampling.py
+    def adaptive_points(self) -> list:
+        fixed = self.fixed_point()
+        points = []
+        for axis, dims in enumerate([self.m, self.n, self.k]):
+            def shape(x):
+                p = [fixed["m"], fixed["n"], fixed["k"]]
+                p[axis] = x
+                return tuple(p)
+
+            def measure_axis(xs):
+                rows = self.measure([shape(x) for x in xs])
+                return {x: None if rows[shape(x)] is None else float(rows[shape(x)][5]) for x in xs}
+
+            values = adaptive_sample(
+                measure_axis,
+                dims[0],
+                dims[-1],
+                self.sampling.get("min_step", 16),
+                self.sampling.get("tolerance", 0.02),
+                self.sampling.get("budget", 64),
+                self.sampling.get("coarse_points", 17),
+            )
+            points += [shape(x) for x in sorted(values) if shape(x) not in points]
+        return points
 
     # run GEMM Sweep, start and end dims can be altered in config.json
+    # a restarted sweep only runs the points that are missing from the index
     # results saved in Outputs folder
     def run(self) -> list:
         print("Running GEMM Sweep...")
-        current = os.getcwd()
-        os.chdir(self.bindir)
-
-        end_interval = str(self.m[-1])
+        self.index = PointIndex(os.path.join(self.root, "Outputs", "GEMMCublasLt_Shmoo_index.jsonl"))
+        self.fingerprint = tools.machine_fingerprint(self.machine_name)
+        self.hashes = self.executor_hashes()
+        self.workers = {}
 
-        tot_time = 0
-        buffer = []
-        with open('../Outputs/GEMMCublasLt_Shmoo_'+ self.machine_name +'_' +self.datatype+'.csv', 'w') as csvFile:
+        if self.sampling.get("mode", "grid") == "adaptive":
+            points = self.adaptive_points()
+        else:
+            points = self.grid_points()
+        results = self.measure(points)
+        self.stop_workers()
+        print(f"Measured {len(points)} points")
+
+        # the CSV is rebuilt from the index and only replaces the previous one once complete
+        buffer = [results[p] for p in points if results[p] is not None]
+        filename = os.path.join(self.root, "Outputs", "GEMMCublasLt_Shmoo_" + self.machine_name + "_" + self.datatype + ".csv")
+        with open(filename + ".tmp", 'w') as csvFile:
             writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["M", "N", "K", "Batch", "Time(us)", "TFLOPS"])
-            start = torch.cuda.Event(enable_timing=True)
-            end = torch.cuda.Event(enable_timing=True)
-            for i in range(len(self.m)):
-                for j in range(len(self.n)):
-                    for t in range(len(self.k)):
-                        a = str(self.m[i]) == end_interval
-                        b = str(self.n[j]) == end_interval 
-                        c = str(self.k[t]) == end_interval
-
-                        if (a and b) or (b and c) or (a and c):
-                            start.record()
-                            results = subprocess.run(
-                                [
-                                    "./cublaslt_gemm",
-                                    "-m",
-                                    str(self.m[i]),
-                                    "-n",
-                                    str(self.n[j]),
-                                    "-k",
-                                    str(self.k[t]),
-                                    "-b",
-                                    str(self.b),
-                                    "-i",
-                                    str(self.i),
-                                    "-w",
-                                    str(self.w),
-                                    "-t",
-                                    self.datatype,
-                                    "-r",
-                                    str(1),
-                                    "-s",
-                                    str(-1),
-                                    "-e",
-                                    str(1),
-                                ],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                            )
-
-                            end.record()
-                            torch.cuda.synchronize()
-                            log = results.stdout.decode("utf-8")
-                            # print("m: ", self.m[i] ," n: ", self.n[j], " k: ", self.k[t])
-                            # handle errors and failed cases
-                            if log.find("failed") != -1 or log.find("error") != -1:
-                                continue
-                            buffer.append(log.split())
-                            writer.writerow(log.split())
-                            tot_time = tot_time + start.elapsed_time(end)
-        os.chdir(current)
+            writer.writerow(["M", "N", "K", "Batch", "Time(us)", "TFLOPS", "GPU", "Backend"])
+            for row in buffer:
+                writer.writerow(row)
+        os.replace(filename + ".tmp", filename)
         return buffer
     
 
     def run_gemm(self):
-            current = os.getcwd()
-            os.chdir(self.bindir)
-            
             t_end = time.time() + self.duration
             buffer = []
             while time.time() < t_end:
                 results = subprocess.run(
                     [
-                        "./cublaslt_gemm",
+                        os.path.join(self.bindir, "cublaslt_gemm"),
                         "-m",
                         str(8192),
                         "-n",
@@ -239,17 +457,26 @@ class GEMMCublastLt:
                     stderr=subprocess.PIPE,
                 )
                 log = results.stdout.decode('utf-8').split()
-                curr_time = self.parse_timestamp(str(datetime.datetime.now()).split(' ')[1])
-                log.append(curr_time)
+                log.append(time.monotonic())
                 buffer.append(log)
-            os.chdir(current)
             return buffer
     
 
+    # adds one [M, N, K, Batch, Time(us), TFLOPS, GPU, Backend] row to the results store
+    def record(self, row, mode):
+        if len(row) < 8:
+            return
+        try:
+            params = {"mode": mode, "datatype": self.datatype, "m": int(row[0]), "n": int(row[1]), "k": int(row[2]), "batch": int(row[3]),
+                      "gpu": str(row[6]), "backend": row[7]}
+            metrics = {"time_us": float(row[4]), "tflops": float(row[5])}
+        except ValueError:
+            return
+        self.results.add(self.name, params, metrics)
+
     # run GEMM with predetermined matrix sizes that are commonly used in transformers
     def run_model_sizes(self):
         print("Running CublasLt...")
-        current = os.getcwd()
         if self.datatype == "fp8e4m3":
             m_dims = [1024, 2048, 4096, 8192, 16384, 32768, 1024, 6144, 802816, 802816] 
             n_dims = [1024, 2048, 4096, 8192, 16384, 32768, 2145, 12288, 192, 192]
@@ -259,82 +486,58 @@ class GEMMCublastLt:
             n_dims = [1024, 2048, 4096, 8192, 16384, 2145, 12288, 192, 192]
             k_dims = [1024, 2048, 4096, 8192, 16384, 1024, 12288, 192, 768]  
 
-        os.chdir(self.bindir)
         buffer = []
-          
-        for i in range(len(m_dims)):
-            results = subprocess.run(
-                [
-                    "./cublaslt_gemm",
-                    "-m",
-                    str(m_dims[i]),
-                    "-n",
-                    str(n_dims[i]),
-                    "-k",
-                    str(k_dims[i]),
-                    "-b",
-                    str(self.b),
-                    "-i",
-                    str(self.i),
-                    "-w",
-                    str(self.w),
-                    "-t",
-                    self.datatype,
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
-            log = results.stdout.decode('utf-8').split()
-            buffer.append(log)
+        self.workers = {}
+
+        # per_gpu runs every shape on every GPU instead of spreading them over the GPUs
+        shapes = list(zip(m_dims, n_dims, k_dims))
+        runs = self.run_everywhere(shapes) if self.per_gpu else self.run_sharded(shapes)
+        # both return the shapes in order, once per GPU for run_everywhere
+        failed = []
+        for i, run in enumerate(runs):
+            gpu, log, backend = run if run is not None else (None, "", None)
+            if not valid_result(log.split()):
+                failed.append(list(shapes[i % len(shapes)]) + [gpu, log.strip()[:80] or "no output"])
+                continue
+            row = log.split() + [gpu, backend]
+            buffer.append(row)
+            self.record(row, "model_sizes")
+        self.stop_workers()
+        if self.per_gpu:
+            self.report_per_gpu(buffer)
 
         table1 = PrettyTable()  
 
-        with open('../Outputs/GEMMCublasLt_Performance_' + self.machine_name + '_' + self.datatype+'.csv', 'w') as csvFile:
+        with open(os.path.join(self.root, 'Outputs', 'GEMMCublasLt_Performance_' + self.machine_name + '_' + self.datatype+'.csv'), 'w') as csvFile:
             writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            writer.writerow(["M", "N", "K", "Batch", "Time(us)", "TFLOPS"])
-            table1.field_names = ["M", "N", "K", "Batch Size", "Time(us)", "TFLOPS"]
+            writer.writerow(["M", "N", "K", "Batch", "Time(us)", "TFLOPS", "GPU", "Backend"])
+            table1.field_names = ["M", "N", "K", "Batch Size", "Time(us)", "TFLOPS", "GPU", "Backend"]
             for item in buffer:
                 writer.writerow(item)
                 table1.add_row(item)
 
         print(table1)
-        os.chdir(current)
+        if failed:
+            table2 = PrettyTable()
+            table2.title = "Failed GEMMs"
+            table2.field_names = ["M", "N", "K", "GPU", "Output"]
+            for item in failed:
+                table2.add_row(item)
+            print(table2)
 
 
+    # rows of [time (s), power, sm clock, power limit, temperature] of the first GPU
+    # in an Outputs/<filename> capture
     def parse_power_data(self, filename):
-        power_data  = []
-        current = os.getcwd()
-        os.chdir(os.path.join(
-            current,
-            "Outputs",
-        ))
-        with open(filename, mode='r') as csvfile:
-            line_num = 0
-            for line in csvfile:
-                
-                if line_num > 0:
-                    temp_line = line.split(',')
-                    res = []
-                    if len(temp_line) < 7:
-                        continue
-                    res.append(self.parse_timestamp(temp_line[0].split()[1]))
-                    res.append(float(temp_line[2].split()[0]))
-                    res.append(float(temp_line[4].split()[0]))
-                    res.append(float(temp_line[3].split()[0]))
-                    res.append(float(temp_line[6].split()[0]))
-                    power_data.append(res)
-                line_num += 1
-        os.chdir(current)
-        return power_data
-
-
-    def parse_timestamp(self, timestamp):
-        times = timestamp.split(":")
-        total_time = 0
-        total_time += int(times[0]) * 60 * 60
-        total_time += int(times[1]) * 60
-        total_time += float(times[2])
-        return total_time
+        data = telemetry.load_power_csv(os.path.join(self.root, "Outputs", filename))
+        gpu = data[min(data)]
+        return np.column_stack([
+            gpu["timestamp"],
+            gpu["power.draw"],
+            gpu["clocks.current.sm"],
+            gpu["enforced.power.limit"],
+            gpu["temperature.gpu"],
+        ]).tolist()
 
     def plot_power_data(self, gemm_data, power_data):
         power_limit = power_data[0][3]
@@ -377,7 +580,7 @@ class GEMMCublastLt:
         ax4.grid(True)
         
         fig.suptitle("8K GEMM Measurements " + self.machine_name, fontsize=28)
-        plt.savefig("Outputs/GEMMCublasLt_Power_"+self.machine_name + "_" +self.datatype+".png", format="png", bbox_inches="tight")
+        plt.savefig(self.root + "/Outputs/GEMMCublasLt_Power_"+self.machine_name + "_" +self.datatype+".png", format="png", bbox_inches="tight")
         plt.close()
 
  
@@ -395,67 +598,21 @@ class GEMMCublastLt:
                 
 
     def plot_shmoo(self):
-        arr = np.array(self.buffer)
-
-
-        # splitting up the data into m, n, k sweeps
-        m_arr = []
-        n_arr = []
-        k_arr = []
-
-        
-        # size of the other 2 dims that are constant
-        dim_size = '4096'
-        for i in range(len(arr)):
-            if arr[i][1] == dim_size and arr[i][2] == dim_size:
-                m_arr.append(arr[i])
-            if arr[i][0] == dim_size and arr[i][2] == dim_size:
-                n_arr.append(arr[i])
-            if arr[i][0] == dim_size and arr[i][1] == dim_size:
-                k_arr.append(arr[i])
-
-        
-        m_arr = np.array(m_arr)
-        n_arr = np.array(n_arr)
-        k_arr = np.array(k_arr)
-
-        # plot M Shmoo
-        x = m_arr[:, 0].astype(int)
-        y = m_arr[:, 5].astype(float)
-
-       
-        fig, ax = plt.subplots()
-        ax.plot(x, y)
-        ax.grid(True)
-        ax.set_title("4096, 4096 NT GEMM M Shmoo")
-        ax.yaxis.set_major_formatter(FormatStrFormatter("%.0f"))
-        plt.xlabel("M Dim")
-        plt.ylabel("TFLOPS")
-        plt.savefig("Outputs/GEMMCublasLt M Shmoo_" + self.machine_name + "_" + self.datatype + ".png", bbox_inches="tight")
-        plt.close(fig)
-        
-        # plot N Shmoo
-        x = n_arr[:, 1].astype(int)
-        y = n_arr[:, 5].astype(float)
-        fig, ax = plt.subplots()
-        ax.plot(x, y)
-        ax.grid(True)
-        ax.set_title("4096, 4096 NT GEMM N Shmoo")
-        ax.yaxis.set_major_formatter(FormatStrFormatter("%.0f"))
-        plt.xlabel("N Dim")
-        plt.ylabel("TFLOPS")
-        plt.savefig("Outputs/GEMMCublasLt N Shmoo_" + self.machine_name + "_" + self.datatype + ".png", bbox_inches="tight")
-        plt.close(fig)
-
-        # plot K shmoo
-        x = k_arr[:, 2].astype(int)
-        y = k_arr[:, 5].astype(float)
-        fig, ax = plt.subplots()
-        ax.plot(x, y)
-        ax.grid(True)
-        ax.set_title("4096, 4096 NT GEMM K Shmoo")
-        ax.yaxis.set_major_formatter(FormatStrFormatter("%.0f"))
-        plt.xlabel("K Dim")
-        plt.ylabel("TFLOPS")
-        plt.savefig("Outputs/GEMMCublasLt K Shmoo_" + self.machine_name + "_" + self.datatype + ".png", bbox_inches="tight")
-        plt.close()
+        # the GPU column is not needed here and missing from older results
+        arr = gemm_compare.from_rows(self.buffer)
+
+        # sizes of the other 2 dims that are constant
+        fixed = self.fixed_point()
+        for axis in ["m", "n", "k"]:
+            # sorted along axis, adaptive sampling gives non-uniform, unordered values
+            s = gemm_compare.shmoo_slice(arr, axis, fixed)
+            fig, ax = plt.subplots()
+            ax.plot(s[axis], s["tflops"], marker=".")
+            ax.grid(True)
+            dims = ", ".join(f"{d.upper()}={fixed[d]}" for d in ("m", "n", "k") if d != axis)
+            ax.set_title(dims + " NT GEMM " + axis.upper() + " Shmoo")
+            ax.yaxis.set_major_formatter(FormatStrFormatter("%.0f"))
+            plt.xlabel(axis.upper() + " Dim")
+            plt.ylabel("TFLOPS")
+            plt.savefig(self.root + "/Outputs/GEMMCublasLt " + axis.upper() + " Shmoo_" + self.machine_name + "_" + self.datatype + ".png", bbox_inches="tight")
+            plt.close(fig)
@@ -0,0 +1,161 @@
+import argparse
+import os
+import subprocess
+import sys
+
+
+# Long-lived GEMM worker. Instead of launching ./cublaslt_gemm once per shape,
+# one worker process is started per GPU and fed shapes over stdin, one
+# "m n k batch" line per shape. It answers with one "m n k batch time_us tflops"
+# line per shape (same layout as cublaslt_gemm) or "m n k batch failed <reason>".
+# Process startup, CUDA context creation and the full warmup are only paid once;
+# later shapes only run a short warmup since clocks are already ramped.
+class GEMMWorker:
+    script = os.path.abspath(__file__)
+
+    def __init__(self, datatype: str, i: int, w: int, shape_warmup: int = 100, gpu=None):
+        self.datatype = datatype
+        self.i = i
+        self.w = w
+        self.shape_warmup = min(shape_warmup, w)
+        self.gpu = gpu
+        self.proc = None
+
+    def start(self) -> bool:
+        env = os.environ.copy()
+        if self.gpu is not None:
+            env["CUDA_VISIBLE_DEVICES"] = str(self.gpu)
+        self.proc = subprocess.Popen(
+            [
+                sys.executable,
+                self.script,
+                "-t",
+                self.datatype,
+                "-i",
+                str(self.i),
+                "-w",
+                str(self.w),
+                "-W",
+                str(self.shape_warmup),
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,
+            env=env,
+            text=True,
+            bufsize=1,
+        )
+        line = self.proc.stdout.readline().strip()
+        if line != "ready":
+            print("GEMM worker failed to start:", line)
+            self.stop()
+            return False
+        return True
+
+    # returns the result line for one shape, or None if the worker died
+    def run(self, m: int, n: int, k: int, b: int = 1):
+        if self.proc is None or self.proc.poll() is not None:
+            return None
+        try:
+            self.proc.stdin.write(f"{m} {n} {k} {b}\n")
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        except (BrokenPipeError, OSError):
+            return None
+        if not line:
+            return None
+        return line.strip()
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def make_operands(torch, datatype, m, n, k, b):
+    # NT GEMM, same layout as cublaslt_gemm
+    if datatype == "fp8e4m3":
+        if b != 1:
+            raise ValueError("batched fp8 GEMM not supported")
+        a = torch.randn(m, k, device="cuda").to(torch.float8_e4m3fn)
+        bt = torch.randn(n, k, device="cuda").to(torch.float8_e4m3fn).t()
+        scale = torch.tensor(1.0, device="cuda")
+        return lambda: torch._scaled_mm(a, bt, scale_a=scale, scale_b=scale, out_dtype=torch.bfloat16)
+
+    dtypes = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32, "tf32": torch.float32}
+    if datatype not in dtypes:
+        raise ValueError("unknown datatype " + datatype)
+    torch.backends.cuda.matmul.allow_tf32 = datatype == "tf32"
+    a = torch.randn(b, m, k, device="cuda", dtype=dtypes[datatype])
+    bt = torch.randn(b, n, k, device="cuda", dtype=dtypes[datatype]).transpose(1, 2)
+    return lambda: torch.bmm(a, bt)
+
+
+def time_gemm(torch, fn, iterations):
+    start = torch.cuda.Event(enable_timing=True)
+    end = torch.cuda.Event(enable_timing=True)
+    start.record()
+    for _ in range(iterations):
+        fn()
+    end.record()
+    end.synchronize()
+    return start.elapsed_time(end) * 1000 / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", dest="datatype", default="fp8e4m3")
+    parser.add_argument("-i", dest="iterations", type=int, default=1000)
+    parser.add_argument("-w", dest="warmup", type=int, default=10000)
+    parser.add_argument("-W", dest="shape_warmup", type=int, default=100)
+    args = parser.parse_args()
+
+    try:
+        import torch
+        if not torch.cuda.is_available():
+            raise RuntimeError("no CUDA device")
+        make_operands(torch, args.datatype, 16, 16, 16, 1)()
+        torch.cuda.synchronize()
+    except Exception as e:
+        print("unsupported", str(e).replace("\n", " "), flush=True)
+        return
+
+    print("ready", flush=True)
+    warmup = args.warmup
+    for line in sys.stdin:
+        # every line gets an answer, the parent waits for one
+        try:
+            m, n, k, b = (int(x) for x in line.split())
+        except ValueError:
+            print(line.strip() or "empty", "failed", "expected m n k batch", flush=True)
+            continue
+        try:
+            fn = make_operands(torch, args.datatype, m, n, k, b)
+            for _ in range(warmup):
+                fn()
+            time_us = time_gemm(torch, fn, args.iterations)
+            tflops = 2 * m * n * k * b / time_us / 1e6
+            print(m, n, k, b, f"{time_us:.2f}", f"{tflops:.2f}", flush=True)
+            # the full warmup is only needed once, neighbouring shapes reuse the warm context
+            warmup = args.shape_warmup
+        except Exception as e:
+            print(m, n, k, b, "failed", str(e).replace("\n", " "), flush=True)
+
+
+if __name__ == "__main__":
+    main()
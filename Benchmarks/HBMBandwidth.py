@@ -5,17 +5,34 @@ import subprocess
 import time
 import csv
 from prettytable import PrettyTable
+import matplotlib.pyplot as plt
 import numpy as np
-import torch
+from Infra import gpus
+from Infra import tools
+from Infra.build_cache import BuildCache
+from Infra.results_store import ResultsStore
+
+# BabelStream kernels, in the order the results are reported
+KERNELS = ["Copy", "Mul", "Add", "Triad", "Dot"]
+# BabelStream allocates three arrays of doubles
+ARRAYS = 3
+ELEMENT_BYTES = 8
+
 
 class HBMBandwidth:
     def __init__(self, path: str, machine: str):
         self.name = "HBMBandwidth"
         self.machine_name = machine
+        self.root = os.getcwd()
+        self.build_path = os.path.join(self.root, "BabelStream", "build")
         config = self.get_config(path)
         self.num_runs, self.interval = self.config_conversion(config)
+        self.per_gpu = config["inputs"].get("per_gpu", False)
+        self.size_sweep = config["inputs"].get("size_sweep", {})
+        self.sweep = {}
 
         self.buffer = []
+        self.gpu_buffers = {}
 
     def get_config(self, path: str):
         file = open(path)
@@ -33,9 +50,7 @@ class HBMBandwidth:
         return self.parse_json(config)
 
     def build(self):
-        current = os.getcwd()
-
-        path = "BabelStream"
+        path = os.path.join(self.root, "BabelStream")
         isdir = os.path.isdir(path)
         if not isdir:
             results = subprocess.run(
@@ -44,110 +59,240 @@ class HBMBandwidth:
                 stderr=subprocess.PIPE,
             )
 
-        build_path = os.path.join(current, "BabelStream")
-        os.chdir(build_path)
+        babelstream_build_path = self.build_path
 
-        babelstream_build_path = os.path.join(build_path, "build")
-
-        arch ="sm_90"
-        if "A100" in self.machine_name:
-            arch = "sm_80"
-            
+        arch = tools.gpu_arch(self.machine_name)
+        flags = [
+            "-DMODEL=cuda",
+            "-DCUDA_ARCH=" + arch,
+            "-DCMAKE_CUDA_COMPILER=/usr/local/cuda/bin/nvcc",
+        ]
+        cache = BuildCache(self.name, path, arch, flags)
         if not os.path.isdir(babelstream_build_path):
             os.mkdir(babelstream_build_path)
-            os.chdir(babelstream_build_path)
+        if not cache.fetch(babelstream_build_path):
             results = subprocess.run(
-                [
-                    "cmake",
-                    "../",
-                    "-DMODEL=cuda",
-                    "-DCUDA_ARCH=" + arch,
-                    "-DCMAKE_CUDA_COMPILER=/usr/local/cuda/bin/nvcc",
-                ],
+                ["cmake", "../"] + flags,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
+                cwd=babelstream_build_path,
             )
             print(results.stderr.decode('utf-8')) 
             results = subprocess.run(
-                ["make"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                ["make"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=babelstream_build_path
             )
             print(results.stderr.decode('utf-8')) 
-        else:
-            os.chdir(babelstream_build_path)
+            cache.store(babelstream_build_path, ["cuda-stream"])
 
 
-    def run(self):
-        current = os.getcwd()
-        print("Running HBM Bandwidth...")
+    # {kernel: MBytes/sec} of the result lines of a BabelStream run, found by kernel
+    # name so extra header lines (device, driver, memory mode) do not matter
+    def parse_kernels(self, output):
+        kernels = {}
+        for line in output.split("\n"):
+            fields = line.split()
+            if len(fields) >= 2 and fields[0] in KERNELS:
+                try:
+                    kernels[fields[0]] = float(fields[1])
+                except ValueError:
+                    continue
+        return kernels
 
-        start = torch.cuda.Event(enable_timing=True)
-        end = torch.cuda.Event(enable_timing=True)
-
-        runs_executed = 0
+    # num_runs runs of cuda-stream, on the given GPU only if one is given
+    def run_gpu(self, gpu=None):
         buffer = []
-        while runs_executed < self.num_runs:
-            start.record()
+        for _ in range(self.num_runs):
             results = subprocess.run(
-                ["./cuda-stream"], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                [os.path.join(self.build_path, "cuda-stream")], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                env=None if gpu is None else gpus.pinned_env(gpu)
             )
-
-            end.record()
-            torch.cuda.synchronize()
-            log = results.stdout.decode("utf-8").strip().split("\n")[14:19]
-            for i in range(len(log)):
-                temp = log[i].split()
-                log[i] = [temp[0], temp[1]]
-            buffer.append(log)
-
-            runs_executed += 1
+            buffer.append(self.parse_kernels(results.stdout.decode("utf-8")))
             time.sleep(int(self.interval))
+        return buffer
 
-    
-        self.buffer = buffer
-        os.chdir(current)
+    # with per_gpu every GPU runs at the same time, the overall results are those of
+    # the first GPU that produced any
+    def run(self):
+        print("Running HBM Bandwidth...")
+
+        if self.per_gpu:
+            devices = gpus.visible_gpus()
+            self.gpu_buffers = gpus.fan_out(self.run_gpu, devices)
+            ran = [gpu for gpu in devices if not self.failed_runs(self.gpu_buffers[gpu])]
+            failed = [gpu for gpu in devices if gpu not in ran]
+            if failed:
+                print(f"HBM Bandwidth failed on GPU {', '.join(failed)}")
+            self.buffer = self.gpu_buffers[ran[0]] if ran else []
+            self.save_per_gpu()
+        else:
+            self.buffer = self.run_gpu()
         self.save_results()
 
+    # True if buffer (the runs of one GPU) has no result at all
+    def failed_runs(self, buffer):
+        return not buffer or not any(buffer)
+
+    # mean bandwidth (TB/s) of every operation on every GPU, with the node's min,
+    # median and max and the GPUs that are slow outliers
+    def save_per_gpu(self):
+        operations = KERNELS
+        means = {}
+        failed = []
+        for gpu, buffer in self.gpu_buffers.items():
+            if self.failed_runs(buffer):
+                failed.append(gpu)
+            else:
+                means[gpu] = [self.mean_tbps(buffer, op) for op in operations]
+
+        stats = [gpus.spread({gpu: row[i] for gpu, row in means.items()}) for i in range(len(operations))]
+        table1 = PrettyTable()
+        table1.title = "HBM bandwidth per GPU (TB/s)"
+        table1.field_names = ["Operation", "Min", "Median", "Max", "Slow GPUs"]
+        for op, stat in zip(operations, stats):
+            table1.add_row([op, stat["min"], stat["median"], stat["max"], ", ".join(stat["outliers"])])
+
+        results = ResultsStore(os.path.join(self.root, 'Outputs', 'results.db'), self.machine_name)
+        with open(os.path.join(self.root, 'Outputs', 'HBMBandwidth_per_gpu_' + self.machine_name + '.csv'), 'w') as csvFile:
+            writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(["GPU"] + [op + " (TB/s)" for op in operations] + ["Slow in"])
+            for gpu, row in means.items():
+                writer.writerow([gpu] + row + [" ".join(op for op, stat in zip(operations, stats) if gpu in stat["outliers"])])
+                for op, val in zip(operations, row):
+                    if val is not None:
+                        results.add(self.name + "_per_gpu", {"operation": op, "gpu": gpu, "runs": self.num_runs}, {"mean_tbps": val})
+            for gpu in failed:
+                writer.writerow([gpu] + [None] * len(operations) + ["failed"])
+        print(table1)
+        if failed:
+            print(f"No HBM results from GPU {', '.join(failed)}")
+
+    # mean TB/s of kernel over the runs in buffer that reported it, None if none did
+    def mean_tbps(self, buffer, kernel):
+        values = [log[kernel] for log in buffer if kernel in log]
+        return statistics.mean(values) / 1000000 if values else None
+
     def process_stats(self, results):
         mean = statistics.mean(results)/1000000
         maximum = max(results)/1000000
         minimum = min(results)/1000000
-        stdev = statistics.stdev(results)/1000
+        stdev = statistics.stdev(results)/1000 if len(results) > 1 else 0.0
         return [minimum, maximum, mean, stdev]
     
 
+    # min/max/mean/stdev of every kernel over the runs, taken by kernel name so a
+    # kernel missing from some runs does not shift the others
     def save_results(self):
-        copy = ["Copy"]
-        mul = ["Mul"]
-        add = ["Add"]
-        triad = ["Triad"]
-        dot = ["Dot"]
-        for log in self.buffer:
-            copy.append(float(log[0][1]))
-            mul.append(float(log[1][1]))
-            add.append(float(log[2][1]))
-            triad.append(float(log[3][1]))
-            dot.append(float(log[4][1]))
-
-        copy[1:] = self.process_stats(copy[1:])
-        mul[1:] = self.process_stats(mul[1:])
-        add[1:] = self.process_stats(add[1:])
-        triad[1:] = self.process_stats(triad[1:])
-        dot[1:] = self.process_stats(dot[1:])
-        
+        rows = []
+        for kernel in KERNELS:
+            values = [log[kernel] for log in self.buffer if kernel in log]
+            if values:
+                rows.append([kernel] + self.process_stats(values))
+            else:
+                print(f"HBM Bandwidth: no {kernel} result")
+        if not rows:
+            print("HBM Bandwidth: no results")
+            return
+
         table1 = PrettyTable()
         table1.field_names = ["Operation","Min (TB/s)", "Max (TB/s)", "Mean (TB/s)", "StDev (GB/s)"]
-        table1.add_row(copy)
-        table1.add_row(mul)
-        table1.add_row(add)
-        table1.add_row(triad)
-        table1.add_row(dot)
+        for row in rows:
+            table1.add_row(row)
         print(table1)
 
-        with open('../../Outputs/HBMBandwidth_Performance_results_' + self.machine_name +'.csv', 'w') as csvFile:
+        results = ResultsStore(os.path.join(self.root, 'Outputs', 'results.db'), self.machine_name)
+        for row in rows:
+            results.add(self.name, {"operation": row[0], "runs": len(self.buffer)},
+                        {"min_tbps": row[1], "max_tbps": row[2], "mean_tbps": row[3], "stdev_gbps": row[4]})
+
+        with open(os.path.join(self.root, 'Outputs', 'HBMBandwidth_Performance_results_' + self.machine_name +'.csv'), 'w') as csvFile:
             writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
             writer.writerow(["Operation","Min (TB/s)", "Max (TB/s)", "Mean (TB/s)", "StDev (GB/s)"])
-            writer.writerow(copy)
-            writer.writerow(mul)
-            writer.writerow(add)
-            writer.writerow(triad)
-            writer.writerow(dot)
+            for row in rows:
+                writer.writerow(row)
+
+
+    # BabelStream array sizes (elements, multiples of the 1024 thread block) whose
+    # three arrays together span min_mb to max_fraction of the GPU memory,
+    # points_per_octave sizes per doubling
+    def sweep_sizes(self):
+        memory = gpus.memory_mib() or self.size_sweep.get("memory_mb", 81920)
+        low = self.size_sweep.get("min_mb", 4) * (1 << 20)
+        high = self.size_sweep.get("max_fraction", 0.8) * memory * (1 << 20)
+        points = np.exp2(np.arange(np.log2(low), np.log2(high), 1 / self.size_sweep.get("points_per_octave", 2)))
+        return sorted({int(total / (ARRAYS * ELEMENT_BYTES)) // 1024 * 1024 for total in points} - {0})
+
+    # Bandwidth of every BabelStream kernel against the working set (all three arrays),
+    # from a few MB that fit in L2 to most of the HBM, the median of runs runs per
+    # size. Writes HBMBandwidth_size_sweep_<machine>.csv/.png and prints the cache
+    # and HBM plateaus of Triad and where one turns into the other.
+    def run_size_sweep(self):
+        print("Running HBM Bandwidth size sweep...")
+        results = ResultsStore(os.path.join(self.root, 'Outputs', 'results.db'), self.machine_name)
+        self.sweep = {}
+        for elements in self.sweep_sizes():
+            runs = []
+            for _ in range(self.size_sweep.get("runs", 3)):
+                output = subprocess.run(
+                    [os.path.join(self.build_path, "cuda-stream"), "-s", str(elements)], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                )
+                runs.append(self.parse_kernels(output.stdout.decode("utf-8")))
+            kernels = {k: statistics.median(r[k] for r in runs if k in r) / 1000 for k in KERNELS if any(k in r for r in runs)}
+            if not kernels:
+                print(f"{elements} elements: no results")
+                continue
+            working_set = elements * ARRAYS * ELEMENT_BYTES
+            self.sweep[working_set] = kernels
+            for kernel, gbps in kernels.items():
+                results.add(self.name + "_size_sweep", {"kernel": kernel, "elements": elements, "working_set_bytes": working_set},
+                            {"gbps": gbps})
+        if not self.sweep:
+            return
+        self.save_size_sweep()
+        self.plot_size_sweep()
+
+    # Triad bandwidth of the smallest and of the largest quarter of the working
+    # sets, and the first working set below the geometric mean of the two
+    def plateaus(self):
+        sizes = sorted(s for s in self.sweep if "Triad" in self.sweep[s])
+        if len(sizes) < 4:
+            return None
+        triad = [self.sweep[s]["Triad"] for s in sizes]
+        cache = max(triad[:len(triad) // 4])
+        hbm = statistics.median(triad[-(len(triad) // 4):])
+        knee = next((s for s, bw in zip(sizes, triad) if s > sizes[triad.index(cache)] and bw < (cache * hbm) ** 0.5), None)
+        return cache, hbm, knee
+
+    def save_size_sweep(self):
+        table1 = PrettyTable()
+        table1.field_names = ["Working set (MiB)"] + [k + " (GB/s)" for k in KERNELS]
+        with open(os.path.join(self.root, 'Outputs', 'HBMBandwidth_size_sweep_' + self.machine_name + '.csv'), 'w') as csvFile:
+            writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(["Working set (bytes)"] + [k + " (GB/s)" for k in KERNELS])
+            for size in sorted(self.sweep):
+                row = [round(self.sweep[size][k], 1) if k in self.sweep[size] else None for k in KERNELS]
+                writer.writerow([size] + row)
+                table1.add_row([round(size / (1 << 20), 1)] + row)
+        print(table1)
+        plateaus = self.plateaus()
+        if plateaus:
+            cache, hbm, knee = plateaus
+            print(f"Triad: {cache:.0f} GB/s cache resident, {hbm:.0f} GB/s from HBM" +
+                  (f", falls off at {knee / (1 << 20):.0f} MiB" if knee else ""))
+
+    def plot_size_sweep(self):
+        fig, ax = plt.subplots(figsize=(16, 8))
+        sizes = sorted(self.sweep)
+        for kernel in KERNELS:
+            points = [(s / (1 << 20), self.sweep[s][kernel]) for s in sizes if kernel in self.sweep[s]]
+            ax.plot([p[0] for p in points], [p[1] for p in points], marker='.', label=kernel)
+        plateaus = self.plateaus()
+        if plateaus and plateaus[2]:
+            ax.axvline(plateaus[2] / (1 << 20), color="gray", linestyle="--", label="Triad falls off")
+        ax.set_xscale('log', base=2)
+        ax.set_xlabel("Working set (MiB)")
+        ax.set_ylabel("Bandwidth (GB/s)")
+        ax.grid(True)
+        ax.legend()
+        fig.suptitle(f"{self.machine_name} memory bandwidth against working set", fontsize=20)
+        plt.savefig(os.path.join(self.root, "Outputs", "HBMBandwidth_size_sweep_" + self.machine_name + ".png"), bbox_inches="tight")
+        plt.close(fig)
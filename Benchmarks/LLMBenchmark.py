@@ -3,24 +3,47 @@ import os
 import shlex
 import subprocess
 import json
-import pandas as pd
 import csv
 from prettytable import PrettyTable
 import json
 import logging
+import shutil
+import threading
+import time
+import numpy as np
+from Benchmarks.GEMMCublasLt import GEMMCublastLt
+from Infra import telemetry
+from Infra import transformer
+from Infra.predictor import Predictor, dominated
+from Infra.container_exec import DockerContainer, Exec
+from Infra.results_store import ResultsStore
+from Infra.engine_store import EngineStore, dir_size, model_revision
+from Infra.scheduler import Scheduler
+
+# [BENCHMARK] fields that describe the run rather than measure it
+PARAM_KEYS = ['model_name', 'world_size', 'num_heads', 'num_kv_heads', 'num_layers', 'hidden_size', 'vocab_size',
+              'precision', 'batch_size', 'gpu_weights_percent', 'input_length', 'output_length', 'compute_cap']
 
 class LLMBenchmark:
     def __init__(self, config_path: str, dir_path: str, machine: str):
         self.name = "LLMBenchmark"
         self.config = self.get_config(config_path)
+        self.config_path = config_path
         self.hf_username = self.config['credentials']['hf_username']
         self.hf_password = self.config['credentials']['hf_password']
         self.dir_path = dir_path
         self.precision = "float16"
         self.container = None
+        # what ct_exec() runs commands in, a LocalContainer runs them on this machine
+        self.exec_container = None
+        self.results = ResultsStore(os.path.join(dir_path, 'Outputs', 'results.db'), machine)
+        self.imported = False
         self.machine = machine
         self.log = logging.getLogger(self.name)
         self.ct_log = logging.getLogger(self.name + "::docker.exec_run")
+        self.revisions = {}
+        self.predictors = {}
+        self.engines = EngineStore(f'{self.dir_path}/engines', self.config.get('engine_quota_gb'), remove=self.remove_engine)
 
     def get_config(self, path: str):
         file = open(path)
@@ -31,10 +54,21 @@ class LLMBenchmark:
         except KeyError:
             raise KeyError("no value found")
 
-    def ct_exec(self, cmd, **kwargs):
-        self.ct_log.info(f"exec_run: start cmd={shlex.join(shlex.split(cmd))}, {kwargs}")
-        ret = self.container.exec_run(cmd, **kwargs)
-        self.ct_log.info(f"exec_run: exit_code:{ret.exit_code}, output:{ret.output.decode()}")
+    # runs cmd in the container, streaming its output to the log line by line and
+    # to on_line(line, stream) if given. timeout and idle_timeout (seconds) stop a
+    # command that runs too long or stops printing, see Infra/container_exec.py
+    def ct_exec(self, cmd, on_line=None, timeout=None, idle_timeout=None):
+        self.ct_log.info(f"exec_run: start cmd={shlex.join(shlex.split(cmd))}, timeout={timeout}, idle_timeout={idle_timeout}")
+
+        def log_line(line, stream):
+            self.ct_log.info(f"exec_run: {stream}: {line}")
+            if on_line is not None:
+                on_line(line, stream)
+
+        ret = Exec(self.exec_container, cmd, log_line, timeout, idle_timeout).start().wait()
+        if ret.timed_out:
+            print(f"Command stopped, {ret.timed_out}: {cmd.strip()}")
+        self.ct_log.info(f"exec_run: exit_code:{ret.exit_code}, {ret.duration:.1f}s")
         return ret
 
     def ct_exec_model(self, cmd, model, **kwargs):
@@ -61,6 +95,7 @@ class LLMBenchmark:
 
         # Creates new Docker container
         self.container = client.containers.run('tensorrt_llm_benchmark:latest', **docker_run_options)
+        self.exec_container = DockerContainer(self.container)
 
         print(f"Docker Container ID: {self.container.id}")
 
@@ -69,336 +104,647 @@ class LLMBenchmark:
             self.ct_exec(f"mkdir {self.dir_path}/models")
         if not os.path.exists(f'{self.dir_path}/checkpoints'):
             self.ct_exec(f"mkdir {self.dir_path}/checkpoints")
+        # engine manifests are written from the host, the engines themselves by the container
+        if not os.path.exists(self.engines.manifest_dir):
+            self.ct_exec(f"mkdir -p {self.engines.manifest_dir}")
+            self.ct_exec(f"chmod a+rwx {self.engines.manifest_dir}")
 
     def cleanup_container(self):
         if self.container:
             self.container.stop()
 
 
+    # downloads every model the config uses. a model that fails to download is
+    # reported and left out of prepare_models(), the others are still benchmarked
     def download_models(self):
         for model_name in self.config['models']:
             if self.config['models'][model_name]['use_model']:
-                model_type = self.config['models'][model_name]['type']
-                model_url = self.config['models'][model_name]['hf_url']
-
-                # Check that container has model speciffic environment
-                self.ct_exec_model('bash_env python3 -c "import torch; print(torch.__version__)"', model_type)
-                self.ct_exec_model('bash_env python3 -c "import tensorrt_llm"', model_type)
-                # Clone required models.
-                print("Downloading", model_name)
-                if not os.path.exists(os.path.join(self.dir_path, 'models', model_name)):
-                    new_url = model_url.replace("https://", '')
-                    self.ct_exec(f'/bin/sh -c "cd {self.dir_path}/models && git clone https://{self.hf_username}:{self.hf_password}@{new_url}"')
-                    print(model_name, "downloaded successfully")
-                else: # Add Error handling
-                    print(model_name, 'already exists')
-
-
-    def build_engines(self):
+                start = time.time()
+                try:
+                    self.download_model(model_name)
+                except RuntimeError as e:
+                    print(e)
+                    continue
+                print(f"Downloading {model_name} took {time.time() - start:.1f}s")
+
+    def download_model(self, model_name):
+        model_type = self.config['models'][model_name]['type']
+        model_url = self.config['models'][model_name]['hf_url']
+
+        # Check that container has model speciffic environment
+        self.ct_exec_model('bash_env python3 -c "import torch; print(torch.__version__)"', model_type)
+        self.ct_exec_model('bash_env python3 -c "import tensorrt_llm"', model_type)
+        # Clone required models.
+        print("Downloading", model_name)
+        if not os.path.exists(os.path.join(self.dir_path, 'models', model_name)):
+            new_url = model_url.replace("https://", '')
+            dl = self.ct_exec(f'/bin/sh -c "cd {self.dir_path}/models && git clone https://{self.hf_username}:{self.hf_password}@{new_url}"')
+            if dl.exit_code != 0:
+                raise RuntimeError(f"downloading {model_name} failed: {dl.output.decode('utf-8')}")
+            print(model_name, "downloaded successfully")
+        else: # Add Error handling
+            print(model_name, 'already exists')
+
+    # everything that goes into the engine of model_name at tp_size. the engine
+    # store hashes this to find or place the engine, so every argument that changes
+    # the engine has to be in here
+    def engine_params(self, model_name, tp_size):
+        model = self.config['models'][model_name]
+        model_precision = model['precision']
+        model_type = model['type']
+        model_dir = f'{self.dir_path}/models/{model_name}'
+        # not cached until the model is downloaded, "" would stay for the whole run
+        if not self.revisions.get(model_name):
+            self.revisions[model_name] = model_revision(model_dir)
+
+        if model_precision == "fp8":
+            convert = ['/app/tensorrt_llm/examples/quantization/quantize.py',
+                       '--qformat', 'fp8',
+                       '--kv_cache_dtype', 'fp8',
+                       '--dtype', self.precision]
+            if tp_size != 1:
+                convert += ['--tp_size', str(tp_size)]
+        elif tp_size == 1:
+            convert = [f'/app/tensorrt_llm/examples/{model_type}/convert_checkpoint.py',
+                       '--dtype', 'float16']
+        else:
+            convert = [f'/app/tensorrt_llm/examples/{model_type}/convert_checkpoint.py',
+                       '--dtype', model_precision,
+                       '--load_by_shard',
+                       '--workers', '8',
+                       '--tp_size', str(tp_size),
+                       '--pp_size', '1']
+
+        # From https://github.com/NVIDIA/TensorRT-LLM/blob/main/docs/source/performance/perf-overview.md#engine-building
+        # https://techcommunity.microsoft.com/t5/azure-high-performance-computing/optimizing-language-model-inference-on-azure/ba-p/4248271
+        # --max_seq_len = (max_input + max_output) in our case it is 1024 + 128
+        # From
+        # https://github.com/NVIDIA/TensorRT-LLM/tree/main/examples/llama#long-context-evaluation
+        # https://github.com/NVIDIA/TensorRT-LLM/blob/main/docs/source/performance/perf-best-practices.md
+        # --max_num_tokens = (max_batch_size * max_input_len), in our case it is 1024*1024 => 1M
+        if "405" not in model_name:
+            build = ['--workers', str(tp_size),
+                     '--max_batch_size', '1024',
+                     '--max_num_tokens', '1048576',
+                     '--max_input_len', '1048576',
+                     '--max_seq_len', '1152',
+                     '--gemm_plugin', 'auto']
+        else:
+            build = ['--max_batch_size', '256',
+                     '--max_num_tokens', '262144',
+                     '--max_input_len', '262144',
+                     '--max_seq_len', '1152',
+                     '--use_paged_context_fmha', 'enable',
+                     '--workers', '8']
+
+        return {
+            'model': model_name,
+            'revision': self.revisions[model_name],
+            'precision': model_precision,
+            'tp_size': tp_size,
+            'pp_size': 1,
+            'convert': convert,
+            'build': build,
+        }
+
+    def engine_dir(self, model_name, tp_size):
+        params = self.engine_params(model_name, tp_size)
+        return self.engines.get(params) or self.engines.path(params)
+
+    def remove_engine(self, path):
+        rm = self.ct_exec(f'rm -rf {path}')
+        if rm.exit_code != 0:
+            print(rm.output.decode('utf-8'))
+
+    def checkpoint_dir(self, model_name, tp_size):
+        return f'{self.dir_path}/checkpoints/{model_name}/tp_{tp_size}/{self.precision}'
+
+    def convert_checkpoint(self, model_name, tp_size):
+        params = self.engine_params(model_name, tp_size)
+        print(f"Converting Checkpoints for {model_name}, TP size:{tp_size}")
+        convert_checkpoints_command = shlex.join(
+            ['bash_env', 'python3', params['convert'][0],
+             '--model_dir', f'{self.dir_path}/models/{model_name}',
+             '--output_dir', self.checkpoint_dir(model_name, tp_size)] + params['convert'][1:]
+        )
+        be1 = self.ct_exec_model(convert_checkpoints_command, self.config['models'][model_name]['type'])
+        if be1.exit_code != 0:
+            raise RuntimeError(f"converting {model_name} failed: {be1.output.decode('utf-8')}")
+
+    def build_engine(self, model_name, tp_size):
+        params = self.engine_params(model_name, tp_size)
+        engine_dir = self.engines.path(params)
+        # a build that did not finish leaves no manifest, start it over
+        if os.path.exists(engine_dir):
+            self.remove_engine(engine_dir)
+        start = time.time()
+        print(f"Building Engine for {model_name} , TP size:{tp_size}")
+        build_engine_command = shlex.join(
+            ['bash_env', 'trtllm-build',
+             '--checkpoint_dir', self.checkpoint_dir(model_name, tp_size),
+             '--output_dir', engine_dir] + params['build']
+        )
+        be2 = self.ct_exec_model(build_engine_command, self.config['models'][model_name]['type'])
+        if be2.exit_code != 0 or not os.path.exists(f'{engine_dir}/rank0.engine'):
+            raise RuntimeError(f"building {model_name} failed: {be2.output.decode('utf-8')}")
+        manifest = self.engines.add(params, time.time() - start)
+        print(f"Built {engine_dir} in {manifest['build_time']}s, {manifest['size'] / 1e9:.1f} GB")
+        self.engines.evict(keep=self.needed_engines())
+
+    def delete_checkpoint(self, model_name, tp_size):
+        rm = self.ct_exec(f'rm -rf {self.checkpoint_dir(model_name, tp_size)}')
+        if rm.exit_code != 0:
+            print(rm.output.decode('utf-8'))
+
+    # keys of the engines the current config uses, these are never evicted
+    def needed_engines(self):
+        needed = []
         for model_name in self.config['models']:
             if self.config['models'][model_name]['use_model']:
-                model_precision = self.config['models'][model_name]['precision']
-                model_type = self.config['models'][model_name]['type']
                 for tp_size in self.config['models'][model_name]['tp_sizes']:
-                    # Convert Checkpoints
-
-                    if not os.path.exists(f'{self.dir_path}/engines/{model_name}/tp_{tp_size}/{self.precision}/rank0.engine'):
-                        print(f"Converting Checkpoints for {model_name}, TP size:{tp_size}")
-                        if tp_size == 1:
-                            if model_precision == "fp8":
-                                convert_checkpoints_command = f'''
-                                bash_env python3 /app/tensorrt_llm/examples/quantization/quantize.py \
-                                    --model_dir {self.dir_path}/models/{model_name}\
-                                    --qformat fp8 \
-                                    --kv_cache_dtype fp8 \
-                                    --output_dir {self.dir_path}/checkpoints/{model_name}/tp_{tp_size}/{self.precision}\
-                                    --dtype {self.precision}
-                                '''
-                            else:
-                                convert_checkpoints_command = f'''
-                                bash_env python3 /app/tensorrt_llm/examples/{model_type}/convert_checkpoint.py \
-                                    --model_dir {self.dir_path}/models/{model_name}\
-                                    --output_dir {self.dir_path}/checkpoints/{model_name}/tp_{tp_size}/{self.precision}\
-                                    --dtype float16 \
-                                '''
+                    needed.append(self.engines.key(self.engine_params(model_name, tp_size)))
+        return needed
+
+    # converts and builds the engines of the downloaded models as one pipeline:
+    # conversions and builds take turns on the GPUs, and each checkpoint is deleted
+    # as soon as its engine is built. conversions only start when there is CPU,
+    # memory and disk left for them (sized from the downloaded model). prints the
+    # time of every step and the peak disk usage of the stage. the downloads are
+    # a task of their own in runner.py, so they do not wait for the GPUs
+    def prepare_models(self):
+        cpus = os.cpu_count() or 8
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        sched = Scheduler(max_workers=max(2, min(cpus // 8, 8)))
+        sched.limit('cpu', cpus)
+        sched.limit('memory', memory * 0.8)
+        sched.limit('disk', lambda: shutil.disk_usage(self.dir_path).free)
+
+        # the engine key includes the model revision, which is read from the
+        # downloaded model, so the cache is looked up by a task of the pipeline
+        cached = {}
+
+        def check_engine(model_name, tp_size):
+            cached[(model_name, tp_size)] = self.engines.get(self.engine_params(model_name, tp_size)) is not None
+            if cached[(model_name, tp_size)]:
+                print(f"Using cached engine for {model_name}, TP size:{tp_size}: {self.engine_dir(model_name, tp_size)}")
 
-                        else:
-                            if model_precision == "fp8":
-                                convert_checkpoints_command = f'''
-                                bash_env python3 /app/tensorrt_llm/examples/quantization/quantize.py \
-                                    --model_dir {self.dir_path}/models/{model_name}\
-                                    --qformat fp8 \
-                                    --kv_cache_dtype fp8 \
-                                    --output_dir {self.dir_path}/checkpoints/{model_name}/tp_{tp_size}/{self.precision}\
-                                    --dtype {self.precision}\
-                                    --tp_size {tp_size}
-                                '''
-                            else:
-                                convert_checkpoints_command = f'''
-                                bash_env python3 /app/tensorrt_llm/examples/{model_type}/convert_checkpoint.py \
-                                    --model_dir {self.dir_path}/models/{model_name}\
-                                    --output_dir {self.dir_path}/checkpoints/{model_name}/tp_{tp_size}/{self.precision}\
-                                    --dtype {model_precision} \
-                                    --load_by_shard \
-                                    --workers 8 \
-                                    --tp_size 8 \
-                                    --pp_size 1
-                                '''
-
-                        be1 = self.ct_exec_model(convert_checkpoints_command, model_type)
-                        if be1.exit_code != 0:
-                            print(be1.output.decode('utf-8'))
-
-                        # Build Engines
-                        print(f"Building Engine for {model_name} , TP size:{tp_size}")
-                        # From https://github.com/NVIDIA/TensorRT-LLM/blob/main/docs/source/performance/perf-overview.md#engine-building
-                        # https://techcommunity.microsoft.com/t5/azure-high-performance-computing/optimizing-language-model-inference-on-azure/ba-p/4248271
-                        # --max_seq_len = (max_input + max_output) in our case it is 1024 + 128
-                        # From
-                        # https://github.com/NVIDIA/TensorRT-LLM/tree/main/examples/llama#long-context-evaluation
-                        # https://github.com/NVIDIA/TensorRT-LLM/blob/main/docs/source/performance/perf-best-practices.md
-                        # --max_num_tokens = (max_batch_size * max_input_len), in our case it is 1024*1024 => 1M
-                        if "405" not in model_name:
-                            build_engine_command = f'''
-                                bash_env trtllm-build \
-                                --checkpoint_dir {self.dir_path}/checkpoints/{model_name}/tp_{tp_size}/{self.precision}\
-                                --output_dir {self.dir_path}/engines/{model_name}/tp_{tp_size}/{self.precision} \
-                                --workers {tp_size} \
-                                --max_batch_size 1024 \
-                                --max_num_tokens 1048576 \
-                                --max_input_len  1048576 \
-                                --max_seq_len    1152 \
-                                --gemm_plugin auto
-                            '''
-                        else:
-                            build_engine_command = f'''
-                                bash_env trtllm-build \
-                                --checkpoint_dir {self.dir_path}/checkpoints/{model_name}/tp_{tp_size}/{self.precision}\
-                                --output_dir {self.dir_path}/engines/{model_name}/tp_{tp_size}/{self.precision} \
-                                --max_batch_size 256 \
-                                --max_num_tokens 262144 \
-                                --max_input_len  262144 \
-                                --max_seq_len    1152 \
-                                --use_paged_context_fmha enable \
-                                --workers 8
-                            '''
-
-                        be2 = self.ct_exec_model(build_engine_command, model_type)
-                        if be2.exit_code != 0:
-                            print(be2.output.decode('utf-8'))
-
-        # Delete Converted Checkpoints
-        be3 = self.ct_exec(f'''rm -rf {self.dir_path}/checkpoints''')
-        if be3.exit_code != 0:
-                print(be3.output.decode('utf-8'))
+        for model_name in self.config['models']:
+            if not self.config['models'][model_name]['use_model']:
+                continue
+            if not os.path.exists(f'{self.dir_path}/models/{model_name}'):
+                print(f"{model_name} was not downloaded, skipping its engines")
+                continue
+            model_size = lambda model_name=model_name: dir_size(f'{self.dir_path}/models/{model_name}')
+            for tp_size in self.config['models'][model_name]['tp_sizes']:
+                check = sched.add(f'check engine {model_name} tp{tp_size}', lambda m=model_name, tp=tp_size: check_engine(m, tp))
+                # the checkpoint and the engine are each about the size of the model
+                convert = sched.add(f'convert {model_name} tp{tp_size}',
+                                    lambda m=model_name, tp=tp_size: cached[(m, tp)] or self.convert_checkpoint(m, tp),
+                                    [check], ['gpu'], usage={'cpu': 8, 'memory': model_size, 'disk': lambda s=model_size: 2 * s()})
+                build = sched.add(f'build {model_name} tp{tp_size}', lambda m=model_name, tp=tp_size: cached[(m, tp)] or self.build_engine(m, tp),
+                                  [convert], ['gpu'], usage={'cpu': tp_size})
+                sched.add(f'delete checkpoint {model_name} tp{tp_size}', lambda m=model_name, tp=tp_size: self.delete_checkpoint(m, tp),
+                          [build], always=True)
+
+        stop = threading.Event()
+        base = shutil.disk_usage(self.dir_path).used
+        peak = [base]
+
+        def watch_disk():
+            while not stop.wait(5):
+                peak[0] = max(peak[0], shutil.disk_usage(self.dir_path).used)
+
+        watcher = threading.Thread(target=watch_disk, daemon=True)
+        watcher.start()
+        start = time.time()
+        statuses = sched.run()
+        stop.set()
+        watcher.join()
+        peak[0] = max(peak[0], shutil.disk_usage(self.dir_path).used)
+
+        table = PrettyTable()
+        table.field_names = ["Step", "Status", "Time (s)"]
+        for name, task in sched.tasks.items():
+            table.add_row([name, task.status, round(task.duration, 1)])
+        print(table)
+        print(f"Model preparation took {time.time() - start:.1f}s, peak additional disk usage {(peak[0] - base) / 1e9:.1f} GB")
+
+        failed = [name for name, status in statuses.items() if status != 'done']
+        if failed:
+            # models that did prepare are still benchmarked
+            print(f"Model preparation did not complete: {', '.join(failed)}")
+
+    # benchmark.py command for one engine. batch sizes and input/output lengths can
+    # be lists, benchmark.py then runs every combination after loading the engine
+    # once and prints one [BENCHMARK] line per point
+    def benchmark_command(self, model_name, tp_size, batch_sizes, input_output_sizes, num_runs=None, warm_up=None):
+        model = self.config['models'][model_name]
+        if num_runs is None:
+            num_runs = model['number_of_runs']
+        if warm_up is None:
+            warm_up = model['warmup']
+        model_precision = model['precision']
+        if model_precision == "fp8":
+            model_precision = "float16"
+        command = ['bash_env', 'python3', '/app/tensorrt_llm/benchmarks/python/benchmark.py',
+                   '--batch_size', ';'.join(str(b) for b in batch_sizes),
+                   '--input_output_len', ';'.join(input_output_sizes),
+                   '--warm_up', str(warm_up),
+                   '--num_runs', str(num_runs),
+                   '--engine_dir', self.engine_dir(model_name, tp_size),
+                   '-m', 'dec']
+        if tp_size != 1:
+            nccl = [arg for key, val in self.nccl_env().items() for arg in ('-x', f'{key}={val}')]
+            command = ['bash_env', 'mpirun', '-n', str(tp_size), '--bind-to', 'none', '-display-map', '--allow-run-as-root'] + nccl + command + ['--dtype', model_precision]
+        return shlex.join(command)
+
+    # NCCL settings for tensor-parallel runs from the nccl_env file, e.g. the
+    # nccl_tuning_<machine>.env NCCLBandwidth.tune() writes
+    def nccl_env(self):
+        path = self.config.get('nccl_env', '')
+        if not path:
+            return {}
+        env = {}
+        with open(os.path.join(self.dir_path, path)) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, val = line.split('=', 1)
+                    env[key] = val
+        return env
 
     def run_benchmark(self):
+        # with sweep set, one benchmark.py per engine covers every batch size and
+        # input/output length instead of one process (and engine load) per point
+        sweep = self.config.get('sweep', False)
         for model_name in self.config['models']:
             model_type = self.config['models'][model_name]['type']
             if self.config['models'][model_name]['use_model']:
-                for tp_size in self.config['models'][model_name]['tp_sizes']:
-                    for batch_size in self.config['models'][model_name]['batch_sizes']:
-                        for input_output_size in  self.config['models'][model_name]['input_output_sizes']:
-                            model_precision = self.config['models'][model_name]['precision']
-                            warmup = self.config['models'][model_name]['warmup']
-                            number_of_runs = self.config['models'][model_name]['number_of_runs']
-                            if model_precision == "fp8":
-                                model_precision = "float16"
-
-                            print(f"Benchmarking {model_name} | TP Size: {tp_size} | Batch Size: {batch_size} | Input Size: {input_output_size.split(',')[0]} | Output Size: {input_output_size.split(',')[1]}")
-
-                            if tp_size == 1:
-
-                                print(model_name, tp_size, batch_size, input_output_size)
-                                run_benchmark_command = f'''
-                                    bash_env python3 /app/tensorrt_llm/benchmarks/python/benchmark.py \
-                                                --batch_size {batch_size} \
-                                                --input_output_len {input_output_size} \
-                                                --warm_up {warmup} \
-                                                --num_runs {number_of_runs} \
-                                                --engine_dir {self.dir_path}/engines/{model_name}/tp_{tp_size}/{self.precision} \
-                                                -m dec
-                                '''
-                            else:
-                                run_benchmark_command = f'''
-                                    bash_env mpirun -n {tp_size} --bind-to none -display-map --allow-run-as-root 
-                                                bash_env python3 /app/tensorrt_llm/benchmarks/python/benchmark.py \
-                                                --batch_size {batch_size} \
-                                                --dtype {model_precision}
-                                                --input_output_len {input_output_size} \
-                                                --warm_up {warmup} \
-                                                --num_runs {number_of_runs} \
-                                                --engine_dir {self.dir_path}/engines/{model_name}/tp_{tp_size}/{self.precision} \
-                                                -m dec
-                                '''
-
-                            # c14_e = self.ct_exec(c14)
-                            rb1 = self.ct_exec_model(run_benchmark_command, model_type)
+                # GPU telemetry for all runs of this model, read back by get_telemetry()
+                with telemetry.TelemetrySampler(period=0.1) as sampler:
+                    batch_sizes = self.config['models'][model_name]['batch_sizes']
+                    input_output_sizes = self.config['models'][model_name]['input_output_sizes']
+                    predictions, skip = self.plan(model_name)
+                    for tp_size in self.config['models'][model_name]['tp_sizes']:
+                        todo = [(b, io) for b in batch_sizes for io in input_output_sizes
+                                if (tp_size, b) + tuple(int(x) for x in io.split(',')) not in skip]
+                        if not todo:
+                            print(f"Skipping {model_name} | TP Size: {tp_size}, every configuration is dominated")
+                            continue
+                        if sweep:
+                            # the sweep runs every combination, so a batch size or length is
+                            # only dropped when all of its configurations are dominated
+                            points = [([b for b in batch_sizes if any(t[0] == b for t in todo)],
+                                       [io for io in input_output_sizes if any(t[1] == io for t in todo)])]
+                            print(f"Benchmarking {model_name} | TP Size: {tp_size} | Batch Sizes: {points[0][0]} | Input/Output Sizes: {points[0][1]}")
+                        else:
+                            points = [([b], [io]) for b, io in todo]
+                        for batch_size, input_output_size in points:
+                            if not sweep:
+                                print(f"Benchmarking {model_name} | TP Size: {tp_size} | Batch Size: {batch_size[0]} | Input Size: {input_output_size[0].split(',')[0]} | Output Size: {input_output_size[0].split(',')[1]}")
+
+                            # results are recorded and printed as benchmark.py reports them,
+                            # so a sweep that is stopped by a timeout keeps its finished points
+                            def on_line(line, stream, model_name=model_name):
+                                if line.startswith("[BENCHMARK] "):
+                                    for record in self.parse_results(line, model_name):
+                                        self.print_result(record, model_name)
+
+                            run_benchmark_command = self.benchmark_command(model_name, tp_size, batch_size, input_output_size)
+                            rb1 = self.ct_exec_model(run_benchmark_command, model_type, on_line=on_line,
+                                                     timeout=self.config.get('benchmark_timeout'),
+                                                     idle_timeout=self.config.get('benchmark_idle_timeout'))
                             if rb1.exit_code != 0:
                                 print(rb1.output.decode('utf-8'))
-                            result = rb1.output.decode('utf-8')
 
-                            df = self.parse_results(result, model_name)
-                            table1 = PrettyTable()
+                        if self.config.get('latency_samples', 0) > 0:
+                            self.run_latency(model_name, tp_size)
 
-                            table1.add_row(['Model Named', model_name])
-                            table1.add_row(['Input/Output lengths', f"{df['input_length'][-1]}; {df['output_length'][-1]}"])
-                            table1.add_row(['World Size (TP size)', df['world_size'][-1]])
-                            table1.add_row(['Batch Size', df['batch_size'][-1]])
-                            table1.add_row(['Throughput (tokens/sec)', df['tokens_per_sec'][-1]])
-                            table1.add_row(['Latency (ms)', df['latency(ms)'][-1]])
+                    if predictions:
+                        self.report_predictions(model_name, predictions)
 
-                            print(table1.get_string(header=False))
+                    if self.config.get('gemm_decomposition', False):
+                        self.run_model_sizes(model_name)
 
-                            # self.run_model_sizes(model_name, batch_size)
+                    self.save_results()
+                sampler.to_csv(f'{self.dir_path}/Outputs/{model_name}_power.csv')
+                table2 = PrettyTable()
+                for key, val in self.get_telemetry(model_name).items():
+                    table2.add_row([key, val])
+                print(table2.get_string(header=False))
 
-
-    def parse_results(self,output: str, model_name: str):
-        lines=output.split('\n')
-        if not os.path.exists(os.path.join(self.dir_path, 'Outputs', f"LLMBenchmark_{self.machine}.csv")):
-            df = dict()
-        else:
-            df = pd.read_csv(os.path.join(self.dir_path, 'Outputs', f"LLMBenchmark_{self.machine}.csv")).to_dict(orient='list')
-        self.log.info(f"parse_results: current df {df}")
-        for line in lines:
+    # predictor of this machine for the GEMM datatype, built from the GEMM, HBM and
+    # NCCL results in Outputs. None (after saying why) if they are missing
+    def get_predictor(self, datatype):
+        if datatype not in self.predictors:
+            try:
+                self.predictors[datatype] = Predictor.from_outputs(os.path.join(self.dir_path, 'Outputs'), self.machine, datatype, self.results,
+                                                                   self.config.get('predictor_calibration', 1.0))
+            except (OSError, ValueError) as e:
+                print(f"No tokens/sec predictions: {e}")
+                self.predictors[datatype] = None
+        return self.predictors[datatype]
+
+    # predicted latency and tokens/sec of every configuration of model_name, and the
+    # configurations that are clearly dominated by another one, which are skipped
+    # with prune set. returns ({(tp, batch, input, output): prediction}, dominated)
+    def plan(self, model_name):
+        if not self.config.get('predict', False):
+            return {}, set()
+        model = self.config['models'][model_name]
+        p = self.get_predictor(self.gemm_datatype(model_name))
+        if p is None:
+            return {}, set()
+        hf_config = self.hf_config(model_name)
+        predictions = dict()
+        for tp_size in model['tp_sizes']:
+            for batch_size in model['batch_sizes']:
+                for io in model['input_output_sizes']:
+                    input_length, output_length = (int(x) for x in io.split(','))
+                    try:
+                        predictions[(tp_size, batch_size, input_length, output_length)] = p.predict(hf_config, tp_size, batch_size, input_length, output_length)
+                    except ValueError as e:
+                        print(f"No prediction for {model_name} at TP {tp_size}: {e}")
+        skip = set()
+        if self.config.get('prune', False):
+            skip = dominated(list(predictions), list(predictions.values()), self.config.get('prune_margin', 0.2))
+
+        table = PrettyTable()
+        table.field_names = ["TP", "Batch", "Input", "Output", "Prefill (ms)", "Decode (ms/token)", "Latency (ms)", "Tokens/sec", "All-reduce share", "Run"]
+        for key, pred in predictions.items():
+            table.add_row(list(key) + [pred['prefill_ms'], pred['decode_ms'], pred['latency_ms'], pred['tokens_per_sec'], pred['allreduce_share'],
+                                       "skip (dominated)" if key in skip else "yes"])
+        print(f"Predicted performance of {model_name}")
+        print(table)
+        return predictions, skip
+
+    # prediction error of every configuration of model_name measured by this run,
+    # and the predictor_calibration that would have removed the median error
+    def report_predictions(self, model_name, predictions):
+        table = PrettyTable()
+        table.field_names = ["TP", "Batch", "Input", "Output", "Predicted tokens/sec", "Measured tokens/sec", "Error (%)", "Predicted latency (ms)", "Measured latency (ms)"]
+        ratios = []
+        for r in self.results.query(self.name, machine=self.machine, run_id=self.results.run_id, model_name=model_name):
+            params, metrics = r['params'], r['metrics']
+            key = tuple(params.get(k) for k in ('world_size', 'batch_size', 'input_length', 'output_length'))
+            if key not in predictions or not metrics.get('tokens_per_sec'):
+                continue
+            pred = predictions[key]
+            error = round(100 * (pred['tokens_per_sec'] / metrics['tokens_per_sec'] - 1), 1)
+            ratios.append(metrics['tokens_per_sec'] / pred['tokens_per_sec'])
+            table.add_row(list(key) + [pred['tokens_per_sec'], metrics['tokens_per_sec'], error, pred['latency_ms'], metrics.get('latency(ms)')])
+            self.results.add(self.name + '_prediction', {'model_name': model_name, 'world_size': key[0], 'batch_size': key[1], 'input_length': key[2], 'output_length': key[3]},
+                             dict(pred, measured_tokens_per_sec=metrics['tokens_per_sec'], error_pct=error))
+        if not ratios:
+            return
+        print(f"Prediction error of {model_name}")
+        print(table)
+        calibration = self.config.get('predictor_calibration', 1.0) * float(np.median(ratios))
+        print(f"predictor_calibration that fits {model_name} on this machine: {calibration:.3f}")
+
+    # latency distribution of every configuration of model_name at tp_size.
+    # benchmark.py only prints the average of its runs, so each configuration is
+    # repeated latency_samples times with --num_runs 1, all in one process so the
+    # engine is still loaded once. every configuration also runs with an output
+    # length of 1, which gives the time to first token (TTFT); the time per output
+    # token (TPOT) is the rest of the latency spread over the remaining tokens.
+    # the engine is warm from the regular run, so samples only warm up once
+    def run_latency(self, model_name, tp_size):
+        samples = self.config['latency_samples']
+        model = self.config['models'][model_name]
+        input_output_sizes = []
+        for io in model['input_output_sizes']:
+            input_output_sizes.append(io)
+            first_token = io.split(',')[0] + ',1'
+            if first_token not in input_output_sizes:
+                input_output_sizes.append(first_token)
+        batch_sizes = [b for b in model['batch_sizes'] for _ in range(samples)]
+        print(f"Measuring latency distribution of {model_name} | TP Size: {tp_size} | {samples} samples per configuration")
+
+        records = []
+
+        def on_line(line, stream):
+            if line.startswith("[BENCHMARK] "):
+                records.extend(self.parse_results(line, model_name, self.name + '_samples'))
+
+        command = self.benchmark_command(model_name, tp_size, batch_sizes, input_output_sizes, num_runs=1, warm_up=1)
+        rb = self.ct_exec_model(command, model['type'], on_line=on_line,
+                                timeout=self.config.get('benchmark_timeout'),
+                                idle_timeout=self.config.get('benchmark_idle_timeout'))
+        if rb.exit_code != 0:
+            print(rb.output.decode('utf-8'))
+
+        table = PrettyTable()
+        table.field_names = ["Batch Size", "Input", "Output", "Samples", "Latency p50/p90/p99 (ms)", "TTFT p50/p90/p99 (ms)", "TPOT p50/p90/p99 (ms)"]
+        for (batch_size, input_length, output_length), params, metrics in self.latency_stats(records, model_name, tp_size):
+            self.results.add(self.name + '_latency', params, metrics)
+            table.add_row([batch_size, input_length, output_length, params['samples']] +
+                          ["/".join(str(metrics.get(f"{name}_{p}_ms")) for p in ("p50", "p90", "p99")) for name in ("latency", "ttft", "tpot")])
+        print(table)
+        self.results.export_csv(os.path.join(self.dir_path, 'Outputs', f"LLMBenchmark_latency_{self.machine}.csv"), self.name + '_latency', machine=self.machine)
+
+    # percentiles of the per-run latencies in records, per (batch size, input
+    # length, output length). yields (configuration, params, metrics)
+    def latency_stats(self, records, model_name, tp_size):
+        latencies = dict()
+        for record in records:
+            try:
+                key = (int(record['batch_size']), int(record['input_length']), int(record['output_length']))
+                latencies.setdefault(key, []).append(float(record['latency(ms)']))
+            except (KeyError, ValueError):
+                continue
+
+        for (batch_size, input_length, output_length), values in sorted(latencies.items()):
+            if output_length == 1 and any(k[:2] == (batch_size, input_length) and k[2] > 1 for k in latencies):
+                continue
+            values = np.array(values)
+            metrics = dict()
+            for p in (50, 90, 99):
+                metrics[f"latency_p{p}_ms"] = round(float(np.percentile(values, p)), 3)
+            ttft = latencies.get((batch_size, input_length, 1))
+            if ttft is not None:
+                ttft = np.array(ttft)
+                for p in (50, 90, 99):
+                    metrics[f"ttft_p{p}_ms"] = round(float(np.percentile(ttft, p)), 3)
+                if output_length > 1:
+                    # per sample, against the median TTFT
+                    tpot = (values - np.median(ttft)) / (output_length - 1)
+                    for p in (50, 90, 99):
+                        metrics[f"tpot_p{p}_ms"] = round(float(np.percentile(tpot, p)), 3)
+            params = {'model_name': model_name, 'world_size': tp_size, 'batch_size': batch_size,
+                      'input_length': input_length, 'output_length': output_length, 'samples': len(values)}
+            yield (batch_size, input_length, output_length), params, metrics
+
+    def print_result(self, record, model_name):
+        table1 = PrettyTable()
+
+        table1.add_row(['Model Named', model_name])
+        table1.add_row(['Input/Output lengths', f"{record.get('input_length')}; {record.get('output_length')}"])
+        table1.add_row(['World Size (TP size)', record.get('world_size')])
+        table1.add_row(['Batch Size', record.get('batch_size')])
+        table1.add_row(['Throughput (tokens/sec)', record.get('tokens_per_sec')])
+        table1.add_row(['Latency (ms)', record.get('latency(ms)')])
+
+        print(table1.get_string(header=False))
+
+    # "[BENCHMARK] key value key value ..." -> (params, metrics). numbers that
+    # describe the run (batch size, lengths, model shape) are params, the other
+    # numbers are metrics
+    def split_record(self, record):
+        params = dict()
+        metrics = dict()
+        for key, val in record.items():
+            try:
+                num = int(val)
+            except ValueError:
+                try:
+                    num = float(val)
+                except ValueError:
+                    num = None if val in ('None', 'N/A') else val
+            if isinstance(num, str) or key in PARAM_KEYS:
+                params[key] = num
+            else:
+                metrics[key] = num
+        return params, metrics
+
+    # adds every [BENCHMARK] line of output to the results store (under benchmark,
+    # LLMBenchmark by default), returns the records in the order they were reported
+    def parse_results(self,output: str, model_name: str, benchmark: str = None):
+        self.import_results()
+        records = []
+        for line in output.split('\n'):
             self.log.info(f"parse walk line: {line}")
             if line.startswith("[BENCHMARK] "):
                 result = line.split()[1:]
+                record = dict()
                 for i in range(0,len(result),2):
                     key=result[i]
                     val=result[i+1]
                     if key in ['model_name', 'engine_dir']:
                         key = 'model_name'
                         val = model_name
-                    if key not in df:
-                        df[key] = []
-                    df[key].append(val)
-                if 'machine' not in df:
-                    df['machine'] = []
-                df['machine'].append(self.machine)
-                self.log.info(f"parse_results: update df {df}")
-                pd.DataFrame(df).to_csv(os.path.join(self.dir_path, 'Outputs', f"LLMBenchmark_{self.machine}.csv"), index = False)
-                return df
+                    record[key] = val
+                params, metrics = self.split_record(record)
+                self.results.add(benchmark or self.name, params, metrics)
+                self.log.info(f"parse_results: add {record}")
+                records.append(record)
+        return records
+
+    # LLMBenchmark_<machine>.csv with every result of this machine, written from the store
+    def save_results(self):
+        self.results.export_csv(os.path.join(self.dir_path, 'Outputs', f"LLMBenchmark_{self.machine}.csv"), self.name, machine=self.machine)
+
+    # results of earlier runs only exist in LLMBenchmark_<machine>.csv, copy them
+    # into the store once so save_results() does not drop them
+    def import_results(self):
+        if self.imported:
+            return
+        self.imported = True
+        path = os.path.join(self.dir_path, 'Outputs', f"LLMBenchmark_{self.machine}.csv")
+        if not os.path.exists(path) or self.results.query(self.name, machine=self.machine):
+            return
+        with open(path) as csvFile:
+            for row in csv.DictReader(csvFile):
+                row = {key: val for key, val in row.items() if key not in ('machine', 'run_id') and val != ''}
+                params, metrics = self.split_record(row)
+                self.results.add(self.name, params, metrics, run_id='imported')
 
 
     def get_telemetry(self, model_name):
         result = dict()
-        df_power = pd.read_csv(f'{self.dir_path}/Outputs/{model_name}_power.csv' ,on_bad_lines='skip')
-        df_power = df_power[df_power[' utilization.gpu [%]'] != ' 0 %'].reset_index()
+        # only samples where the GPUs were busy, read in chunks so long captures stay in bounded memory
+        stats = telemetry.summarize_power_csv(f'{self.dir_path}/Outputs/{model_name}_power.csv', chunksize=1000000, min_utilization=0)
+        stats = stats.get("all", {})
 
-        memory_used_vals = [0]
-        for i in df_power[' memory.used [MiB]'].tolist():
-            try:
-                memory_used_vals.append(float(i.split()[0]))
-            except:
-                pass
-        max_memory = max(memory_used_vals)
-        avg_memory = sum(memory_used_vals)/len(memory_used_vals)
-
-        memory_total_vals = [0]
-        for i in df_power[' memory.total [MiB]'].tolist():
-            try:
-                memory_total_vals.append(float(i.split()[0]))
-            except:
-                pass
-        total_memory = max(memory_total_vals)
+        result['max_memory_usage'] = round(stats.get('max_memory.used', 0), 1)
+        result['avg_memory_usage'] = round(stats.get('avg_memory.used', 0), 1)
+        result['total_memory_usage'] = stats.get('max_memory.total', 0)
 
-        clocks_current_vals = [0]
-        for i in df_power[' clocks.current.sm [MHz]'].tolist():
-            try:
-                clocks_current_vals.append(float(i.split()[0]))
-            except:
-                pass
-        max_clocks = max(clocks_current_vals)
-        avg_clocks = sum(clocks_current_vals)/ len(clocks_current_vals)
-
-        power_current_vals = [0]
-        for i in df_power[' power.draw [W]'].tolist():
-            try:
-                power_current_vals.append(float(i.split()[0]))
-            except:
-                pass
-        max_power = max(power_current_vals)
-        avg_power = sum(power_current_vals)/ len(power_current_vals)
-
-        power_total_vals = [0]
-        for i in df_power[' enforced.power.limit [W]'].tolist():
-            try:
-                power_total_vals.append(float(i.split()[0]))
-            except:
-                pass
-        total_power = max(power_total_vals)
-
-        result['max_memory_usage'] = round(max_memory, 1)
-        result['avg_memory_usage'] = round(avg_memory, 1)
-        result['total_memory_usage'] = total_memory
+        result['max_clock_speed'] = round(stats.get('max_clocks.current.sm', 0), 1)
+        result['avg_clock_speed'] = round(stats.get('avg_clocks.current.sm', 0), 1)
 
-        result['max_clock_speed'] = round(max_clocks, 1)
-        result['avg_clock_speed'] = round(avg_clocks, 1)
-
-        result['max_power_usage'] = round(max_power, 1)
-        result['avg_power_usage'] = round(avg_power, 1)
-        result['enforces_power_limit'] = total_power
+        result['max_power_usage'] = round(stats.get('max_power.draw', 0), 1)
+        result['avg_power_usage'] = round(stats.get('avg_power.draw', 0), 1)
+        result['enforces_power_limit'] = stats.get('max_enforced.power.limit', 0)
 
         return result
 
 
-    def run_model_sizes(self, model_name, batch_size):
-
-        # if not os.path.isfile(f'Outputs/{model_name}_GEMMCublasLt_Performance_' + self.machine + '_'  + '_'+self.precision+'.csv'):
-
-            model_config_path = f'{self.dir_path}/models/{model_name}/config.json'
-            with open(model_config_path, 'r') as file:
-                model_config = json.load(file)
-            hidden_dim = model_config['hidden_size']
-            intermediate_dim = model_config['intermediate_size']
-
-            kv_dim = (model_config['hidden_size'] * model_config['num_key_value_heads']) / model_config['num_attention_heads']
-            m_dims = [batch_size, batch_size, batch_size, batch_size]
-            n_dims = [hidden_dim, kv_dim, intermediate_dim, hidden_dim]
-            k_dims = [hidden_dim,  hidden_dim, hidden_dim, intermediate_dim]
-            b_dims = [1, 1, 1, 1]
-            os.chdir(f"{self.dir_path}/bin")
-
-            buffer = []
-
-            for i in range(len(m_dims)):
-                # change i, b and w
-                results = subprocess.run(
-                    [
-                        "./cublaslt_gemm",
-                        "-m",
-                        str(m_dims[i]),
-                        "-n",
-                        str(n_dims[i]),
-                        "-k",
-                        str(k_dims[i]),
-                        "-b",
-                        str(b_dims[i]),
-                        "-i",
-                        str(10),
-                        "-w",
-                        str(10),
-                        "-t",
-                        str('fp8e4m3'),
-                    ],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                )
-                log = results.stdout.decode('utf-8').split()
-                buffer.append(log)
-            operation_name = [["Attention: Query Projection"]+buffer[0], ["Attention: Key Projection"]+buffer[1], ["Attention: Value Projection"]+buffer[1], ["Feed Forward: Up projection 1"]+buffer[2], ["Feed Forward: Up projection 2"]+buffer[2], ["Feed Forward: Down Projection"]+buffer[3]]
-
-
-            with open(f'{self.dir_path}/Outputs/{model_name}_GEMMCublasLt_Performance_' + self.machine + '_'  + '_'+self.precision+'.csv', 'a') as csvFile:
-                writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-                writer.writerow(["Operation", "M", "N", "K", "Batch", "Time(us)", "TFLOPS"])
-                for item in operation_name:
-                    writer.writerow(item)
-
-            table = PrettyTable()
-
-            table.field_names = ["Operation", "M", "N", "K", "Batch", "Time(us)", "TFLOPS"]
-            for row in operation_name:
-                table.add_row(row)
-            print(table)
+    # the Hugging Face config.json of a downloaded model
+    def hf_config(self, model_name):
+        with open(f'{self.dir_path}/models/{model_name}/config.json') as file:
+            return json.load(file)
+
+    # cublaslt_gemm datatype of the model's precision, A100 has no fp8
+    def gemm_datatype(self, model_name):
+        if "A100" in self.machine:
+            return "fp16"
+        return transformer.GEMM_DATATYPES.get(self.config['models'][model_name]['precision'], "fp16")
+
+    # every GEMM of the model's transformer blocks (see Infra/transformer.py) at each
+    # configured TP size, batch size and input length, for prefill and decode, run
+    # through cublaslt_gemm on the GPUs of this machine. prints and records the
+    # time of each layer, the GEMM time of a forward pass and the tokens/sec the
+    # GEMMs alone would allow next to the measured tokens/sec
+    def run_model_sizes(self, model_name):
+        model = self.config['models'][model_name]
+        hf_config = self.hf_config(model_name)
+        runner = GEMMCublastLt(self.config_path, self.machine, i=100, w=1000)
+        runner.datatype = self.gemm_datatype(model_name)
+
+        points = []
+        for tp_size in model['tp_sizes']:
+            for batch_size in model['batch_sizes']:
+                for io in model['input_output_sizes']:
+                    input_length, output_length = (int(x) for x in io.split(','))
+                    shapes = {phase: transformer.gemm_shapes(hf_config, batch_size, input_length, tp_size, phase) for phase in ("prefill", "decode")}
+                    points.append((tp_size, batch_size, input_length, output_length, shapes))
+        unique = sorted({(s["m"], s["n"], s["k"]) for point in points for shapes in point[4].values() for s in shapes})
+        print(f"Running {len(unique)} GEMM shapes of {model_name} ({runner.datatype})")
+
+        times = dict()
+        tflops = dict()
+        for (m, n, k), (gpu, log, backend) in zip(unique, runner.run_sharded(unique)):
+            fields = log.split()
+            try:
+                times[(m, n, k)] = float(fields[4])
+                tflops[(m, n, k)] = float(fields[5])
+            except (IndexError, ValueError):
+                print(f"GEMM {m}x{n}x{k} failed: {log.strip()}")
+        runner.stop_workers()
+
+        layers = PrettyTable()
+        layers.field_names = ["TP", "Batch", "Input", "Phase", "Layer", "M", "N", "K", "Count", "Time(us)", "TFLOPS", "Total(us)"]
+        summary = PrettyTable()
+        summary.field_names = ["TP", "Batch", "Input", "Output", "Prefill GEMMs (ms)", "Decode GEMMs per token (ms)", "GEMM-bound tokens/sec", "Measured tokens/sec", "GEMM share"]
+        for tp_size, batch_size, input_length, output_length, shapes in points:
+            if any((s["m"], s["n"], s["k"]) not in times for phase in shapes.values() for s in phase):
+                continue
+            params = {'model_name': model_name, 'world_size': tp_size, 'batch_size': batch_size,
+                      'input_length': input_length, 'output_length': output_length, 'datatype': runner.datatype}
+            for phase in shapes.values():
+                for s in phase:
+                    shape = (s["m"], s["n"], s["k"])
+                    total = times[shape] * s["count"]
+                    layers.add_row([tp_size, batch_size, input_length, s["phase"], s["layer"], s["m"], s["n"], s["k"], s["count"], times[shape], tflops[shape], round(total, 1)])
+                    self.results.add(self.name + '_gemms', dict(params, phase=s["phase"], layer=s["layer"], m=s["m"], n=s["n"], k=s["k"], count=s["count"]),
+                                     {'time_us': times[shape], 'tflops': tflops[shape], 'total_us': total})
+            prefill = transformer.forward_time(shapes["prefill"], times)
+            decode = transformer.forward_time(shapes["decode"], times)
+            bound = transformer.gemm_tokens_per_sec(batch_size, output_length, prefill, decode)
+            metrics = {'prefill_gemm_ms': round(prefill / 1000, 3), 'decode_gemm_ms': round(decode / 1000, 3), 'gemm_tokens_per_sec': round(bound, 2)}
+            # share of the measured time the GEMMs account for, communication,
+            # attention and everything else is the rest
+            measured = [r['metrics'].get('tokens_per_sec') for r in self.results.query(self.name, machine=self.machine, model_name=model_name, world_size=tp_size,
+                                                                                       batch_size=batch_size, input_length=input_length, output_length=output_length)]
+            measured = [m for m in measured if m]
+            if measured:
+                metrics['tokens_per_sec'] = measured[-1]
+                metrics['gemm_share'] = round(measured[-1] / bound, 3)
+            self.results.add(self.name + '_gemm_summary', params, metrics)
+            summary.add_row([tp_size, batch_size, input_length, output_length, metrics['prefill_gemm_ms'], metrics['decode_gemm_ms'],
+                             metrics['gemm_tokens_per_sec'], metrics.get('tokens_per_sec'), metrics.get('gemm_share')])
+        print(layers)
+        print(summary)
+        self.results.export_csv(os.path.join(self.dir_path, 'Outputs', f"{model_name}_GEMMs_{self.machine}.csv"), self.name + '_gemms', machine=self.machine, model_name=model_name)
+        self.results.export_csv(os.path.join(self.dir_path, 'Outputs', f"{model_name}_GEMM_summary_{self.machine}.csv"), self.name + '_gemm_summary', machine=self.machine, model_name=model_name)
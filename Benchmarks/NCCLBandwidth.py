@@ -1,27 +1,68 @@
 import json
 import os
-import csv 
+import csv
 import matplotlib.pyplot as plt
-import matplotlib.ticker as ticker
 import numpy as np
-from matplotlib.ticker import FormatStrFormatter
+import shutil
 import subprocess
 import time
-import csv
-import numpy as np
-import torch
 from prettytable import PrettyTable
+from Infra import tools
+from Infra.build_cache import BuildCache
+from Infra.results_store import ResultsStore
+
+# algorithms each collective is run with by default, "default" leaves NCCL_ALGO unset.
+# alltoall is point-to-point and has no algorithm to choose
+ALGORITHMS = {
+    "all_reduce": ["Tree", "Ring", "NVLS", "NVLSTree"],
+    "all_gather": ["Ring", "NVLS"],
+    "reduce_scatter": ["Ring", "NVLS"],
+    "alltoall": ["default"],
+    "broadcast": ["Ring"],
+}
+
+# names the NCCL example tuner plugin (ext-tuner/example) uses in its config file
+TUNER_COLLECTIVES = {"all_reduce": "allreduce", "all_gather": "allgather", "reduce_scatter": "reducescatter",
+                     "broadcast": "broadcast", "reduce": "reduce"}
+TUNER_ALGORITHMS = {"Tree": "tree", "Ring": "ring", "CollnetDirect": "collnet_direct", "CollnetChain": "collnet_chain",
+                    "NVLS": "nvls", "NVLSTree": "nvls_tree", "PAT": "pat"}
+TUNER_PROTOCOLS = {"LL": "ll", "LL128": "ll128", "Simple": "simple"}
+
+# a tuning setting is (algorithm, protocol, channels), None leaves it to NCCL
+DEFAULT_SETTING = (None, None, None)
+
+
+# 1024 -> "1K", 3 << 20 -> "3M"
+def size_label(size: int) -> str:
+    for unit, shift in (("G", 30), ("M", 20), ("K", 10)):
+        if size >= 1 << shift and size % (1 << shift) == 0:
+            return f"{size >> shift}{unit}"
+    return str(size)
 
 
 class NCCLBandwidth:
     def __init__(self, path:str, machine: str):
-        
+
         self.name='NCCLBandwidth'
         self.machine_name = machine
+        self.root = os.getcwd()
+        self.build_path = os.path.join(self.root, 'nccl-tests')
         config = self.get_config(path)
+        # where the *_perf binaries are, another directory runs stand-ins for testing
+        self.binaries = config['inputs'].get('binaries') or os.path.join(self.build_path, 'build')
         self.start, self.end, self.num_gpus = self.config_conversion(config)
-        self.buffer = []
-    
+        self.collectives = config['inputs'].get('collectives', ["all_reduce"])
+        self.algorithms = dict(ALGORITHMS, **config['inputs'].get('algorithms', {}))
+        self.step_factor = config['inputs'].get('step_factor', 2)
+        self.iters = config['inputs'].get('iters', 40)
+        self.curves = {}
+        self.tuning = config['inputs'].get('tuning', {})
+        self.tuned = {}
+        self.overall = {}
+        self.multinode = config['inputs'].get('multinode', {})
+        self.scaling = {}
+        self.nodes = []
+
     def get_config(self, path: str):
         file = open(path)
         data = json.load(file)
@@ -33,87 +74,477 @@ class NCCLBandwidth:
 
     def parse_json(self, config):
         return config['inputs']['start'], config['inputs']['end'], config['inputs']['num_gpus']
-    
+
 
     def config_conversion(self, config)->tuple[list, list, list]:
         return self.parse_json(config)
-        
+
     def build(self):
-        current = os.getcwd()
-        
-        path ='nccl-tests'
+        path = self.build_path
         isdir = os.path.isdir(path)
         if not isdir:
             results = subprocess.run(['git', 'clone', 'https://github.com/NVIDIA/nccl-tests.git', path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            build_path = os.path.join(current, 'nccl-tests')
-            os.chdir(build_path)
-            results = subprocess.run(['make'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            print(results.stderr.decode('utf-8')) 
-        else:
-            build_path = os.path.join(current, 'nccl-tests')
-            os.chdir(build_path)
-      
-
-
-    def run(self): 
-        current = os.getcwd()
-        start = torch.cuda.Event(enable_timing=True)
-        end = torch.cuda.Event(enable_timing=True)
-        
-        buffer=[["8 ","16 ","32 ","64 ","128 ","256 ","512 ","1K","2K","4K","8K","16K","32K","65K","132K","256K", "524K","1M","2M","4M","8M","16M","33M","67M","134M","268M","536M","1G","2G","4G","8G"]]
-        runs = ["Tree", "Ring", "NVLS", "NVLSTree"]
-
-        print("Running NCCL AllReduce...")
-        for run in runs:
-            start.record()
-            results = subprocess.run('NCCL_ALGO='+ run +' ./build/all_reduce_perf -b 8 -e 8G -f 2 -g 8 -n 40 | grep float', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        make = ['make']
+        # one rank per GPU across nodes needs the MPI build
+        if self.multinode.get('hostfile'):
+            mpi_home = self.multinode.get('mpi_home') or os.path.dirname(os.path.dirname(shutil.which(self.multinode.get('mpirun', 'mpirun')) or '/usr/bin/mpirun'))
+            make += ['MPI=1', 'MPI_HOME=' + mpi_home]
+        cache = BuildCache(self.name, path, tools.gpu_arch(self.machine_name), make)
+        if not cache.fetch(self.build_path):
+            results = subprocess.run(make, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.build_path)
             print(results.stderr.decode('utf-8'))
-            end.record()
-            torch.cuda.synchronize()
-            res = results.stdout.decode('utf-8').split('\n')
-            log = []
-            for line in res:
-                line = line.split()
-                if len(line) == 13:
-                    log.append(line[11])
-            
-            buffer.append(log)
-        
-        table1 = PrettyTable()
-        runs = ["Message Size", "Tree", "Ring", "NVLS", "NVLSTree"]
-
-        for i in range(len(buffer)):
-            table1.add_column(runs[i], buffer[i])
-        
-        print(table1)
-        
-        
-        self.buffer=buffer
+            cache.store(self.build_path, ['build/*_perf'])
+
+    # nccl-tests command for collective, run through launcher (e.g. mpirun) if given.
+    # sizes grow by factor, or by increment bytes if given
+    def command(self, collective, start=None, end=None, factor=None, num_gpus=None, launcher=None, increment=None):
+        step = ['-f', '1', '-i', str(increment)] if increment else ['-f', str(factor or self.step_factor)]
+        return (launcher or []) + [os.path.join(self.binaries, collective + '_perf'),
+                                   '-b', str(start or self.start), '-e', str(end or self.end)] + step + [
+                                   '-g', str(num_gpus or self.num_gpus), '-n', str(self.iters)]
+
+    # runs one nccl-tests binary with the NCCL settings in env (e.g. NCCL_ALGO),
+    # returns the parsed rows and how long it took
+    def run_collective(self, collective, env=None, **kwargs):
+        env = env or {}
+        began = time.monotonic()
+        results = subprocess.run(self.command(collective, **kwargs), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 cwd=self.root, env=dict(os.environ, **env))
+        if results.returncode != 0:
+            print(f"{collective} {env} failed: {results.stderr.decode('utf-8')}")
+        return self.parse_output(results.stdout.decode('utf-8')), time.monotonic() - began
+
+    # the result rows nccl-tests prints, one per message size:
+    #   size count type redop root | time algbw busbw #wrong (out-of-place) | time algbw busbw #wrong (in-place)
+    # as dicts of typed fields, in-place fields unprefixed and out-of-place ones with
+    # an oop_ prefix. older nccl-tests print no redop/root for some collectives,
+    # #wrong is N/A without data checks
+    def parse_output(self, output):
+        records = []
+        for line in output.split('\n'):
+            fields = line.split()
+            if len(fields) < 11 or line.lstrip().startswith('#') or not fields[0].isdigit():
+                continue
+            head, oop, inplace = fields[:-8], fields[-8:-4], fields[-4:]
+            try:
+                record = {'size_bytes': int(head[0]), 'count': int(head[1]), 'type': head[2]}
+                if len(head) > 4:
+                    record['redop'] = head[3]
+                record['root'] = int(head[-1]) if len(head) > 3 else -1
+                for prefix, group in (('oop_', oop), ('', inplace)):
+                    record[prefix + 'time_us'] = float(group[0])
+                    record[prefix + 'algbw_gbps'] = float(group[1])
+                    record[prefix + 'busbw_gbps'] = float(group[2])
+                    record[prefix + 'wrong'] = int(group[3]) if group[3].isdigit() else None
+            except ValueError:
+                continue
+            records.append(record)
+        return records
+
+    # adds parsed rows to the store. what describes the measurement is a param, the
+    # numbers are metrics; busbw_gbps is the in-place bus bandwidth, like before
+    def record(self, store, collective, algo, records, extra=None, benchmark=None):
+        for r in records:
+            params = dict({'collective': collective, 'algo': algo, 'size_bytes': r['size_bytes'], 'count': r['count'], 'num_gpus': self.num_gpus,
+                           'type': r['type'], 'redop': r.get('redop'), 'root': r['root']}, **(extra or {}))
+            metrics = {key: val for key, val in r.items() if key not in ('size_bytes', 'count', 'type', 'redop', 'root')}
+            store.add(benchmark or self.name, params, metrics)
+
+    # runs every configured collective with each of its algorithms over the configured
+    # size range, keeping a busbw and latency curve per collective and algorithm
+    def run(self):
+        store = ResultsStore(os.path.join(self.root, 'Outputs', 'results.db'), self.machine_name)
+        self.curves = {}
+        for collective in self.collectives:
+            for algo in self.algorithms.get(collective, ["default"]):
+                print(f"Running NCCL {collective} ({algo})...")
+                env = {} if algo == "default" else {'NCCL_ALGO': algo}
+                records, duration = self.run_collective(collective, env)
+                self.record(store, collective, algo, records)
+                self.curves[(collective, algo)] = records
+                print(f"{len(records)} sizes in {duration:.0f}s")
+
+        for collective in self.collectives:
+            table1 = PrettyTable()
+            table1.title = f"{collective} busbw (GB/s)"
+            algos = [a for a in self.algorithms.get(collective, ["default"]) if self.curves.get((collective, a))]
+            if not algos:
+                continue
+            sizes = sorted({r['size_bytes'] for a in algos for r in self.curves[(collective, a)]})
+            table1.add_column("Message Size", [size_label(s) for s in sizes])
+            for algo in algos:
+                busbw = {r['size_bytes']: r['busbw_gbps'] for r in self.curves[(collective, algo)]}
+                table1.add_column(algo, [busbw.get(s) for s in sizes])
+            print(table1)
+
         self.save()
-        os.chdir(current)
+        self.plot()
 
+    # busbw and in-place latency against message size, one plot per collective
     def plot(self):
-        x = np.arange(len(self.buffer[0][12:]))
-        y1 = np.array(self.buffer[1]).astype(float)[12:]
-        y2 = np.array(self.buffer[2]).astype(float)[12:]
-        y3 = np.array(self.buffer[3]).astype(float)[12:]
-        y4 = np.array(self.buffer[4]).astype(float)[12:]
-        width = 0.8
-        widt = 0.2
-        
-        plt.bar(x-width, y1, widt) 
-        plt.bar(x, y2, widt) 
-        plt.bar(x+width, y3, widt) 
-        plt.bar(x+(2*width), y4, widt)
-        plt.bar(x+(3*width), 0, widt) 
-        plt.savefig("../Outputs/NCCLres.png")
-        self.save()
+        for collective in self.collectives:
+            algos = [a for a in self.algorithms.get(collective, ["default"]) if self.curves.get((collective, a))]
+            if not algos:
+                continue
+            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+            for algo in algos:
+                records = self.curves[(collective, algo)]
+                sizes = np.array([r['size_bytes'] for r in records])
+                ax1.plot(sizes, [r['busbw_gbps'] for r in records], marker='.', label=algo)
+                ax2.plot(sizes, [r['time_us'] for r in records], marker='.', label=algo)
+            for ax, label in ((ax1, "Bus bandwidth (GB/s)"), (ax2, "Time (us)")):
+                ax.set_xscale('log', base=2)
+                ax.set_xlabel("Message size (bytes)")
+                ax.set_ylabel(label)
+                ax.grid(True)
+                ax.legend()
+            ax2.set_yscale('log')
+            fig.suptitle(f"NCCL {collective}, {self.num_gpus} GPUs")
+            plt.savefig(os.path.join(self.root, "Outputs", f"NCCLBandwidth_{collective}_{self.machine_name}.png"), bbox_inches="tight")
+            plt.close(fig)
 
+    # one CSV row per collective, algorithm and size with every parsed field, and
+    # NCCLBandwidth_<machine>.csv with the all_reduce busbw per algorithm as before
     def save(self):
-        with open('../Outputs/NCCLBandwidth_' + self.machine_name + '.csv', 'w') as csvFile:
+        columns = ['size_bytes', 'count', 'type', 'redop', 'root', 'oop_time_us', 'oop_algbw_gbps', 'oop_busbw_gbps', 'oop_wrong',
+                   'time_us', 'algbw_gbps', 'busbw_gbps', 'wrong']
+        with open(os.path.join(self.root, 'Outputs', 'NCCLBandwidth_collectives_' + self.machine_name + '.csv'), 'w') as csvFile:
+            writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(['collective', 'algo', 'num_gpus'] + columns)
+            for (collective, algo), records in self.curves.items():
+                for r in records:
+                    writer.writerow([collective, algo, self.num_gpus] + [r.get(c) for c in columns])
+
+        algos = [a for a in self.algorithms.get('all_reduce', []) if self.curves.get(('all_reduce', a))]
+        if not algos:
+            return
+        sizes = sorted({r['size_bytes'] for a in algos for r in self.curves[('all_reduce', a)]})
+        with open(os.path.join(self.root, 'Outputs', 'NCCLBandwidth_' + self.machine_name + '.csv'), 'w') as csvFile:
+            writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(["Message Size"] + algos)
+            busbw = {a: {r['size_bytes']: r['busbw_gbps'] for r in self.curves[('all_reduce', a)]} for a in algos}
+            for size in sizes:
+                writer.writerow([size_label(size)] + [busbw[a].get(size) for a in algos])
+
+    # NCCL_ALGO, NCCL_PROTO and channel count environment of a tuning setting
+    def setting_env(self, setting):
+        algo, proto, channels = setting
+        env = {}
+        if algo:
+            env['NCCL_ALGO'] = algo
+        if proto:
+            env['NCCL_PROTO'] = proto
+        if channels:
+            env['NCCL_MIN_NCHANNELS'] = env['NCCL_MAX_NCHANNELS'] = str(channels)
+        return env
+
+    def setting_label(self, setting):
+        if setting == DEFAULT_SETTING:
+            return "default"
+        algo, proto, channels = setting
+        return "/".join([algo or "any", proto or "any"] + ([f"{channels}ch"] if channels else []))
+
+    # runs collective with setting over the sizes the kwargs of command() give, adds the
+    # in-place latency per size to measured[setting] and the rows to the store
+    def measure_setting(self, store, measured, collective, setting, **kwargs):
+        records, duration = self.run_collective(collective, self.setting_env(setting), **kwargs)
+        algo, proto, channels = setting
+        self.record(store, collective, algo or "default", records, {'proto': proto or "default", 'channels': channels or 0},
+                    benchmark=self.name + '_tuning')
+        measured.setdefault(setting, {}).update({r['size_bytes']: r['time_us'] for r in records})
+        print(f"{collective} {self.setting_label(setting)}: {len(records)} sizes in {duration:.0f}s")
+
+    # the settings of candidates that are within margin of the fastest setting
+    # measured at some size. the rest is dominated everywhere and not run again
+    def prune(self, measured, candidates, margin):
+        best = {}
+        for times in measured.values():
+            for size, t in times.items():
+                best[size] = min(best.get(size, t), t)
+        return [s for s in candidates if any(t <= best[size] * (1 + margin) for size, t in measured.get(s, {}).items())]
+
+    # fastest setting at every size all of settings were measured at
+    def winners(self, measured, settings):
+        sizes = set.intersection(*(set(measured[s]) for s in settings))
+        return [(size, min(settings, key=lambda s: measured[s][size])) for size in sorted(sizes)]
+
+    # Searches NCCL_ALGO x NCCL_PROTO x channel count settings for the fastest one at
+    # each message size of every collective to tune:
+    #   1. every algorithm and protocol over the size range, with NCCL's channel count
+    #   2. the channel counts of the algorithm/protocol pairs that are not dominated
+    #   3. between neighbouring sizes where the fastest setting changes, refine_points
+    #      sizes in between for the settings still in the running, refine_levels times
+    # after each step settings more than prune_margin slower than the fastest one at
+    # every size are dropped. The winners are merged into size buckets and written as
+    # a table, an NCCL example tuner plugin config and an environment file.
+    def tune(self):
+        store = ResultsStore(os.path.join(self.root, 'Outputs', 'results.db'), self.machine_name)
+        margin = self.tuning.get('prune_margin', 0.25)
+        protocols = self.tuning.get('protocols', ["LL", "LL128", "Simple"])
+        channel_counts = self.tuning.get('channels', [4, 8, 16, 32])
+        self.tuned = {}
+        self.overall = {}
+        for collective in self.tuning.get('collectives', ["all_reduce"]):
+            algos = [a for a in self.algorithms.get(collective, []) if a != "default"]
+            if not algos:
+                print(f"{collective} has no algorithm to tune")
+                continue
+            measured = {}
+            for setting in [DEFAULT_SETTING] + [(a, p, None) for a in algos for p in protocols]:
+                self.measure_setting(store, measured, collective, setting)
+            settings = self.prune(measured, [s for s in measured if s != DEFAULT_SETTING], margin)
+
+            for algo, proto, _ in list(settings):
+                for channels in channel_counts:
+                    self.measure_setting(store, measured, collective, (algo, proto, channels))
+            settings = self.prune(measured, [s for s in measured if s != DEFAULT_SETTING], margin)
+            if not settings:
+                print(f"{collective}: no setting ran")
+                continue
+
+            for _ in range(self.tuning.get('refine_levels', 2)):
+                points = self.tuning.get('refine_points', 3)
+                best = self.winners(measured, settings + [DEFAULT_SETTING])
+                intervals = []
+                for (lo, a), (hi, b) in zip(best, best[1:]):
+                    # nccl-tests rounds sizes to whole elements per rank
+                    increment = (hi - lo) // (points + 1) // 256 * 256
+                    if a != b and increment:
+                        intervals.append((lo + increment, hi - increment, increment))
+                if not intervals:
+                    break
+                for start, end, increment in intervals:
+                    for setting in settings + [DEFAULT_SETTING]:
+                        self.measure_setting(store, measured, collective, setting, start=start, end=end, increment=increment)
+                settings = self.prune(measured, settings, margin)
+
+            self.tuned[collective] = self.buckets(measured, settings)
+            # one setting for all sizes, the one that is furthest from the winners least
+            best = self.winners(measured, settings)
+            self.overall[collective] = min(settings, key=lambda s: sum(np.log(measured[s][size] / measured[w][size]) for size, w in best))
+
+        if not self.tuned:
+            return
+        self.print_tuning()
+        self.save_tuning()
+
+    # winners merged into size ranges: (min_bytes, max_bytes, setting, sizes measured,
+    # speedup over NCCL's own choice). ranges meet halfway (geometrically) between the
+    # last size of one winner and the first of the next, the last one is open ended
+    def buckets(self, measured, settings):
+        best = self.winners(measured, settings + [DEFAULT_SETTING])
+        groups = []
+        for size, setting in best:
+            if groups and groups[-1][0] == setting:
+                groups[-1][1].append(size)
+            else:
+                groups.append((setting, [size]))
+        result = []
+        low = 0
+        for i, (setting, sizes) in enumerate(groups):
+            high = int(np.ceil(np.sqrt(sizes[-1] * groups[i + 1][1][0]))) - 1 if i + 1 < len(groups) else (1 << 63) - 1
+            speedup = np.exp(np.mean([np.log(measured[DEFAULT_SETTING][s] / measured[setting][s]) for s in sizes]))
+            result.append((low, high, setting, len(sizes), round(float(speedup), 3)))
+            low = high + 1
+        return result
+
+    def print_tuning(self):
+        for collective, buckets in self.tuned.items():
+            table = PrettyTable()
+            table.title = f"{collective} tuned settings"
+            table.field_names = ["Min Size", "Max Size", "Algorithm", "Protocol", "Channels", "Sizes", "Speedup vs default"]
+            for low, high, (algo, proto, channels), sizes, speedup in buckets:
+                table.add_row([size_label(low), "inf" if high == (1 << 63) - 1 else size_label(high), algo or "default",
+                               proto or "default", channels or "default", sizes, speedup])
+            print(table)
+            if collective in self.overall:
+                print(f"{collective} best single setting: {self.setting_label(self.overall[collective])}")
+
+    # NCCLBandwidth_tuned_<machine>.csv with the size buckets, nccl_tuner_<machine>.conf
+    # for the NCCL example tuner plugin (NCCL_TUNER_CONFIG_FILE) and
+    # nccl_tuning_<machine>.env with the NCCL environment LLM runs take (nccl_env of
+    # LLMBenchmark): the plugin and its config if tuner_plugin is set, otherwise the
+    # all_reduce setting that is best over all sizes
+    def save_tuning(self):
+        outputs = os.path.join(self.root, 'Outputs')
+        with open(os.path.join(outputs, 'NCCLBandwidth_tuned_' + self.machine_name + '.csv'), 'w') as csvFile:
             writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            
-            for i in range(len(self.buffer[0])):
-                row = [self.buffer[0][i], self.buffer[1][i], self.buffer[2][i], self.buffer[3][i], self.buffer[4][i]]  
-                writer.writerow(row)
-    
+            writer.writerow(['collective', 'num_gpus', 'min_bytes', 'max_bytes', 'algo', 'proto', 'channels', 'sizes', 'speedup'])
+            for collective, buckets in self.tuned.items():
+                for low, high, (algo, proto, channels), sizes, speedup in buckets:
+                    writer.writerow([collective, self.num_gpus, low, high, algo or "default", proto or "default", channels or 0, sizes, speedup])
+
+        conf = os.path.join(outputs, 'nccl_tuner_' + self.machine_name + '.conf')
+        with open(conf, 'w') as f:
+            f.write("# collective_type,min_bytes,max_bytes,algorithm,protocol,channels,nNodes,nRanks,numPipeOps,regBuff\n")
+            for collective, buckets in self.tuned.items():
+                if collective not in TUNER_COLLECTIVES:
+                    continue
+                for low, high, (algo, proto, channels), _, _ in buckets:
+                    # where NCCL's own choice wins there is nothing to override
+                    if algo is None:
+                        continue
+                    f.write(f"{TUNER_COLLECTIVES[collective]},{low},{high},{TUNER_ALGORITHMS.get(algo, algo.lower())},"
+                            f"{TUNER_PROTOCOLS.get(proto, proto.lower())},{channels or -1},1,{self.num_gpus},-1,-1\n")
+
+        env = {}
+        if self.tuning.get('tuner_plugin'):
+            env = {'NCCL_TUNER_PLUGIN': self.tuning['tuner_plugin'], 'NCCL_TUNER_CONFIG_FILE': conf}
+        elif 'all_reduce' in self.overall:
+            env = self.setting_env(self.overall['all_reduce'])
+        with open(os.path.join(outputs, 'nccl_tuning_' + self.machine_name + '.env'), 'w') as f:
+            for key, val in env.items():
+                f.write(f"{key}={val}\n")
+
+    # host names of an MPI hostfile ("host slots=8" lines, # comments)
+    def read_hostfile(self, path):
+        hosts = []
+        with open(path) as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if line:
+                    hosts.append(line.split()[0])
+        return hosts
+
+    # mpirun starting one rank per GPU on each of hosts
+    def launcher(self, hosts, gpus_per_node):
+        return [self.multinode.get('mpirun', 'mpirun'), '--allow-run-as-root', '--bind-to', 'none',
+                '-np', str(len(hosts) * gpus_per_node), '-H', ','.join(f"{host}:{gpus_per_node}" for host in hosts)] + self.multinode.get('mpirun_args', [])
+
+    # runs collective across hosts, one GPU per rank, and adds the rows to the store
+    def run_group(self, store, collective, hosts, gpus_per_node):
+        records, duration = self.run_collective(collective, launcher=self.launcher(hosts, gpus_per_node), num_gpus=1)
+        self.record(store, collective, "default", records,
+                    {'nodes': len(hosts), 'hosts': ','.join(hosts), 'gpus_per_node': gpus_per_node, 'num_gpus': len(hosts) * gpus_per_node},
+                    benchmark=self.name + '_multinode')
+        print(f"{collective} on {len(hosts)} nodes ({', '.join(hosts)}): {len(records)} sizes in {duration:.0f}s")
+        return records
+
+    # mean busbw of the large messages (the top 1/16 of the size range), where
+    # bandwidth and not latency decides
+    def large_busbw(self, records):
+        if not records:
+            return None
+        largest = max(r['size_bytes'] for r in records)
+        return float(np.mean([r['busbw_gbps'] for r in records if r['size_bytes'] * 16 >= largest]))
+
+    # busbw of n nodes over the single node busbw at each size
+    def efficiency(self, collective, nodes):
+        single = {r['size_bytes']: r['busbw_gbps'] for r in self.scaling.get((collective, 1), [])}
+        return {r['size_bytes']: r['busbw_gbps'] / single[r['size_bytes']] for r in self.scaling.get((collective, nodes), [])
+                if single.get(r['size_bytes'])}
+
+    # Finds the nodes that pull a group down. nccl-tests only reports times of the
+    # whole group, so every node runs collective alone (its GPUs and NVLink) and
+    # paired with the fastest node (its network). Nodes more than slow_threshold
+    # below the median of either are flagged.
+    def check_nodes(self, store, collective, hosts, gpus_per_node):
+        threshold = self.multinode.get('slow_threshold', 0.1)
+        alone = {host: self.large_busbw(self.run_group(store, collective, [host], gpus_per_node)) for host in hosts}
+        ran = [h for h in hosts if alone[h] is not None]
+        paired = {}
+        if len(ran) > 1:
+            reference = max(ran, key=lambda h: alone[h])
+            for host in ran:
+                if host != reference:
+                    paired[host] = self.large_busbw(self.run_group(store, collective, [reference, host], gpus_per_node))
+        median_alone = np.median([alone[h] for h in ran]) if ran else None
+        pairs = [bw for bw in paired.values() if bw is not None]
+        median_paired = np.median(pairs) if pairs else None
+        rows = []
+        for host in hosts:
+            flags = []
+            if alone[host] is None:
+                flags.append("failed")
+            elif alone[host] < median_alone * (1 - threshold):
+                flags.append("slow node")
+            if paired.get(host) is not None and paired[host] < median_paired * (1 - threshold):
+                flags.append("slow network")
+            rows.append({'host': host, 'node_busbw_gbps': alone[host], 'pair_busbw_gbps': paired.get(host), 'flag': ", ".join(flags)})
+        return rows
+
+    # Runs the collectives of the multinode config on 1, 2, 4... nodes of the hostfile
+    # through mpirun, one rank per GPU, and reports the busbw scaling efficiency against
+    # the single node curve and (check_nodes) the nodes that are slower than the rest.
+    # Works on one machine with a hostfile that lists localhost and stand-in
+    # binaries in binaries.
+    def run_multinode(self):
+        store = ResultsStore(os.path.join(self.root, 'Outputs', 'results.db'), self.machine_name)
+        hosts = self.read_hostfile(self.multinode['hostfile'])
+        gpus_per_node = self.multinode.get('gpus_per_node', self.num_gpus)
+        collectives = self.multinode.get('collectives', ["all_reduce"])
+        self.scaling = {}
+        for collective in collectives:
+            for nodes in self.multinode.get('node_counts', [1, 2, 4]):
+                if nodes > len(hosts):
+                    print(f"{nodes} nodes: only {len(hosts)} in {self.multinode['hostfile']}")
+                    continue
+                self.scaling[(collective, nodes)] = self.run_group(store, collective, hosts[:nodes], gpus_per_node)
+        self.nodes = self.check_nodes(store, collectives[0], hosts, gpus_per_node) if self.multinode.get('check_nodes', True) else []
+
+        for collective in collectives:
+            counts = [n for c, n in self.scaling if c == collective and self.scaling[(c, n)]]
+            if not counts:
+                continue
+            table1 = PrettyTable()
+            table1.title = f"{collective} busbw (GB/s) and efficiency against 1 node"
+            sizes = sorted({r['size_bytes'] for n in counts for r in self.scaling[(collective, n)]})
+            table1.add_column("Message Size", [size_label(s) for s in sizes])
+            for nodes in counts:
+                busbw = {r['size_bytes']: r['busbw_gbps'] for r in self.scaling[(collective, nodes)]}
+                efficiency = self.efficiency(collective, nodes)
+                table1.add_column(f"{nodes} nodes", [busbw.get(s) for s in sizes])
+                if nodes != 1:
+                    table1.add_column(f"{nodes} nodes eff.", [round(efficiency[s], 3) if s in efficiency else None for s in sizes])
+            print(table1)
+        if self.nodes:
+            table2 = PrettyTable()
+            table2.field_names = ["Host", "Alone busbw (GB/s)", "Paired busbw (GB/s)", "Flag"]
+            for r in self.nodes:
+                table2.add_row([r['host'], r['node_busbw_gbps'], r['pair_busbw_gbps'], r['flag']])
+            print(table2)
+
+        self.save_multinode()
+        self.plot_multinode()
+
+    # NCCLBandwidth_scaling_<machine>.csv with busbw and efficiency per node count and
+    # size, NCCLBandwidth_nodes_<machine>.csv with the node check
+    def save_multinode(self):
+        outputs = os.path.join(self.root, 'Outputs')
+        with open(os.path.join(outputs, 'NCCLBandwidth_scaling_' + self.machine_name + '.csv'), 'w') as csvFile:
+            writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(['collective', 'nodes', 'size_bytes', 'time_us', 'busbw_gbps', 'efficiency'])
+            for (collective, nodes), records in self.scaling.items():
+                efficiency = self.efficiency(collective, nodes)
+                for r in records:
+                    writer.writerow([collective, nodes, r['size_bytes'], r['time_us'], r['busbw_gbps'], efficiency.get(r['size_bytes'])])
+        if self.nodes:
+            with open(os.path.join(outputs, 'NCCLBandwidth_nodes_' + self.machine_name + '.csv'), 'w') as csvFile:
+                writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                writer.writerow(['host', 'node_busbw_gbps', 'pair_busbw_gbps', 'flag'])
+                for r in self.nodes:
+                    writer.writerow([r['host'], r['node_busbw_gbps'], r['pair_busbw_gbps'], r['flag']])
+
+    # busbw and efficiency against message size per node count, one plot per collective
+    def plot_multinode(self):
+        for collective in {c for c, _ in self.scaling}:
+            counts = [n for c, n in self.scaling if c == collective and self.scaling[(c, n)]]
+            if not counts:
+                continue
+            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
+            for nodes in counts:
+                records = self.scaling[(collective, nodes)]
+                ax1.plot([r['size_bytes'] for r in records], [r['busbw_gbps'] for r in records], marker='.', label=f"{nodes} nodes")
+                efficiency = sorted(self.efficiency(collective, nodes).items())
+                if nodes != 1 and efficiency:
+                    ax2.plot([s for s, _ in efficiency], [e for _, e in efficiency], marker='.', label=f"{nodes} nodes")
+            for ax, label in ((ax1, "Bus bandwidth (GB/s)"), (ax2, "Efficiency against 1 node")):
+                ax.set_xscale('log', base=2)
+                ax.set_xlabel("Message size (bytes)")
+                ax.set_ylabel(label)
+                ax.grid(True)
+                if ax.get_legend_handles_labels()[0]:
+                    ax.legend()
+            fig.suptitle(f"NCCL {collective} scaling, {self.multinode.get('gpus_per_node', self.num_gpus)} GPUs per node")
+            plt.savefig(os.path.join(self.root, "Outputs", f"NCCLBandwidth_scaling_{collective}_{self.machine_name}.png"), bbox_inches="tight")
+            plt.close(fig)
@@ -1,16 +1,20 @@
 import json
 import subprocess
 import os
-import torch
 import time
 import statistics
 import numpy as np
+from Infra import tools
+from Infra.build_cache import BuildCache
+from Infra.results_store import ResultsStore
 
 class NVBandwidth:
     def __init__(self, path:str, machine: str):
         
         self.name='NVBandwidth'
         self.machine_name = machine
+        self.root = os.getcwd()
+        self.build_path = os.path.join(self.root, 'nvbandwidth')
         config = self.get_config(path)
         self.num_runs, self.interval = self.config_conversion(config)
 
@@ -33,49 +37,80 @@ class NVBandwidth:
         return self.parse_json(config)
         
     def build(self):
-        current = os.getcwd()
-        
-        path ='nvbandwidth'
+        path = self.build_path
         isdir = os.path.isdir(path)
         if not isdir:
             results = subprocess.run(['git', 'clone', 'https://github.com/NVIDIA/nvbandwidth', path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         
-        build_path = os.path.join(current, 'nvbandwidth')
-        os.chdir(build_path)
-        results = subprocess.run(['sed', '-i', '2i\set(CMAKE_CUDA_COMPILER /usr/local/cuda/bin/nvcc)', 'CMakeLists.txt'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        results = subprocess.run(['sudo', './debian_install.sh'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        build_path = self.build_path
+        cache = BuildCache(self.name, build_path, tools.gpu_arch(self.machine_name), ['debian_install.sh', 'CMAKE_CUDA_COMPILER=/usr/local/cuda/bin/nvcc'])
+        if cache.fetch(build_path):
+            return
+
+        # only patch CMakeLists.txt once, reruns used to add the line again every time
+        with open(os.path.join(build_path, 'CMakeLists.txt')) as f:
+            patched = 'set(CMAKE_CUDA_COMPILER /usr/local/cuda/bin/nvcc)' in f.read()
+        if not patched:
+            results = subprocess.run(['sed', '-i', '2i\set(CMAKE_CUDA_COMPILER /usr/local/cuda/bin/nvcc)', 'CMakeLists.txt'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=build_path)
+        results = subprocess.run(['sudo', './debian_install.sh'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=build_path)
         print(results.stderr.decode('utf-8'))          
-        os.chdir(current)
+        cache.store(build_path, ['nvbandwidth'])
 
     def run(self): 
-        current = os.getcwd()
-        os.chdir(os.path.join(current, 'nvbandwidth'))
         print("Running NVBandwidth...")
  
         buffer=[]
             
-        results = subprocess.run('./nvbandwidth -t device_to_device_bidirectional_memcpy_read_sm | grep -A 11 "Running device_to_device_bidirectional_memcpy_read_sm."', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        results = subprocess.run('./nvbandwidth -t device_to_device_bidirectional_memcpy_read_sm | grep -A 11 "Running device_to_device_bidirectional_memcpy_read_sm."', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.build_path)
         log = results.stdout.decode('utf-8')
         print(results.stderr.decode('utf-8')) 
         buffer.append(log)
         
-        results = subprocess.run('./nvbandwidth -t device_to_host_memcpy_sm | grep -A 4 "Running device_to_host_memcpy_sm."', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        results = subprocess.run('./nvbandwidth -t device_to_host_memcpy_sm | grep -A 4 "Running device_to_host_memcpy_sm."', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.build_path)
         log = results.stdout.decode('utf-8')
         print(results.stderr.decode('utf-8')) 
         buffer.append(log)
        
-        results = subprocess.run('./nvbandwidth -t host_to_device_memcpy_sm | grep -A 4 "Running host_to_device_memcpy_sm."', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        results = subprocess.run('./nvbandwidth -t host_to_device_memcpy_sm | grep -A 4 "Running host_to_device_memcpy_sm."', shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=self.build_path)
         log = results.stdout.decode('utf-8')
         print(results.stderr.decode('utf-8')) 
         buffer.append(log)
-      
-        os.chdir(current)
     
-        file = open("Outputs/NVBandwidth_" + self.machine_name + ".txt", "w")
+        file = open(os.path.join(self.root, "Outputs", "NVBandwidth_" + self.machine_name + ".txt"), "w")
         for item in buffer:
             file.write(item)
             print(item)
      
         
+        file.close()
         self.buffer=buffer
-        os.chdir(current)
+
+        store = ResultsStore(os.path.join(self.root, "Outputs", "results.db"), self.machine_name)
+        self.record(store, buffer)
+
+    # stores the bandwidths of the logs run() captured, in the order of its tests
+    def record(self, store, buffer):
+        tests = ["device_to_device_bidirectional_memcpy_read_sm", "device_to_host_memcpy_sm", "host_to_device_memcpy_sm"]
+        for test, log in zip(tests, buffer):
+            values = self.parse_matrix(log)
+            if values:
+                store.add(self.name, {"test": test}, {"sum_gbps": sum(values), "min_gbps": min(values), "max_gbps": max(values), "links": len(values)})
+
+    # bandwidths (GB/s) in the matrix nvbandwidth prints for a test, N/A cells skipped.
+    # the matrix starts with a header row of GPU column numbers, which is not data
+    def parse_matrix(self, log):
+        values = []
+        columns = None
+        for line in log.split("\n"):
+            cells = line.split()
+            if cells and all(cell.isdigit() for cell in cells):
+                columns = len(cells)
+                continue
+            if columns is None or len(cells) != columns + 1 or not cells[0].isdigit():
+                continue
+            for cell in cells[1:]:
+                try:
+                    values.append(float(cell))
+                except ValueError:
+                    pass
+        return values
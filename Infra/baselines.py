@@ -0,0 +1,305 @@
+import argparse
+import csv
+import glob
+import json
+import math
+import os
+import re
+import statistics
+import sys
+
+from prettytable import PrettyTable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Infra.results_store import ResultsStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# relative shortfall from the baseline that warns and that fails, per benchmark.
+# overridden by the "RegressionGate" section of config.json
+TOLERANCES = {
+    "GEMMCublasLt": {"warn": 0.05, "fail": 0.10},
+    "HBMBandwidth": {"warn": 0.05, "fail": 0.10},
+    "FlashAttention": {"warn": 0.05, "fail": 0.10},
+    "NVBandwidth": {"warn": 0.10, "fail": 0.20},
+    "NCCLBandwidth": {"warn": 0.10, "fail": 0.20},
+    "FIO": {"warn": 0.15, "fail": 0.30},
+    "LLMBenchmark": {"warn": 0.05, "fail": 0.15},
+}
+
+# NCCL messages smaller than this are latency bound and too noisy to fail a machine on
+NCCL_MIN_BYTES = 1 << 20
+
+GEMM_DATATYPES = {"FP8": "fp8e4m3", "FP16": "fp16", "BF16": "bf16", "TF32": "tf32"}
+FLASH_IMPLS = {"Standard Attention(PyTorch)": "Pytorch", "Flash Attention 2.0": "Flash2"}
+NVBANDWIDTH_TESTS = {
+    "Host to Device": "host_to_device_memcpy_sm",
+    "Device to Host": "device_to_host_memcpy_sm",
+    "Device to Device read": "device_to_device_bidirectional_memcpy_read_sm",
+}
+FIO_TESTS = {"Sequential read": "read", "Random read": "randread", "Sequential write": "write", "Random write": "randwrite"}
+UNITS = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+# the markdown tables of a results file as (heading, text above the table, rows),
+# rows as lists of cells without the header and separator lines
+def parse_tables(path: str) -> list:
+    tables = []
+    heading, text, rows = "", [], None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("|"):
+                cells = [c.strip() for c in line.strip("|").split("|")]
+                if rows is None:
+                    rows = []
+                    tables.append((heading, " ".join(text), cells, rows))
+                elif not all(re.fullmatch(r"\\?-*:?-*", c) for c in cells):
+                    rows.append(cells)
+                continue
+            rows = None
+            if line.startswith("#"):
+                heading, text = line.lstrip("#").strip(), []
+            elif line:
+                text.append(line)
+    return tables
+
+
+# "1K", "132K", "8G" message sizes of the NCCL table as the power of two nccl-tests used
+def message_size(label: str) -> int:
+    match = re.fullmatch(r"(\d+)\s*([KMG]?)", label.strip())
+    size = int(match.group(1)) * UNITS.get(match.group(2), 1)
+    return 1 << round(math.log2(size))
+
+
+# one baseline number: benchmark and the params a result must have to be compared to
+# it, the metric it is compared with (times scale to get the unit of the table) and
+# whether a shortfall may fail the gate or only warn
+def entry(benchmark, label, params, metric, value, unit, scale=1.0, gate=True, model=None):
+    return {"benchmark": benchmark, "label": label, "params": params, "metric": metric, "value": float(value),
+            "unit": unit, "scale": scale, "gate": gate, "model": model}
+
+
+# the baselines of one Azure_Results/*.md file
+def parse_baseline(path: str) -> dict:
+    name = os.path.basename(path).replace("_results.md", "")
+    baseline = {"name": name, "gpu": "", "entries": []}
+    entries = baseline["entries"]
+    for heading, text, header, rows in parse_tables(path):
+        if heading == "System Specifications":
+            # the spec table has no header line, the GPU row is the first one
+            for cells in [header] + rows:
+                if cells[0] == "GPU":
+                    baseline["gpu"] = cells[1]
+        elif heading.startswith("GEMM"):
+            datatype = next((d for t, d in GEMM_DATATYPES.items() if re.search(rf"\b{t}\b", text)), None)
+            for cells in rows:
+                # the published numbers are cublaslt_gemm's, the torch worker's are not comparable
+                params = {"mode": "model_sizes", "backend": "cublaslt", "m": int(cells[0]), "n": int(cells[1]), "k": int(cells[2])}
+                if datatype is not None:
+                    params["datatype"] = datatype
+                entries.append(entry("GEMMCublasLt", "x".join(cells[:3]), params, "tflops", cells[-1], "TFLOPS"))
+        elif heading.startswith("HBM"):
+            for cells in rows:
+                entries.append(entry("HBMBandwidth", cells[0], {"operation": cells[0]}, "mean_tbps", cells[-1], "TB/s"))
+        elif heading.startswith("Flash Attention"):
+            for cells in rows:
+                if cells[0] in FLASH_IMPLS:
+                    entries.append(entry("FlashAttention", cells[0], {"impl": FLASH_IMPLS[cells[0]]}, "fwd_bwd_tflops", cells[-1], "TFLOPS"))
+        elif heading.startswith("NV Bandwidth"):
+            for cells in rows:
+                if cells[0] in NVBANDWIDTH_TESTS:
+                    entries.append(entry("NVBandwidth", cells[0], {"test": NVBANDWIDTH_TESTS[cells[0]]}, "mean_gbps", cells[-1], "GB/s"))
+        elif heading.startswith("FIO"):
+            for cells in rows:
+                if cells[0] in FIO_TESTS:
+                    entries.append(entry("FIO", f"{cells[0]} {cells[1]}", {"rw": FIO_TESTS[cells[0]], "bs": cells[1]},
+                                         "bandwidth_mbps", cells[-1], "GB/s", scale=1e-3))
+        elif heading.startswith("NCCL"):
+            match = re.search(r"\((\w+) algorithm\)", text)
+            algo = match.group(1) if match else "NVLS"
+            for cells in rows:
+                size = message_size(cells[0])
+                entries.append(entry("NCCLBandwidth", f"all_reduce {algo} {cells[0]}",
+                                     {"collective": "all_reduce", "algo": algo, "size_bytes": size},
+                                     "busbw_gbps", cells[-1], "GB/s", gate=size >= NCCL_MIN_BYTES))
+        elif "(" in heading:
+            # LLM sections: "LLAMA 3 (70B)" and "... with world size 8, input length 128, and output length 8."
+            family, size = re.match(r"(.+?)\s*\((\w+)\)", heading).groups()
+            setting = {}
+            for key, pattern in (("world_size", r"world size (\d+)"), ("input_length", r"input length (\d+)"),
+                                 ("output_length", r"output length (\d+)")):
+                match = re.search(pattern, text, re.IGNORECASE)
+                setting[key] = int(match.group(1)) if match else 1
+            for cells in rows:
+                if cells[0] == "Tokens per second":
+                    params = dict(setting, batch_size=int(cells[1]))
+                    entries.append(entry("LLMBenchmark", f"{heading} batch {cells[1]}", params, "tokens_per_sec", cells[-1],
+                                         "tokens/s", model=[family.lower().replace(" ", "-"), size.lower()]))
+    return baseline
+
+
+def load_baselines(directory: str = os.path.join(ROOT, "Azure_Results")) -> dict:
+    return {b["name"]: b for b in map(parse_baseline, sorted(glob.glob(os.path.join(directory, "*_results.md"))))}
+
+
+# the baseline of the machine a run was on, matched by the GPU model (H100, A100, ...)
+# of its System Specifications and the GPU name runner.py records results under
+def match_baseline(baselines: dict, machine: str):
+    for baseline in baselines.values():
+        model = re.search(r"\b[A-Z]\d{2,3}\b", baseline["gpu"])
+        if model and re.search(rf"\b{model.group(0)}\b", machine):
+            return baseline
+    return None
+
+
+# whether a result of the store is one the baseline entry describes
+def matches(e: dict, result: dict) -> bool:
+    params = result["params"]
+    for key, val in e["params"].items():
+        if key not in params or str(params[key]) != str(val):
+            return False
+    if e["model"] is not None:
+        name = str(params.get("model_name", "")).lower()
+        return all(part in name for part in e["model"])
+    return True
+
+
+# the value of e's metric in a result, in the unit of the baseline table, and the
+# standard error of the value when the benchmark averages several runs itself (HBM)
+def measure(e: dict, result: dict):
+    metrics = result["metrics"]
+    if e["metric"] == "mean_gbps" and "sum_gbps" in metrics:
+        return metrics["sum_gbps"] / max(metrics.get("links", 1), 1), None
+    if metrics.get(e["metric"]) is None:
+        return None, None
+    value = metrics[e["metric"]] * e["scale"]
+    if e["metric"] == "mean_tbps" and "stdev_gbps" in metrics:
+        return value, metrics["stdev_gbps"] / 1000 / math.sqrt(max(result["params"].get("runs", 1), 1))
+    return value, None
+
+
+# Compares every measurement of the run to its baseline. Repeats (GPUs of a GEMM
+# run, runs of the LLM benchmark, ...) are summarized by their median, and their
+# spread (MAD, or the stdev the benchmark reports) widens the fail threshold by
+# two standard errors, so a failure means the machine is slower beyond the noise
+# of its own measurements; anything slower than the warn tolerance or inside the
+# noise of the fail tolerance warns.
+def compare(baseline: dict, results: list, tolerances: dict) -> list:
+    report = []
+    for e in baseline["entries"]:
+        values, errors = [], []
+        for result in results:
+            if result["benchmark"] == e["benchmark"] and matches(e, result):
+                value, error = measure(e, result)
+                if value is not None:
+                    values.append(value)
+                    errors.append(error)
+        row = {"benchmark": e["benchmark"], "test": e["label"], "unit": e["unit"], "baseline": e["value"],
+               "measured": None, "delta": None, "samples": len(values), "status": "missing"}
+        report.append(row)
+        if not values:
+            continue
+        tol = dict(TOLERANCES.get(e["benchmark"], {"warn": 0.05, "fail": 0.10}), **tolerances.get(e["benchmark"], {}))
+        center = statistics.median(values)
+        if len(values) > 1:
+            spread = 1.4826 * statistics.median(abs(v - center) for v in values)
+            stderr = spread / math.sqrt(len(values))
+        elif errors[0] is not None:
+            stderr = errors[0]
+        else:
+            stderr = 0.0
+        delta = center / e["value"] - 1
+        margin = 2 * stderr / e["value"]
+        if delta + margin < -tol["fail"] and e["gate"]:
+            status = "fail"
+        elif delta < -tol["warn"]:
+            status = "warn"
+        else:
+            status = "pass"
+        row.update(measured=round(center, 4), delta=round(100 * delta, 2), status=status)
+    return report
+
+
+# results of the newest run of each benchmark on machine, or of run_id
+def latest_results(store: ResultsStore, machine: str, run_id: str = None) -> list:
+    results = store.query(machine=machine, run_id=run_id)
+    if run_id is None:
+        newest = {}
+        for r in results:
+            if r["run_id"] != "imported" and r["timestamp"] >= newest.get(r["benchmark"], ("", 0))[1]:
+                newest[r["benchmark"]] = (r["run_id"], r["timestamp"])
+        results = [r for r in results if newest.get(r["benchmark"], ("",))[0] == r["run_id"]]
+    return results
+
+
+def write_report(report: list, path: str):
+    columns = ["benchmark", "test", "baseline", "measured", "unit", "delta", "samples", "status"]
+    with open(path, "w") as csvFile:
+        writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(columns)
+        for row in report:
+            writer.writerow([row[c] for c in columns])
+
+
+def print_report(report: list, title: str):
+    table = PrettyTable()
+    table.title = title
+    table.field_names = ["Benchmark", "Test", "Baseline", "Measured", "Unit", "Delta (%)", "Samples", "Status"]
+    for row in report:
+        table.add_row([row["benchmark"], row["test"], row["baseline"], row["measured"], row["unit"],
+                       row["delta"], row["samples"], row["status"].upper()])
+    print(table)
+
+
+# Checks the newest results of a machine against the published Azure results:
+#   python3 Infra/baselines.py --machine "NVIDIA H100 80GB HBM3"
+# writes Outputs/regression_report_<machine>.csv and exits with 1 if anything
+# failed (or, with --strict, is missing), so a provisioning script can quarantine
+# the VM. Tolerances come from the "RegressionGate" section of config.json.
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare benchmark results with the published Azure baselines")
+    parser.add_argument("--machine", help="machine name the results were recorded under (default: the only one in the store)")
+    parser.add_argument("--baseline", help="baseline to compare with, e.g. ND_H100_v5 (default: matched by GPU)")
+    parser.add_argument("--run-id", help="run to check (default: the newest run of each benchmark)")
+    parser.add_argument("--db", default=os.path.join(ROOT, "Outputs", "results.db"), help="results store")
+    parser.add_argument("--config", default=os.path.join(ROOT, "config.json"), help="config with a RegressionGate section")
+    parser.add_argument("--out", default=os.path.join(ROOT, "Outputs"), help="directory for the report")
+    parser.add_argument("--strict", action="store_true", help="fail when a baseline has no result")
+    args = parser.parse_args(argv)
+
+    tolerances = {}
+    if os.path.exists(args.config):
+        with open(args.config) as f:
+            tolerances = json.load(f).get("RegressionGate", {}).get("tolerances", {})
+
+    store = ResultsStore(args.db, args.machine or "")
+    machine = args.machine
+    if machine is None:
+        machines = sorted({r["machine"] for r in store.query()})
+        if len(machines) != 1:
+            print(f"pass --machine, the store has results of: {', '.join(machines) or 'none'}")
+            return 1
+        machine = machines[0]
+
+    baselines = load_baselines()
+    baseline = baselines.get(args.baseline) if args.baseline else match_baseline(baselines, machine)
+    if baseline is None:
+        print(f"no baseline for {machine}, baselines are: {', '.join(baselines)}")
+        return 1
+
+    report = compare(baseline, latest_results(store, machine, args.run_id), tolerances)
+    store.close()
+    print_report(report, f"{machine} vs {baseline['name']}")
+    os.makedirs(args.out, exist_ok=True)
+    write_report(report, os.path.join(args.out, "regression_report_" + machine + ".csv"))
+
+    counts = {s: sum(r["status"] == s for r in report) for s in ("pass", "warn", "fail", "missing")}
+    print(", ".join(f"{n} {s}" for s, n in counts.items()))
+    if counts["fail"] or (args.strict and counts["missing"]):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
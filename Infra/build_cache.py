@@ -0,0 +1,92 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+CACHE_DIR = os.environ.get("BENCHMARK_BUILD_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ai-benchmarking-guide", "builds"))
+
+
+def cuda_version() -> str:
+    for nvcc in ["nvcc", "/usr/local/cuda/bin/nvcc"]:
+        try:
+            results = subprocess.run([nvcc, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            continue
+        for line in results.stdout.decode('utf-8').split("\n"):
+            if "release" in line:
+                return line.strip()
+    return ""
+
+
+def source_commit(path: str) -> str:
+    results = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=path)
+    return results.stdout.decode('utf-8').strip()
+
+
+# Cache of built benchmark binaries, keyed by the commit of the source tree, the
+# CUDA version, the target arch and the build flags. On a hit the binaries are
+# copied into place and the build is skipped; on a miss the caller builds and
+# stores the result.
+#
+#   cache = BuildCache("BabelStream", src, "sm_90", ["-DMODEL=cuda"])
+#   if not cache.fetch(build_dir):
+#       ...build...
+#       cache.store(build_dir, ["cuda-stream"])
+class BuildCache:
+    def __init__(self, name: str, source_dir: str, arch: str, flags: list = [], cache_dir: str = CACHE_DIR):
+        self.name = name
+        self.source_dir = source_dir
+        self.arch = arch
+        self.flags = list(flags)
+        self.cache_dir = cache_dir
+
+    def key(self) -> str:
+        key = {
+            "name": self.name,
+            "commit": source_commit(self.source_dir),
+            "cuda": cuda_version(),
+            "arch": self.arch,
+            "flags": self.flags,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+    def path(self) -> str:
+        return os.path.join(self.cache_dir, self.name, self.key())
+
+    # copies the cached files into dest_dir, False on a miss
+    def fetch(self, dest_dir: str) -> bool:
+        path = self.path()
+        manifest = os.path.join(path, "manifest.json")
+        if not os.path.isfile(manifest):
+            return False
+        with open(manifest) as f:
+            files = json.load(f)["files"]
+        for name in files:
+            dest = os.path.join(dest_dir, name)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy2(os.path.join(path, name), dest)
+        print(f"{self.name}: using cached build {path}")
+        return True
+
+    # stores the files matching patterns (relative to src_dir) under this build's key
+    def store(self, src_dir: str, patterns: list):
+        files = []
+        for pattern in patterns:
+            files += [os.path.relpath(f, src_dir) for f in glob.glob(os.path.join(src_dir, pattern)) if os.path.isfile(f)]
+        if not files:
+            print(f"{self.name}: build produced no files to cache")
+            return
+        os.makedirs(os.path.join(self.cache_dir, self.name), exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=os.path.join(self.cache_dir, self.name))
+        for name in files:
+            os.makedirs(os.path.dirname(os.path.join(tmp, name)), exist_ok=True)
+            shutil.copy2(os.path.join(src_dir, name), os.path.join(tmp, name))
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"files": sorted(files), "flags": self.flags, "arch": self.arch}, f)
+        path = self.path()
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.replace(tmp, path)
@@ -0,0 +1,179 @@
+import logging
+import os
+import shlex
+import signal
+import subprocess
+import threading
+import time
+
+# printed on stderr by the wrapper around every docker exec, so the command can be
+# killed from inside the container on a timeout
+PID_MARK = b"__container_exec_pid__"
+
+
+class DockerExec:
+    def __init__(self, container, cmd: list):
+        self.container = container
+        self.api = container.client.api
+        self.pid = None
+        # setsid puts the command in a process group of its own (pgid == the printed pid),
+        # -w waits for it in case setsid has to fork
+        wrapped = ["setsid", "-w", "sh", "-c", f'echo "{PID_MARK.decode()} $$" >&2; exec "$@"', "sh"] + cmd
+        self.exec_id = self.api.exec_create(container.id, wrapped, stdout=True, stderr=True)["Id"]
+        self.chunks = self.read(self.api.exec_start(self.exec_id, stream=True, demux=True))
+
+    # (stdout, stderr) chunks of the command, without the pid line of the wrapper
+    def read(self, stream):
+        head = b""
+        for out, err in stream:
+            if err and self.pid is None:
+                head += err
+                if b"\n" not in head:
+                    continue
+                line, err = head.split(b"\n", 1)
+                if line.startswith(PID_MARK):
+                    self.pid = int(line.split()[1])
+                else:
+                    err = line + b"\n" + err
+            yield out, err
+
+    def exit_code(self):
+        for _ in range(50):
+            code = self.api.exec_inspect(self.exec_id)["ExitCode"]
+            if code is not None:
+                return code
+            time.sleep(0.1)
+        return None
+
+    # signals the command's whole process group, so grandchildren such as the ranks
+    # of mpirun go too
+    def kill(self, sig: str = "TERM"):
+        if self.pid is not None:
+            self.container.exec_run(["kill", f"-{sig}", "--", f"-{self.pid}"])
+
+
+# exec through the low-level docker API, which streams the output instead of
+# buffering it like container.exec_run()
+class DockerContainer:
+    def __init__(self, container):
+        self.container = container
+
+    def exec_start(self, cmd: list):
+        return DockerExec(self.container, cmd)
+
+
+class LocalExec:
+    def __init__(self, cmd: list):
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+        self.chunks = ((line, None) for line in iter(self.proc.stdout.readline, b""))
+
+    def exit_code(self):
+        return self.proc.wait()
+
+    def kill(self, sig: str = "TERM"):
+        try:
+            os.killpg(self.proc.pid, getattr(signal, "SIG" + sig))
+        except ProcessLookupError:
+            pass
+
+
+# runs the commands on this machine instead of in a container, a stand-in for
+# DockerContainer to try the exec layer without docker
+class LocalContainer:
+    def exec_start(self, cmd: list):
+        return LocalExec(cmd)
+
+
+# result of an exec, same fields as docker's exec_run() result plus the timeout
+# that stopped the command, if any
+class ExecResult:
+    def __init__(self, exit_code, output: bytes, timed_out: str = None, duration: float = 0.0):
+        self.exit_code = exit_code
+        self.output = output
+        self.timed_out = timed_out
+        self.duration = duration
+
+
+# One command running in a container. The output is read on a background thread
+# and handed to on_line(line, stream) line by line as it arrives, so results can be
+# parsed while the command is still running. Several Execs can run at once.
+# timeout is the wall-clock limit in seconds, idle_timeout the longest time without
+# any output; on either the command gets SIGTERM and, grace seconds later, SIGKILL.
+#
+#   result = Exec(DockerContainer(container), "nvidia-smi", timeout=60).start().wait()
+class Exec:
+    def __init__(self, container, cmd, on_line=None, timeout: float = None, idle_timeout: float = None, grace: float = 30):
+        self.container = container
+        self.cmd = shlex.split(cmd) if isinstance(cmd, str) else list(cmd)
+        self.on_line = on_line
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.grace = grace
+        self.output = bytearray()
+        self.lock = threading.Lock()
+        self.log = logging.getLogger("Exec")
+
+    def start(self):
+        self.started = time.monotonic()
+        self.last_output = self.started
+        self.handle = self.container.exec_start(self.cmd)
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+        return self
+
+    def read(self):
+        partial = {"stdout": b"", "stderr": b""}
+        for out, err in self.handle.chunks:
+            for stream, data in (("stdout", out), ("stderr", err)):
+                if not data:
+                    continue
+                with self.lock:
+                    self.output += data
+                    self.last_output = time.monotonic()
+                lines = (partial[stream] + data).split(b"\n")
+                partial[stream] = lines.pop()
+                for line in lines:
+                    self.emit(line, stream)
+        for stream, line in partial.items():
+            if line:
+                self.emit(line, stream)
+
+    def emit(self, line: bytes, stream: str):
+        if self.on_line is None:
+            return
+        try:
+            self.on_line(line.decode("utf-8", errors="replace").rstrip("\r"), stream)
+        except Exception:
+            # a broken callback should not stop the output from being read
+            self.log.exception("on_line failed")
+
+    # which timeout has expired, if any
+    def expired(self):
+        now = time.monotonic()
+        if self.timeout is not None and now - self.started > self.timeout:
+            return f"no exit after {self.timeout}s"
+        with self.lock:
+            idle = now - self.last_output
+        if self.idle_timeout is not None and idle > self.idle_timeout:
+            return f"no output for {self.idle_timeout}s"
+        return None
+
+    def wait(self) -> ExecResult:
+        timed_out = None
+        while self.reader.is_alive():
+            self.reader.join(1)
+            timed_out = self.expired() if self.reader.is_alive() else None
+            if timed_out is not None:
+                self.log.warning(f"{shlex.join(self.cmd)}: {timed_out}, stopping it")
+                self.handle.kill("TERM")
+                self.reader.join(self.grace)
+                if self.reader.is_alive():
+                    self.handle.kill("KILL")
+                    self.reader.join(self.grace)
+                # if something still holds the output open, stop waiting for it
+                break
+        with self.lock:
+            output = bytes(self.output)
+        # 124 like coreutils timeout
+        exit_code = 124 if timed_out is not None else self.handle.exit_code()
+        return ExecResult(exit_code, output, timed_out, time.monotonic() - self.started)
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+
+
+# git revision of a downloaded model, "" if it is not a git checkout. the models
+# are cloned by the container as root, so git's ownership check is turned off
+def model_revision(path: str) -> str:
+    if not os.path.isdir(path):
+        return ""
+    results = subprocess.run(
+        ["git", "-c", "safe.directory=*", "rev-parse", "HEAD"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=path,
+    )
+    if results.returncode != 0:
+        return ""
+    return results.stdout.decode('utf-8').strip()
+
+
+def dir_size(path: str) -> int:
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return size
+
+
+# Store of built TensorRT-LLM engines. An engine lives in <root>/<model>/<key>,
+# where key is a hash of everything that went into it (model revision,
+# quantization, TP/PP and every convert/trtllm-build argument), so changing any
+# build setting gets a new engine instead of silently reusing the old one.
+# Manifests with the build time, size and last use of every engine are kept in
+# <root>/manifests. With a quota set, the least recently used engines are
+# evicted until the store fits.
+#
+#   store = EngineStore("engines", quota_gb=500)
+#   if store.get(params) is None:
+#       ...build into store.path(params)...
+#       store.add(params, build_time)
+class EngineStore:
+    def __init__(self, root: str, quota_gb: float = None, remove=None):
+        self.root = root
+        self.quota = quota_gb * 1e9 if quota_gb else None
+        # engines built in the container are owned by root, so the caller can pass
+        # a function that deletes them from inside the container
+        self.remove = remove if remove is not None else shutil.rmtree
+        self.manifest_dir = os.path.join(root, "manifests")
+
+    def key(self, params: dict) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+    def path(self, params: dict) -> str:
+        return os.path.join(self.root, params["model"], self.key(params))
+
+    def manifest_path(self, key: str) -> str:
+        return os.path.join(self.manifest_dir, key + ".json")
+
+    def read_manifest(self, key: str):
+        try:
+            with open(self.manifest_path(key)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write_manifest(self, manifest: dict):
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        tmp = self.manifest_path(manifest["key"]) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(tmp, self.manifest_path(manifest["key"]))
+
+    def manifests(self) -> list:
+        if not os.path.isdir(self.manifest_dir):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.manifest_dir)):
+            if name.endswith(".json"):
+                manifest = self.read_manifest(name[:-len(".json")])
+                if manifest is not None:
+                    result.append(manifest)
+        return result
+
+    # engine directory for params if it was built completely, else None. marks the
+    # engine as used for eviction
+    def get(self, params: dict):
+        key = self.key(params)
+        manifest = self.read_manifest(key)
+        if manifest is None:
+            return None
+        if not os.path.exists(os.path.join(manifest["path"], "rank0.engine")):
+            # removed by hand, forget it
+            os.remove(self.manifest_path(key))
+            return None
+        manifest["last_used"] = time.time()
+        self.write_manifest(manifest)
+        return manifest["path"]
+
+    # records a finished build of the engine in path(params)
+    def add(self, params: dict, build_time: float) -> dict:
+        now = time.time()
+        manifest = {
+            "key": self.key(params),
+            "path": self.path(params),
+            "params": params,
+            "build_time": round(build_time, 1),
+            "size": dir_size(self.path(params)),
+            "created": now,
+            "last_used": now,
+        }
+        self.write_manifest(manifest)
+        return manifest
+
+    def size(self) -> int:
+        return sum(m["size"] for m in self.manifests())
+
+    # removes least recently used engines until the store is under the quota.
+    # engines whose key is in keep (the ones the current run needs) are never evicted
+    def evict(self, keep: list = []) -> list:
+        if self.quota is None:
+            return []
+        manifests = sorted(self.manifests(), key=lambda m: m["last_used"])
+        total = sum(m["size"] for m in manifests)
+        evicted = []
+        for manifest in manifests:
+            if total <= self.quota:
+                break
+            if manifest["key"] in keep:
+                continue
+            print(f"Evicting engine {manifest['path']} ({manifest['size'] / 1e9:.1f} GB)")
+            self.remove(manifest["path"])
+            os.remove(self.manifest_path(manifest["key"]))
+            total -= manifest["size"]
+            evicted.append(manifest["key"])
+        return evicted
@@ -0,0 +1,225 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.ticker import FormatStrFormatter
+from prettytable import PrettyTable
+
+# one GEMM result, the columns of GEMMCublasLt_Shmoo_*.csv and GEMMCublasLt_Performance_*.csv
+DTYPE = [("m", "i8"), ("n", "i8"), ("k", "i8"), ("batch", "i8"), ("time_us", "f8"), ("tflops", "f8")]
+SHAPE = ["m", "n", "k", "batch"]
+# what measured a result, the Backend column: cublaslt_gemm or the torch GEMM worker.
+# results of the two are never mixed, CSVs without the column are cublaslt
+BACKENDS = ["cublaslt", "torch"]
+
+
+# [M, N, K, Batch, Time(us), TFLOPS, ...] rows (strings or numbers) as a structured
+# array, extra columns such as GPU are dropped
+def from_rows(rows) -> np.ndarray:
+    values = np.array([row[:6] for row in rows], dtype=float).reshape(-1, 6)
+    arr = np.empty(len(values), dtype=DTYPE)
+    for i, (name, _) in enumerate(DTYPE):
+        arr[name] = values[:, i]
+    return arr
+
+
+# the rows of a result CSV that backend measured
+def load_results(path: str, backend: str = "cublaslt") -> np.ndarray:
+    with open(path) as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        rows = [row for row in reader if row]
+    if "Backend" in header:
+        column = header.index("Backend")
+        rows = [row for row in rows if row[column] == backend]
+    elif backend != "cublaslt":
+        rows = []
+    return from_rows(rows)
+
+
+# the runs of a result CSV per backend, the torch worker's labelled "<label> (torch)"
+def backend_runs(label: str, path: str) -> dict:
+    runs = {}
+    for backend in BACKENDS:
+        arr = load_results(path, backend)
+        if len(arr):
+            runs[label if backend == "cublaslt" else f"{label} ({backend})"] = arr
+    return runs or {label: load_results(path)}
+
+
+# {label: array} for "label=path" arguments, or files matching a glob (labelled
+# with the machine and datatype part of the file name)
+def load_runs(specs: list) -> dict:
+    runs = {}
+    for spec in specs:
+        if "=" in spec:
+            label, path = spec.split("=", 1)
+            runs.update(backend_runs(label, path))
+            continue
+        for path in sorted(glob.glob(spec)):
+            label = os.path.splitext(os.path.basename(path))[0]
+            for prefix in ("GEMMCublasLt_Shmoo_", "GEMMCublasLt_Performance_"):
+                label = label.replace(prefix, "")
+            runs.update(backend_runs(label, path))
+    return runs
+
+
+# rows of arr where every dimension except axis equals fixed (a number, or a dict
+# like {"n": 4096, "k": 8192}), sorted along axis
+def shmoo_slice(arr: np.ndarray, axis: str, fixed) -> np.ndarray:
+    mask = np.ones(len(arr), dtype=bool)
+    for dim in ("m", "n", "k"):
+        if dim == axis:
+            continue
+        mask &= arr[dim] == (fixed[dim] if isinstance(fixed, dict) else fixed)
+    result = arr[mask]
+    return result[np.argsort(result[axis], kind="stable")]
+
+
+# the size the shmoos are sliced at when none is given: the largest M, which is
+# where the three sweeps of a grid shmoo cross
+def default_fixed(arr: np.ndarray) -> int:
+    return int(arr["m"].max()) if len(arr) else 0
+
+
+# shapes measured by both a and b, with the indices of each in a and b
+def common_shapes(a: np.ndarray, b: np.ndarray):
+    return np.intersect1d(a[SHAPE], b[SHAPE], return_indices=True)
+
+
+# TFLOPS of every run on the shapes all runs measured, and the speedup of each
+# run over baseline. returns (shapes, {label: tflops}, {label: speedup})
+def speedups(runs: dict, baseline: str):
+    shapes = runs[baseline][SHAPE]
+    for arr in runs.values():
+        shapes = np.intersect1d(shapes, arr[SHAPE])
+    tflops = {}
+    for label, arr in runs.items():
+        _, _, idx = np.intersect1d(shapes, arr[SHAPE], return_indices=True)
+        tflops[label] = arr["tflops"][idx]
+    ratios = {label: t / tflops[baseline] for label, t in tflops.items()}
+    return shapes, tflops, ratios
+
+
+# with more runs than this, plots show the baseline and the spread of the fleet
+# instead of one line per run
+MAX_LINES = 10
+
+
+# TFLOPS of every run along one shmoo, on the points all runs measured.
+# returns (x values, labels, tflops[run, point])
+def slice_matrix(runs: dict, baseline: str, axis: str, fixed):
+    sliced = {label: shmoo_slice(arr, axis, fixed) for label, arr in runs.items()}
+    shapes, tflops, _ = speedups(sliced, baseline)
+    order = np.argsort(shapes[axis], kind="stable")
+    return shapes[axis][order], list(tflops), np.array([tflops[l][order] for l in tflops])
+
+
+def plot_spread(ax, x, values, baseline_values, baseline):
+    ax.fill_between(x, values.min(axis=0), values.max(axis=0), alpha=0.2, label=f"min-max of {len(values)} runs")
+    ax.plot(x, np.median(values, axis=0), marker=".", label="median")
+    ax.plot(x, baseline_values, marker=".", color="black", label=baseline)
+
+
+def plot_overlay(runs: dict, axis: str, fixed, path: str, baseline: str = None):
+    fig, ax = plt.subplots(figsize=(16, 8))
+    if len(runs) > MAX_LINES:
+        baseline = baseline or next(iter(runs))
+        x, labels, values = slice_matrix(runs, baseline, axis, fixed)
+        plot_spread(ax, x, values, values[labels.index(baseline)], baseline)
+    else:
+        for label, arr in runs.items():
+            s = shmoo_slice(arr, axis, fixed)
+            if len(s):
+                ax.plot(s[axis], s["tflops"], marker=".", label=label)
+    ax.legend()
+    ax.grid(True)
+    fig.suptitle(f"{fixed} GEMM {axis.upper()} Shmoo", fontsize=20)
+    ax.yaxis.set_major_formatter(FormatStrFormatter("%.0f"))
+    ax.set_xlabel(f"{axis.upper()} Dim")
+    ax.set_ylabel("TFLOPS")
+    plt.savefig(path, bbox_inches="tight")
+    plt.close(fig)
+
+
+def plot_ratio(runs: dict, baseline: str, axis: str, fixed, path: str):
+    fig, ax = plt.subplots(figsize=(16, 8))
+    if len(runs) > MAX_LINES:
+        x, labels, values = slice_matrix(runs, baseline, axis, fixed)
+        ratios = values / values[labels.index(baseline)]
+        plot_spread(ax, x, ratios, ratios[labels.index(baseline)], baseline)
+    else:
+        base = shmoo_slice(runs[baseline], axis, fixed)
+        for label, arr in runs.items():
+            if label == baseline:
+                continue
+            s = shmoo_slice(arr, axis, fixed)
+            _, i, j = common_shapes(s, base)
+            order = np.argsort(s[axis][i])
+            ax.plot(s[axis][i][order], (s["tflops"][i] / base["tflops"][j])[order], marker=".", label=label)
+        ax.axhline(y=1, color="gray", linestyle="--")
+    ax.legend()
+    ax.grid(True)
+    fig.suptitle(f"{fixed} GEMM {axis.upper()} Shmoo, TFLOPS relative to {baseline}", fontsize=20)
+    ax.set_xlabel(f"{axis.upper()} Dim")
+    ax.set_ylabel("Speedup")
+    plt.savefig(path, bbox_inches="tight")
+    plt.close(fig)
+
+
+# writes the per-shape TFLOPS and speedups of every run to path, returns the
+# geometric mean speedup of each run
+def write_speedups(runs: dict, baseline: str, path: str) -> dict:
+    shapes, tflops, ratios = speedups(runs, baseline)
+    labels = list(runs)
+    with open(path, "w") as csvFile:
+        writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(["M", "N", "K", "Batch"] + [f"{l} TFLOPS" for l in labels] + [f"{l} Speedup" for l in labels if l != baseline])
+        for i, shape in enumerate(shapes):
+            writer.writerow(list(shape) + [tflops[l][i] for l in labels] + [round(ratios[l][i], 4) for l in labels if l != baseline])
+    return {l: float(np.exp(np.mean(np.log(r)))) if len(r) else float("nan") for l, r in ratios.items()}
+
+
+# Compares GEMM results of any number of machines:
+#   python3 Infra/gemm_compare.py "H200=Outputs/GEMMCublasLt_Shmoo_H200_fp8e4m3.csv" "H100=..." --baseline H100
+#   python3 Infra/gemm_compare.py "results/*/GEMMCublasLt_Shmoo_*.csv"
+# writes an overlay and a ratio plot per M/N/K shmoo and a per-shape speedup table
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare GEMMCublasLt results across machines")
+    parser.add_argument("runs", nargs="+", help="label=path of a result CSV, or a glob of result CSVs")
+    parser.add_argument("--baseline", help="label the others are compared to (default: the first run)")
+    parser.add_argument("--fixed", type=int, help="size of the two fixed dimensions of each shmoo (default: the largest M)")
+    parser.add_argument("--out", default="Outputs", help="directory for plots and tables")
+    args = parser.parse_args(argv)
+
+    runs = load_runs(args.runs)
+    if not runs:
+        print("no results found")
+        return 1
+    baseline = args.baseline or next(iter(runs))
+    if baseline not in runs:
+        print(f"unknown baseline {baseline}, runs are: {', '.join(runs)}")
+        return 1
+    fixed = args.fixed if args.fixed is not None else default_fixed(runs[baseline])
+    os.makedirs(args.out, exist_ok=True)
+
+    for axis in ("m", "n", "k"):
+        plot_overlay(runs, axis, fixed, os.path.join(args.out, f"GEMMCublasLt {axis.upper()} Shmoo_comparison.png"), baseline)
+        if len(runs) > 1:
+            plot_ratio(runs, baseline, axis, fixed, os.path.join(args.out, f"GEMMCublasLt {axis.upper()} Shmoo_ratio.png"))
+
+    geomean = write_speedups(runs, baseline, os.path.join(args.out, "GEMMCublasLt_comparison.csv"))
+    table = PrettyTable()
+    table.field_names = ["Run", "Shapes", "Geomean speedup vs " + baseline]
+    for label, arr in runs.items():
+        table.add_row([label, len(arr), round(geomean[label], 3)])
+    print(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import glob
+import os
+
+import numpy as np
+
+from Infra import gemm_compare
+
+# how far (in octaves, log2 of the size) from measured data an estimate may be
+# and still be flagged as confident
+CONFIDENT_OCTAVES = 0.5
+
+# the nearest-point fallback compares query chunks against every measured shape,
+# each chunk is at most this many distances (32 MB of float64)
+CHUNK_ELEMENTS = 1 << 22
+
+
+# exact (m, n, k) lookups go through one int64 per shape, dims below 2^21
+def shape_keys(m, n, k) -> np.ndarray:
+    return (np.asarray(m, dtype=np.int64) << 42) | (np.asarray(n, dtype=np.int64) << 21) | np.asarray(k, dtype=np.int64)
+
+
+# GEMM performance of one datatype, from a structured array of measurements
+# (gemm_compare.DTYPE). Depending on how the measurements cover the shape space
+# the estimate is:
+#   grid       every combination of the measured M, N and K values exists (a full
+#              3D sweep): trilinear interpolation of log TFLOPS in log M/N/K
+#   sweeps     the shmoo's three 1D sweeps through a common point: log TFLOPS is
+#              the sum of the three sweeps' offsets from that point
+#   nearest    anything else: the TFLOPS of the nearest measured shape
+# Shapes that were measured exactly always return their measurement.
+class GEMMTable:
+    def __init__(self, arr: np.ndarray):
+        arr = arr[(arr["batch"] == 1) & (arr["tflops"] > 0)]
+        if not len(arr):
+            raise ValueError("no batch 1 GEMM results")
+        # one value per shape, the median of repeats (GPUs, runs)
+        keys = shape_keys(arr["m"], arr["n"], arr["k"])
+        order = np.argsort(keys, kind="stable")
+        keys, arr = keys[order], arr[order]
+        self.keys, starts = np.unique(keys, return_index=True)
+        self.tflops = np.array([np.median(t) for t in np.split(arr["tflops"], starts[1:])])
+        self.dims = np.stack([arr[d][starts].astype(float) for d in ("m", "n", "k")], axis=1)
+        self.logs = np.log2(self.dims)
+        self.log_tflops = np.log2(self.tflops)
+        self.lo = self.logs.min(axis=0)
+        self.hi = self.logs.max(axis=0)
+        self.peak = float(self.tflops.max())
+        self.axes = [np.unique(self.logs[:, i]) for i in range(3)]
+
+        if len(self.keys) == np.prod([len(a) for a in self.axes]) and all(len(a) > 1 for a in self.axes):
+            self.mode = "grid"
+            index = tuple(np.searchsorted(self.axes[i], self.logs[:, i]) for i in range(3))
+            self.grid = np.empty([len(a) for a in self.axes])
+            self.grid[index] = self.log_tflops
+        elif self.find_sweeps():
+            self.mode = "sweeps"
+        else:
+            self.mode = "nearest"
+
+    # the point the shmoo's sweeps cross (most common value of each dim) and the log
+    # TFLOPS offset from it along each axis. False if that is not the data's layout
+    def find_sweeps(self) -> bool:
+        center = []
+        for i in range(3):
+            values, counts = np.unique(self.logs[:, i], return_counts=True)
+            center.append(values[np.argmax(counts)])
+        self.center = np.array(center)
+        at_center = np.all(self.logs == self.center, axis=1)
+        if not at_center.any():
+            return False
+        base = self.log_tflops[at_center][0]
+        self.sweeps = []
+        for i in range(3):
+            others = [j for j in range(3) if j != i]
+            line = np.all(self.logs[:, others] == self.center[others], axis=1)
+            x = self.logs[line, i]
+            if len(x) < 2:
+                return False
+            order = np.argsort(x)
+            self.sweeps.append((x[order], self.log_tflops[line][order] - base))
+        self.base = base
+        return True
+
+    def interpolate_grid(self, q: np.ndarray) -> np.ndarray:
+        lower, frac = [], []
+        for i, axis in enumerate(self.axes):
+            x = np.clip(q[:, i], axis[0], axis[-1])
+            j = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+            lower.append(j)
+            frac.append((x - axis[j]) / (axis[j + 1] - axis[j]))
+        result = np.zeros(len(q))
+        for corner in range(8):
+            bits = [(corner >> i) & 1 for i in range(3)]
+            weight = np.ones(len(q))
+            for i in range(3):
+                weight *= frac[i] if bits[i] else 1 - frac[i]
+            result += weight * self.grid[lower[0] + bits[0], lower[1] + bits[1], lower[2] + bits[2]]
+        return result
+
+    def interpolate_sweeps(self, q: np.ndarray) -> np.ndarray:
+        result = np.full(len(q), self.base)
+        for i, (x, offset) in enumerate(self.sweeps):
+            result += np.interp(q[:, i], x, offset)
+        return result
+
+    def nearest(self, q: np.ndarray):
+        log_tflops = np.empty(len(q))
+        distance = np.empty(len(q))
+        chunk = max(1, CHUNK_ELEMENTS // (3 * len(self.logs)))
+        for start in range(0, len(q), chunk):
+            d = np.abs(q[start:start + chunk, None, :] - self.logs[None, :, :]).max(axis=2)
+            j = np.argmin(d, axis=1)
+            log_tflops[start:start + chunk] = self.log_tflops[j]
+            distance[start:start + chunk] = d[np.arange(len(j)), j]
+        return log_tflops, distance
+
+    # (tflops, confident) of every row of the (len, 3) array of shapes
+    def lookup(self, m, n, k):
+        q = np.log2(np.stack([np.asarray(m, dtype=float), np.asarray(n, dtype=float), np.asarray(k, dtype=float)], axis=1))
+        in_range = np.all((q >= self.lo) & (q <= self.hi), axis=1)
+        if self.mode == "grid":
+            log_tflops = self.interpolate_grid(q)
+            confident = in_range
+        elif self.mode == "sweeps":
+            log_tflops = self.interpolate_sweeps(q)
+            # exact along a sweep, an assumption away from them
+            off_center = (np.abs(q - self.center) > CONFIDENT_OCTAVES).sum(axis=1)
+            confident = in_range & (off_center <= 1)
+        else:
+            log_tflops, distance = self.nearest(q)
+            confident = distance <= CONFIDENT_OCTAVES
+        # measured shapes answer with their measurement
+        keys = shape_keys(m, n, k)
+        j = np.clip(np.searchsorted(self.keys, keys), 0, len(self.keys) - 1)
+        exact = (self.keys[j] == keys) & (np.asarray(m) < 1 << 21) & (np.asarray(n) < 1 << 21) & (np.asarray(k) < 1 << 21)
+        log_tflops = np.where(exact, self.log_tflops[j], log_tflops)
+        # never above the fastest measurement, interpolation can overshoot at the edges
+        tflops = np.minimum(np.exp2(log_tflops), self.peak)
+        return tflops, confident | exact
+
+
+# GEMM cost without a GPU, from the shmoo and model-size results of a machine.
+#
+#   oracle = GEMMOracle.from_outputs("Outputs", "NVIDIA H100 80GB HBM3")
+#   time_us, tflops = oracle.query(4096, 4096, 8192, "fp8e4m3")
+#   time_us, tflops, confident = oracle.query_batch(m_array, n_array, k_array, "fp8e4m3")
+#
+# query_batch is vectorized over numpy arrays and is the one to use for more
+# than a handful of shapes. confident is False for shapes outside the measured
+# range or away from where the measurements support the interpolation.
+class GEMMOracle:
+    def __init__(self, results: dict):
+        self.tables = {dtype: GEMMTable(arr) for dtype, arr in results.items()}
+
+    # index over the GEMMCublasLt_Shmoo_ and GEMMCublasLt_Performance_ CSVs of machine
+    # in outputs, and over its GEMMCublasLt results in store if given. only
+    # cublaslt_gemm results are used, the torch worker runs different kernels
+    @classmethod
+    def from_outputs(cls, outputs: str, machine: str, store=None):
+        runs = {}
+        for prefix in ("GEMMCublasLt_Shmoo_", "GEMMCublasLt_Performance_"):
+            pattern = os.path.join(glob.escape(outputs), glob.escape(prefix + machine + "_") + "*.csv")
+            for path in sorted(glob.glob(pattern)):
+                dtype = os.path.splitext(os.path.basename(path))[0][len(prefix + machine + "_"):]
+                runs.setdefault(dtype, []).append(gemm_compare.load_results(path))
+        if store is not None:
+            rows = {}
+            for r in store.query("GEMMCublasLt", machine=machine):
+                p = r["params"]
+                if p.get("backend", "cublaslt") != "cublaslt":
+                    continue
+                rows.setdefault(p["datatype"], []).append([p["m"], p["n"], p["k"], p["batch"], r["metrics"]["time_us"], r["metrics"]["tflops"]])
+            for dtype, values in rows.items():
+                runs.setdefault(dtype, []).append(gemm_compare.from_rows(values))
+        if not runs:
+            raise FileNotFoundError(f"no GEMMCublasLt results of {machine} in {outputs}")
+        return cls({dtype: np.concatenate(arrs) for dtype, arrs in runs.items()})
+
+    def table(self, dtype: str) -> GEMMTable:
+        if dtype not in self.tables:
+            raise KeyError(f"no GEMM results for {dtype}, have {', '.join(self.tables)}")
+        return self.tables[dtype]
+
+    def peak(self, dtype: str) -> float:
+        return self.table(dtype).peak
+
+    def query_batch(self, m, n, k, dtype: str, batch=1):
+        m, n, k = (np.atleast_1d(np.asarray(x, dtype=np.int64)) for x in (m, n, k))
+        tflops, confident = self.table(dtype).lookup(m, n, k)
+        time_us = 2.0 * m * n * k * np.asarray(batch) / (tflops * 1e6)
+        return time_us, tflops, confident
+
+    def query(self, m: int, n: int, k: int, dtype: str, batch: int = 1):
+        time_us, tflops, _ = self.query_batch(m, n, k, dtype, batch)
+        return float(time_us[0]), float(tflops[0])
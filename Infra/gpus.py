@@ -0,0 +1,95 @@
+import os
+import statistics
+import subprocess
+import threading
+
+
+# GPU ids to schedule work on, one per CUDA_VISIBLE_DEVICES slot. Falls back to
+# every GPU nvidia-smi reports when CUDA_VISIBLE_DEVICES is not set.
+def visible_gpus() -> list:
+    devices = os.environ.get("CUDA_VISIBLE_DEVICES")
+    if devices is not None:
+        return [d.strip() for d in devices.split(",") if d.strip()]
+    try:
+        results = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index", "--format=csv,noheader"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        gpus = results.stdout.decode('utf-8').split()
+    except FileNotFoundError:
+        gpus = []
+    return gpus if gpus else ["0"]
+
+
+# memory of a GPU in MiB from nvidia-smi, None if it cannot be queried
+def memory_mib(gpu="0"):
+    try:
+        results = subprocess.run(
+            ["nvidia-smi", "--query-gpu=memory.total", "--format=csv,noheader,nounits", "-i", str(gpu)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        return int(results.stdout.decode('utf-8').split()[0])
+    except (FileNotFoundError, IndexError, ValueError):
+        return None
+
+
+# environment for a child process pinned to a single GPU
+def pinned_env(gpu) -> dict:
+    env = os.environ.copy()
+    env["CUDA_VISIBLE_DEVICES"] = str(gpu)
+    return env
+
+
+# splits items into n shards with about the same total cost (greedy, most expensive
+# item first onto the least loaded shard). each shard keeps the original item order,
+# so neighbouring shapes still run back to back.
+def shard_by_cost(items: list, cost, n: int) -> list:
+    shards = [[] for _ in range(n)]
+    loads = [0] * n
+    order = sorted(range(len(items)), key=lambda i: cost(items[i]), reverse=True)
+    for i in order:
+        s = loads.index(min(loads))
+        shards[s].append(i)
+        loads[s] += cost(items[i])
+    return [[items[i] for i in sorted(shard)] for shard in shards]
+
+
+# runs fn(gpu) on every GPU of devices (all visible ones by default) at the same
+# time, one thread each, so a whole node takes as long as its slowest GPU.
+# returns {gpu: result}; a GPU whose fn raised maps to None
+def fan_out(fn, devices=None) -> dict:
+    devices = devices if devices is not None else visible_gpus()
+    results = {gpu: None for gpu in devices}
+
+    def run(gpu):
+        try:
+            results[gpu] = fn(gpu)
+        except Exception as e:
+            print(f"GPU {gpu}: {e}")
+
+    threads = [threading.Thread(target=run, args=(gpu,)) for gpu in devices]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+# min, median and max of {gpu: value}, and the GPUs that are slow outliers: below
+# the median by more than k robust standard deviations (1.4826 x MAD) and by more
+# than floor of the median, so identical GPUs with a tiny MAD are not flagged
+def spread(values: dict, k: float = 3.5, floor: float = 0.03) -> dict:
+    values = {gpu: v for gpu, v in values.items() if v is not None}
+    if not values:
+        return {"min": None, "median": None, "max": None, "outliers": []}
+    median = statistics.median(values.values())
+    mad = statistics.median(abs(v - median) for v in values.values())
+    limit = max(k * 1.4826 * mad, floor * abs(median))
+    return {
+        "min": min(values.values()),
+        "median": median,
+        "max": max(values.values()),
+        "outliers": [gpu for gpu, v in values.items() if median - v > limit],
+    }
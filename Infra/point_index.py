@@ -0,0 +1,46 @@
+import json
+import os
+import threading
+
+
+# Append-only on-disk index of completed benchmark points. Each line holds one
+# {"key": {...}, "row": [...]} record and is flushed as soon as the point
+# finishes, so a killed sweep can be restarted and only runs the missing points.
+class PointIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self.points = {}
+        self.lock = threading.Lock()
+        self.needs_newline = False
+
+        if os.path.isfile(path):
+            with open(path, mode="r") as f:
+                data = f.read()
+            for line in data.split("\n"):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # empty line, or last line cut off by a killed run
+                    continue
+                self.points[self.key_str(record["key"])] = record["row"]
+            self.needs_newline = len(data) > 0 and not data.endswith("\n")
+
+    def key_str(self, key: dict) -> str:
+        return json.dumps(key, sort_keys=True)
+
+    def get(self, key: dict):
+        return self.points.get(self.key_str(key))
+
+    def add(self, key: dict, row: list):
+        with self.lock:
+            self.points[self.key_str(key)] = row
+            with open(self.path, mode="a") as f:
+                if self.needs_newline:
+                    f.write("\n")
+                    self.needs_newline = False
+                f.write(json.dumps({"key": key, "row": row}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def __len__(self):
+        return len(self.points)
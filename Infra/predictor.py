@@ -0,0 +1,121 @@
+import os
+
+import numpy as np
+
+from Infra import roofline
+from Infra import transformer
+from Infra.gemm_oracle import GEMMOracle
+
+# bytes of an activation and of a KV cache element
+ACT_BYTES = 2
+KV_BYTES = 2
+
+
+# all-reduce busbw (GB/s) per message size from NCCLBandwidth results in the store,
+# the best algorithm at each size (what NCCL picks by default) of the newest run
+def allreduce_table(store, machine: str) -> list:
+    results = store.query("NCCLBandwidth", machine=machine, collective="all_reduce")
+    if not results:
+        return []
+    run_id = results[-1]["run_id"]
+    best = {}
+    for r in results:
+        if r["run_id"] == run_id:
+            size = r["params"]["size_bytes"]
+            best[size] = max(best.get(size, 0), r["metrics"]["busbw_gbps"])
+    return sorted(best.items())
+
+
+# Analytical prefill/decode latency and tokens/sec of a model on this machine.
+# Every GEMM of a forward pass (Infra/transformer.py) takes the time the GEMM
+# oracle interpolates from the shmoo and model-size results; attention reads
+# the KV cache at the measured HBM bandwidth (decode) or runs at the GEMM peak
+# (prefill); every block all-reduces its attention and MLP outputs at the
+# measured NCCL bus bandwidth. Launch overheads, sampling and everything else
+# are not modeled, calibration (measured / predicted tokens/sec of earlier runs)
+# scales the result.
+#
+#   p = Predictor(oracle, "fp8e4m3", bandwidth_tbps=3.0, allreduce=[(1024, 0.07), ...])
+#   p.predict(hf_config, tp_size=8, batch_size=64, input_length=128, output_length=8)
+class Predictor:
+    def __init__(self, oracle: GEMMOracle, datatype: str, bandwidth_tbps: float, allreduce: list = None, calibration: float = 1.0):
+        self.oracle = oracle
+        self.datatype = datatype
+        self.peak = oracle.peak(datatype)
+        self.bandwidth = bandwidth_tbps
+        self.allreduce_sizes = np.log2([size for size, _ in allreduce]) if allreduce else None
+        self.allreduce_busbw = np.array([busbw for _, busbw in allreduce])
+        self.calibration = calibration
+
+    # predictor from the files in outputs (GEMMCublasLt_Shmoo_, GEMMCublasLt_Performance_,
+    # HBMBandwidth_Performance_results_) and the NCCL results in store
+    @classmethod
+    def from_outputs(cls, outputs: str, machine: str, datatype: str, store=None, calibration: float = 1.0):
+        oracle = GEMMOracle.from_outputs(outputs, machine, store)
+        if datatype not in oracle.tables:
+            raise FileNotFoundError(f"no GEMMCublasLt results of {machine} ({datatype}) in {outputs}")
+        bandwidth = roofline.measured_bandwidth(os.path.join(outputs, "HBMBandwidth_Performance_results_" + machine + ".csv"))
+        allreduce = allreduce_table(store, machine) if store is not None else []
+        return cls(oracle, datatype, bandwidth, allreduce, calibration)
+
+    # time (us) of an all-reduce of size bytes over tp_size GPUs
+    def allreduce_time(self, size: int, tp_size: int) -> float:
+        if tp_size == 1:
+            return 0.0
+        if self.allreduce_sizes is None:
+            raise ValueError("no NCCL all-reduce results to predict tensor-parallel runs")
+        busbw = float(np.interp(np.log2(size), self.allreduce_sizes, self.allreduce_busbw))
+        algbw = busbw * tp_size / (2 * (tp_size - 1))
+        return size / (algbw * 1e3)
+
+    # time (us) of one forward pass over tokens tokens per sequence, context tokens
+    # already in the KV cache
+    def forward_time(self, hf_config: dict, tp_size: int, batch_size: int, tokens: int, context: int, phase: str) -> dict:
+        d = transformer.block_dims(hf_config)
+        shapes = transformer.gemm_shapes(hf_config, batch_size, tokens, tp_size, phase)
+        times, _, _ = self.oracle.query_batch([s["m"] for s in shapes], [s["n"] for s in shapes], [s["k"] for s in shapes], self.datatype)
+        gemm = float(np.dot(times, [s["count"] for s in shapes]))
+        heads = d["heads"] // tp_size
+        kv_heads = max(d["kv_heads"] // tp_size, 1)
+        if phase == "prefill":
+            # QK^T and PV over a causal mask
+            flops = 2 * batch_size * tokens * tokens * heads * d["head_dim"] * d["layers"]
+            attention = flops / (self.peak * 1e6)
+        else:
+            kv_bytes = 2 * batch_size * context * kv_heads * d["head_dim"] * KV_BYTES * d["layers"]
+            attention = kv_bytes / (self.bandwidth * 1e6)
+        allreduce = 2 * d["layers"] * self.allreduce_time(batch_size * tokens * d["hidden"] * ACT_BYTES, tp_size)
+        return {"gemm": gemm, "attention": attention, "allreduce": allreduce, "total": gemm + attention + allreduce}
+
+    # predicted prefill latency and decode latency per token (ms), end to end
+    # latency (ms) and tokens/sec of one configuration
+    def predict(self, hf_config: dict, tp_size: int, batch_size: int, input_length: int, output_length: int) -> dict:
+        prefill = self.forward_time(hf_config, tp_size, batch_size, input_length, 0, "prefill")
+        # the KV cache grows during decode, take its average length
+        decode = self.forward_time(hf_config, tp_size, batch_size, 1, input_length + output_length // 2, "decode")
+        latency = (prefill["total"] + (output_length - 1) * decode["total"]) / self.calibration
+        return {
+            "prefill_ms": round(prefill["total"] / self.calibration / 1000, 3),
+            "decode_ms": round(decode["total"] / self.calibration / 1000, 3),
+            "latency_ms": round(latency / 1000, 3),
+            "tokens_per_sec": round(batch_size * output_length / latency * 1e6, 2),
+            "allreduce_share": round((prefill["allreduce"] + (output_length - 1) * decode["allreduce"]) / (latency * self.calibration), 3),
+        }
+
+
+# configurations that are clearly dominated: another configuration with the same
+# input/output lengths on no more GPUs is better by more than margin on both
+# tokens/sec per GPU and latency. points are (tp_size, batch_size, input_length,
+# output_length), predictions their predict() results
+def dominated(points: list, predictions: list, margin: float = 0.2) -> set:
+    result = set()
+    for i, (tp, _, inp, out) in enumerate(points):
+        a = predictions[i]
+        for j, (tp2, _, inp2, out2) in enumerate(points):
+            b = predictions[j]
+            if i == j or (inp, out) != (inp2, out2) or tp2 > tp:
+                continue
+            if b["tokens_per_sec"] / tp2 > a["tokens_per_sec"] / tp * (1 + margin) and b["latency_ms"] * (1 + margin) < a["latency_ms"]:
+                result.add(points[i])
+                break
+    return result
@@ -0,0 +1,123 @@
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from Infra import tools
+
+# one id for everything measured by this process, or set BENCHMARK_RUN_ID to
+# group several processes (e.g. configs/llmbench.sh) into one run
+RUN_ID = os.environ.get("BENCHMARK_RUN_ID") or datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL,
+    machine TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    benchmark TEXT NOT NULL,
+    params TEXT NOT NULL,
+    metrics TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_benchmark ON results (benchmark, machine, run_id);
+"""
+
+
+# Results of every benchmark in one SQLite database, Outputs/results.db by default.
+# A result is the benchmark name, its parameters (what was measured: shape,
+# message size, model, ...) and its metrics (numbers), tagged with the run id,
+# machine name, machine fingerprint and time. Each add() is a single INSERT, and
+# the per-benchmark CSV files can be written from the store with export_csv().
+#
+#   store = ResultsStore("Outputs/results.db", "ND_H100_v5")
+#   store.add("HBMBandwidth", {"operation": "Copy"}, {"mean_tbps": 3.1})
+#   rows = store.query("HBMBandwidth", run_id=RUN_ID)
+class ResultsStore:
+    def __init__(self, path: str, machine: str, run_id: str = RUN_ID):
+        self.path = path
+        self.machine = machine
+        self.run_id = run_id
+        self.fingerprint = None
+        self.conn = None
+        # benchmarks add results from several threads (one per GPU, exec readers)
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            self.fingerprint = tools.machine_fingerprint(self.machine)
+        return self.conn
+
+    def add(self, benchmark: str, params: dict, metrics: dict, run_id: str = None) -> int:
+        for key, val in params.items():
+            if not isinstance(val, (str, int, float, bool)) and val is not None:
+                raise TypeError(f"{benchmark}: parameter {key} must be a str, int, float or bool, got {type(val).__name__}")
+        for key, val in metrics.items():
+            if not isinstance(val, (int, float)) and val is not None:
+                raise TypeError(f"{benchmark}: metric {key} must be a number, got {type(val).__name__}")
+        with self.lock:
+            conn = self.connect()
+            cur = conn.execute(
+                "INSERT INTO results (run_id, machine, fingerprint, benchmark, params, metrics, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (run_id or self.run_id, self.machine, self.fingerprint, benchmark, json.dumps(params), json.dumps(metrics), time.time()),
+            )
+            conn.commit()
+            return cur.lastrowid
+
+    # results in the order they were added, as dicts with the columns of the table
+    # and params/metrics decoded. params filters on parameter values, e.g.
+    # query("NCCLBandwidth", algo="Ring")
+    def query(self, benchmark: str = None, machine: str = None, run_id: str = None, **params) -> list:
+        where = []
+        args = []
+        for column, val in (("benchmark", benchmark), ("machine", machine), ("run_id", run_id)):
+            if val is not None:
+                where.append(f"{column} = ?")
+                args.append(val)
+        for key, val in params.items():
+            where.append("json_extract(params, ?) = ?")
+            args += ["$." + key, val]
+        sql = "SELECT id, run_id, machine, fingerprint, benchmark, params, metrics, timestamp FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        with self.lock:
+            rows = self.connect().execute(sql + " ORDER BY id", args).fetchall()
+        columns = ["id", "run_id", "machine", "fingerprint", "benchmark", "params", "metrics", "timestamp"]
+        results = []
+        for row in rows:
+            result = dict(zip(columns, row))
+            result["params"] = json.loads(result["params"])
+            result["metrics"] = json.loads(result["metrics"])
+            results.append(result)
+        return results
+
+    # writes the matching results as a flat CSV: the given columns (params and
+    # metrics by name), or every param and metric followed by the machine and run id
+    def export_csv(self, path: str, benchmark: str, columns: list = None, **filters) -> int:
+        results = self.query(benchmark, **filters)
+        if columns is None:
+            columns = []
+            for r in results:
+                columns += [c for c in list(r["params"]) + list(r["metrics"]) if c not in columns]
+            columns += ["machine", "run_id"]
+        with open(path + ".tmp", "w") as csvFile:
+            writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(columns)
+            for r in results:
+                values = dict(r["params"], **r["metrics"], machine=r["machine"], run_id=r["run_id"])
+                writer.writerow([values.get(c) for c in columns])
+        os.replace(path + ".tmp", path)
+        return len(results)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
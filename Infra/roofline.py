@@ -0,0 +1,150 @@
+import argparse
+import csv
+import os
+import sys
+
+import matplotlib.pyplot as plt
+import numpy as np
+from prettytable import PrettyTable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Infra import gemm_compare
+
+# bytes of an element of A/B and of C/D for the datatypes of cublaslt_gemm. fp8
+# GEMMs write a 16 bit result
+ELEMENT_BYTES = {"fp8e4m3": (1, 2), "fp8e5m2": (1, 2), "fp16": (2, 2), "bf16": (2, 2), "tf32": (4, 4), "fp32": (4, 4), "fp64": (8, 8)}
+
+
+# FLOPs per byte of every GEMM in arr (a gemm_compare structured array), counting
+# one read of A and B and one write of D per batch
+def intensity(arr: np.ndarray, datatype: str) -> np.ndarray:
+    ab, d = ELEMENT_BYTES.get(datatype, (2, 2))
+    m, n, k, batch = (arr[dim].astype(float) for dim in gemm_compare.SHAPE)
+    flops = 2 * m * n * k * batch
+    traffic = batch * ((m * k + k * n) * ab + m * n * d)
+    return flops / traffic
+
+
+# TFLOPS the roofline allows at each intensity for peak TFLOPS and bandwidth TB/s
+def attainable(ai, peak: float, bandwidth: float):
+    return np.minimum(peak, bandwidth * ai)
+
+
+# intensity where the machine stops being memory bound
+def ridge(peak: float, bandwidth: float) -> float:
+    return peak / bandwidth
+
+
+# every GEMM of arr with its intensity, attainable TFLOPS, the percentage of it
+# that was achieved and whether its roof is memory or compute bandwidth
+def classify(arr: np.ndarray, datatype: str, peak: float, bandwidth: float) -> list:
+    ai = intensity(arr, datatype)
+    roof = attainable(ai, peak, bandwidth)
+    rows = []
+    for i, shape in enumerate(arr):
+        rows.append({
+            "m": int(shape["m"]), "n": int(shape["n"]), "k": int(shape["k"]), "batch": int(shape["batch"]),
+            "tflops": float(shape["tflops"]), "intensity": round(float(ai[i]), 2),
+            "attainable": round(float(roof[i]), 1),
+            "percent": round(100 * float(shape["tflops"]) / float(roof[i]), 1),
+            "bound": "memory" if ai[i] < ridge(peak, bandwidth) else "compute",
+        })
+    return rows
+
+
+# peak GEMM TFLOPS measured on the machine: the fastest shape of any result file
+def measured_peak(runs: list) -> float:
+    return max(float(arr["tflops"].max()) for arr in runs if len(arr))
+
+
+# HBM bandwidth (TB/s) from the HBMBandwidth_Performance_results CSV written by
+# HBMBandwidth.save_results(), the better of the Copy and Triad means
+def measured_bandwidth(path: str) -> float:
+    with open(path) as csvFile:
+        rows = list(csv.reader(csvFile))
+    means = [float(row[3]) for row in rows[1:] if row and row[0] in ("Copy", "Triad")]
+    if not means:
+        raise ValueError(f"{path} has no Copy or Triad result")
+    return max(means)
+
+
+def plot(results: dict, datatype: str, peak: float, bandwidth: float, path: str, title: str):
+    fig, ax = plt.subplots(figsize=(16, 8))
+    ais = np.concatenate([intensity(arr, datatype) for arr in results.values()])
+    x = np.logspace(np.log10(min(ais.min(), 1) / 2), np.log10(max(ais.max(), ridge(peak, bandwidth)) * 2), 200)
+    ax.plot(x, attainable(x, peak, bandwidth), color="black", label=f"roofline ({bandwidth:.2f} TB/s, {peak:.0f} TFLOPS)")
+    ax.axvline(ridge(peak, bandwidth), color="gray", linestyle="--", label=f"ridge ({ridge(peak, bandwidth):.0f} FLOP/byte)")
+    for (label, arr), marker in zip(results.items(), ["o", "x", "^", "s"]):
+        ax.scatter(intensity(arr, datatype), arr["tflops"], marker=marker, s=12 if len(arr) > 50 else 40, label=label)
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend()
+    fig.suptitle(title, fontsize=20)
+    ax.set_xlabel("Arithmetic intensity (FLOP/byte)")
+    ax.set_ylabel("TFLOPS")
+    plt.savefig(path, bbox_inches="tight")
+    plt.close(fig)
+
+
+def write_csv(rows: dict, path: str):
+    with open(path, "w") as csvFile:
+        writer = csv.writer(csvFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        writer.writerow(["Source", "M", "N", "K", "Batch", "TFLOPS", "Intensity (FLOP/byte)", "Attainable TFLOPS", "% of attainable", "Bound"])
+        for label, results in rows.items():
+            for r in results:
+                writer.writerow([label, r["m"], r["n"], r["k"], r["batch"], r["tflops"], r["intensity"], r["attainable"], r["percent"], r["bound"]])
+
+
+# Roofline of the GEMM results of a machine, from the files the benchmarks leave in
+# outputs: GEMMCublasLt_Performance_ (model sizes) and GEMMCublasLt_Shmoo_ for
+# the GEMMs, HBMBandwidth_Performance_results_ for the bandwidth. The peak is the
+# fastest GEMM measured unless given. Writes GEMMCublasLt_Roofline_<machine>_<datatype>
+# .csv/.png and prints the model sizes and the shapes furthest below their roof.
+def analyze(outputs: str, machine: str, datatype: str, peak: float = None, bandwidth: float = None, worst: int = 10) -> dict:
+    results = {}
+    for label, prefix in (("model sizes", "GEMMCublasLt_Performance_"), ("shmoo", "GEMMCublasLt_Shmoo_")):
+        path = os.path.join(outputs, prefix + machine + "_" + datatype + ".csv")
+        if os.path.exists(path):
+            results[label] = gemm_compare.load_results(path)
+    if not results:
+        raise FileNotFoundError(f"no GEMMCublasLt results of {machine} ({datatype}) in {outputs}")
+    peak = peak or measured_peak(results.values())
+    bandwidth = bandwidth or measured_bandwidth(os.path.join(outputs, "HBMBandwidth_Performance_results_" + machine + ".csv"))
+
+    rows = {label: classify(arr, datatype, peak, bandwidth) for label, arr in results.items()}
+    name = os.path.join(outputs, "GEMMCublasLt_Roofline_" + machine + "_" + datatype)
+    write_csv(rows, name + ".csv")
+    plot(results, datatype, peak, bandwidth, name + ".png", f"{machine} {datatype} GEMM roofline")
+
+    print(f"Roofline: peak {peak:.1f} TFLOPS, HBM {bandwidth:.2f} TB/s, ridge at {ridge(peak, bandwidth):.0f} FLOP/byte")
+    table = PrettyTable()
+    table.field_names = ["Source", "M", "N", "K", "TFLOPS", "FLOP/byte", "Attainable", "% of attainable", "Bound"]
+    shown = [("model sizes", r) for r in rows.get("model sizes", [])]
+    shown += [("shmoo", r) for r in sorted(rows.get("shmoo", []), key=lambda r: r["percent"])[:worst]]
+    for label, r in shown:
+        table.add_row([label, r["m"], r["n"], r["k"], r["tflops"], r["intensity"], r["attainable"], r["percent"], r["bound"]])
+    print(table)
+    return rows
+
+
+#   python3 Infra/roofline.py --machine "NVIDIA H100 80GB HBM3" --datatype fp8e4m3
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="GEMM roofline from measured HBM bandwidth and GEMM peak")
+    parser.add_argument("--machine", required=True, help="machine name in the result file names")
+    parser.add_argument("--datatype", default="fp8e4m3", help="GEMM datatype in the result file names")
+    parser.add_argument("--outputs", default="Outputs", help="directory with the benchmark results")
+    parser.add_argument("--peak", type=float, help="peak TFLOPS instead of the fastest measured GEMM")
+    parser.add_argument("--bandwidth", type=float, help="HBM TB/s instead of the measured Copy/Triad bandwidth")
+    parser.add_argument("--worst", type=int, default=10, help="shmoo shapes to list, furthest below their roof first")
+    args = parser.parse_args(argv)
+    try:
+        analyze(args.outputs, args.machine, args.datatype, args.peak, args.bandwidth, args.worst)
+    except (OSError, ValueError) as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+# Adaptive refinement of a 1-D sweep. Starts from `coarse` evenly spaced points
+# between start and end and keeps bisecting the intervals where the measured value
+# changes by more than `tolerance` (relative), such as wave-quantization and tile
+# boundary cliffs, until the intervals are down to min_step or `budget` points
+# have been measured. Flat parts of the curve stay at the coarse spacing.
+#
+# measure(xs) takes a list of x values and returns {x: value}, value is None for
+# points that failed. Each refinement round is measured as one batch.
+def adaptive_sample(measure, start: int, end: int, min_step: int, tolerance: float, budget: int, coarse: int = 17) -> dict:
+    def snap(x):
+        x = start + round((x - start) / min_step) * min_step
+        return max(start, min(end, x))
+
+    coarse = max(2, min(coarse, budget))
+    xs = sorted(set(snap(start + (end - start) * i / (coarse - 1)) for i in range(coarse)))
+    xs[-1] = end
+    values = dict(measure(xs))
+
+    while len(values) < budget:
+        known = sorted(x for x in values if values[x] is not None)
+        candidates = []
+        for a, b in zip(known, known[1:]):
+            if b - a <= min_step:
+                continue
+            va = values[a]
+            vb = values[b]
+            scale = max(abs(va), abs(vb))
+            if scale == 0 or abs(va - vb) <= tolerance * scale:
+                continue
+            mid = snap((a + b) / 2)
+            if mid in values:
+                continue
+            candidates.append((abs(va - vb) / scale, mid))
+        if not candidates:
+            break
+        # biggest jumps first, in case the budget runs out this round
+        candidates.sort(reverse=True)
+        batch = sorted(set(mid for _, mid in candidates[:budget - len(values)]))
+        values.update(measure(batch))
+
+    return values
@@ -0,0 +1,125 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Task:
+    def __init__(self, name: str, fn, deps: list = None, resources: list = None, always: bool = False, usage: dict = None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps or [])
+        self.resources = sorted(resources or [])
+        # amounts of limited resources (see Scheduler.limit) held while running.
+        # a value can be a function, evaluated once the dependencies are done
+        self.usage = dict(usage or {})
+        self.held = {}
+        # run even if a dependency failed, e.g. container cleanup
+        self.always = always
+        self.status = "pending"
+        self.duration = 0.0
+
+
+# Runs a graph of tasks on a thread pool. A task starts as soon as all of its
+# dependencies have finished, so build and download steps overlap with GPU runs.
+# Tasks naming the same resource (e.g. "gpu") never run at the same time, which
+# keeps measurements apart; the resource is taken before the task is handed to the
+# pool, so a task waiting for it does not hold a worker that a build could use. Limited resources
+# (CPU cores, memory, free disk) are shared by amount: a task only starts while
+# what it uses fits next to the tasks already running.
+class Scheduler:
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.tasks = {}
+        # resources held by running tasks
+        self.busy = set()
+        self.limits = {}
+        self.in_use = {}
+        self.log = logging.getLogger("Scheduler")
+
+    def add(self, name: str, fn, deps: list = None, resources: list = None, always: bool = False, usage: dict = None) -> str:
+        deps = deps or []
+        usage = usage or {}
+        for dep in deps:
+            if dep not in self.tasks:
+                raise KeyError(f"unknown dependency {dep} for task {name}")
+        for r in usage:
+            if r not in self.limits:
+                raise KeyError(f"unknown limit {r} for task {name}")
+        self.tasks[name] = Task(name, fn, deps, resources, always, usage)
+        return name
+
+    # available is the total amount, or a function returning what is available
+    # right now (e.g. free disk space)
+    def limit(self, name: str, available):
+        self.limits[name] = available
+        self.in_use[name] = 0
+
+    # reserves the usage of task if it fits. a task that does not fit even on its
+    # own still runs once nothing else holds the resource, instead of waiting forever
+    def reserve(self, task: Task) -> bool:
+        usage = {r: amount() if callable(amount) else amount for r, amount in task.usage.items()}
+        for r, amount in usage.items():
+            available = self.limits[r]() if callable(self.limits[r]) else self.limits[r]
+            if self.in_use[r] > 0 and self.in_use[r] + amount > available:
+                return False
+        for r, amount in usage.items():
+            self.in_use[r] += amount
+        task.held = usage
+        return True
+
+    def release(self, task: Task):
+        for r, amount in task.held.items():
+            self.in_use[r] -= amount
+        task.held = {}
+
+    def execute(self, task: Task):
+        start = time.time()
+        try:
+            self.log.info(f"start {task.name}")
+            task.fn()
+        finally:
+            task.duration = time.time() - start
+
+    def ready(self, task: Task) -> bool:
+        deps = [self.tasks[d] for d in task.deps]
+        if any(d.status in ("pending", "running") for d in deps):
+            return False
+        return task.always or all(d.status == "done" for d in deps)
+
+    def blocked(self, task: Task) -> bool:
+        return not task.always and any(self.tasks[d].status in ("failed", "skipped") for d in task.deps)
+
+    # runs every task, returns {name: status}. a failed task skips the tasks that depend on it
+    def run(self) -> dict:
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while True:
+                for task in self.tasks.values():
+                    if task.status != "pending":
+                        continue
+                    if self.blocked(task):
+                        task.status = "skipped"
+                        self.log.info(f"skip {task.name}, a dependency did not complete")
+                    elif self.ready(task) and self.busy.isdisjoint(task.resources) and self.reserve(task):
+                        task.status = "running"
+                        self.busy.update(task.resources)
+                        running[pool.submit(self.execute, task)] = task
+                if not running:
+                    if any(t.status == "pending" for t in self.tasks.values()):
+                        # only tasks whose dependencies were skipped are left
+                        continue
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task = running.pop(future)
+                    self.release(task)
+                    self.busy.difference_update(task.resources)
+                    try:
+                        future.result()
+                        task.status = "done"
+                    except Exception as e:
+                        task.status = "failed"
+                        self.log.exception(f"{task.name} failed: {e}")
+                        print(f"{task.name} failed: {e}")
+                    self.log.info(f"{task.name} {task.status} in {task.duration:.1f}s")
+        return {name: task.status for name, task in self.tasks.items()}
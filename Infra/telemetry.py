@@ -0,0 +1,329 @@
+import datetime
+import math
+import subprocess
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+
+# fields sampled for every GPU, in the order of the values in the ring buffer.
+# same names and units as nvidia-smi --query-gpu
+FIELDS = [
+    ("utilization.gpu", "%"),
+    ("power.draw", "W"),
+    ("enforced.power.limit", "W"),
+    ("clocks.current.sm", "MHz"),
+    ("clocks.current.memory", "MHz"),
+    ("temperature.gpu", ""),
+    ("memory.used", "MiB"),
+    ("memory.total", "MiB"),
+]
+
+
+class NVMLBackend:
+    def __init__(self):
+        pynvml.nvmlInit()
+        self.handles = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+        self.num_gpus = len(self.handles)
+
+    def read(self) -> list:
+        rows = []
+        for h in self.handles:
+            memory = pynvml.nvmlDeviceGetMemoryInfo(h)
+            rows.append([
+                pynvml.nvmlDeviceGetUtilizationRates(h).gpu,
+                pynvml.nvmlDeviceGetPowerUsage(h) / 1000,
+                pynvml.nvmlDeviceGetEnforcedPowerLimit(h) / 1000,
+                pynvml.nvmlDeviceGetClockInfo(h, pynvml.NVML_CLOCK_SM),
+                pynvml.nvmlDeviceGetClockInfo(h, pynvml.NVML_CLOCK_MEM),
+                pynvml.nvmlDeviceGetTemperature(h, pynvml.NVML_TEMPERATURE_GPU),
+                memory.used / (1 << 20),
+                memory.total / (1 << 20),
+            ])
+        return rows
+
+    def close(self):
+        pynvml.nvmlShutdown()
+
+
+# keeps one nvidia-smi -lms process streaming to a pipe and hands out the latest
+# reading of every GPU. only this process is stopped on close, no pkill
+class NvidiaSmiBackend:
+    def __init__(self, period_ms: int = 100):
+        query = "--query-gpu=index," + ",".join(name for name, _ in FIELDS)
+        results = subprocess.run(
+            ["nvidia-smi", query, "--format=csv,noheader,nounits"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        self.latest = {}
+        for line in results.stdout.decode('utf-8').strip().split("\n"):
+            self.parse_line(line)
+        self.num_gpus = len(self.latest)
+        self.proc = subprocess.Popen(
+            ["nvidia-smi", query, "--format=csv,noheader,nounits", "-lms", str(period_ms)],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        self.reader = threading.Thread(target=self.read_stream, daemon=True)
+        self.reader.start()
+
+    def parse_line(self, line: str):
+        values = [v.strip() for v in line.split(",")]
+        if len(values) != len(FIELDS) + 1:
+            return
+        try:
+            self.latest[int(values[0])] = [float(v) for v in values[1:]]
+        except ValueError:
+            # [N/A] or [Not Supported] fields
+            self.latest[int(values[0])] = [float(v) if v.replace(".", "", 1).isdigit() else math.nan for v in values[1:]]
+
+    def read_stream(self):
+        for line in self.proc.stdout:
+            self.parse_line(line)
+
+    def read(self) -> list:
+        return [list(self.latest[i]) for i in sorted(self.latest)]
+
+    def close(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+
+# generated values for testing code that consumes telemetry without a GPU.
+# fn(t, gpu) returns the values in FIELDS order, t in seconds since start
+class SyntheticBackend:
+    def __init__(self, num_gpus: int = 8, fn=None):
+        self.num_gpus = num_gpus
+        self.fn = fn if fn is not None else self.default
+        self.t0 = time.monotonic()
+
+    def default(self, t, gpu):
+        load = 0.5 + 0.5 * math.sin(t + gpu)
+        return [100 * load, 100 + 600 * load, 700, 1200 + 780 * load, 2619, 35 + 40 * load, 40000 * load, 81559]
+
+    def read(self) -> list:
+        t = time.monotonic() - self.t0
+        return [self.fn(t, gpu) for gpu in range(self.num_gpus)]
+
+    def close(self):
+        pass
+
+
+def default_backend(period: float):
+    if pynvml is not None:
+        try:
+            return NVMLBackend()
+        except pynvml.NVMLError:
+            pass
+    return NvidiaSmiBackend(int(period * 1000))
+
+
+# Samples every GPU in a background thread. By default the buffer grows with the
+# run (about 18 KB per second for 8 GPUs at 0.1 s), so multi-hour captures are kept
+# whole; with capacity set it is a ring buffer holding the last capacity samples.
+# Timestamps are time.monotonic(), so a benchmark can line its own events up with
+# the samples by taking time.monotonic() (or calling mark()) around them.
+#
+#   with TelemetrySampler(period=0.1) as sampler:
+#       ...
+#   t, values = sampler.samples()
+class TelemetrySampler:
+    def __init__(self, backend=None, period: float = 0.1, capacity: int = None):
+        self.backend = backend
+        self.period = period
+        self.grow = capacity is None
+        # an hour at the default period to start with
+        self.capacity = capacity or 36000
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.events = []
+
+    def start(self):
+        if self.backend is None:
+            self.backend = default_backend(self.period)
+        self.num_gpus = self.backend.num_gpus
+        self.times = np.zeros(self.capacity)
+        self.values = np.zeros((self.capacity, self.num_gpus, len(FIELDS)))
+        self.count = 0
+        # to convert monotonic timestamps to wall clock for CSV output
+        self.wall_offset = time.time() - time.monotonic()
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def loop(self):
+        next_sample = time.monotonic()
+        while not self.stop_event.is_set():
+            self.sample()
+            next_sample += self.period
+            self.stop_event.wait(max(0, next_sample - time.monotonic()))
+
+    def sample(self):
+        rows = self.backend.read()
+        t = time.monotonic()
+        with self.lock:
+            if self.grow and self.count == self.capacity:
+                self.times = np.concatenate([self.times, np.zeros(self.capacity)])
+                self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+                self.capacity *= 2
+            i = self.count % self.capacity
+            self.times[i] = t
+            self.values[i, :len(rows)] = rows
+            self.count += 1
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        # one last sample so the capture covers the end of the phase
+        self.sample()
+        self.backend.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    # records a benchmark event on the same clock as the samples
+    def mark(self, label: str) -> float:
+        t = time.monotonic()
+        with self.lock:
+            self.events.append((t, label))
+        return t
+
+    # samples in time order, optionally only the ones between t0 and t1.
+    # returns (timestamps, values[sample, gpu, field])
+    def samples(self, t0: float = None, t1: float = None):
+        with self.lock:
+            n = min(self.count, self.capacity)
+            start = self.count % self.capacity if self.count > self.capacity else 0
+            order = (np.arange(n) + start) % self.capacity
+            times = self.times[order]
+            values = self.values[order]
+        mask = np.ones(n, dtype=bool)
+        if t0 is not None:
+            mask &= times >= t0
+        if t1 is not None:
+            mask &= times <= t1
+        return times[mask], values[mask]
+
+    def field(self, name: str) -> int:
+        return [f for f, _ in FIELDS].index(name)
+
+    # writes the samples in the layout of nvidia-smi --format=csv, one row per GPU
+    # per sample, so existing readers of <name>_power.csv keep working
+    def to_csv(self, path: str, t0: float = None, t1: float = None):
+        times, values = self.samples(t0, t1)
+        header = ["timestamp"] + [f"{name} [{unit}]" if unit else name for name, unit in FIELDS] + ["index"]
+        with open(path, "w") as f:
+            f.write(", ".join(header) + "\n")
+            for t, rows in zip(times, values):
+                stamp = datetime.datetime.fromtimestamp(t + self.wall_offset).strftime("%Y/%m/%d %H:%M:%S.%f")[:-3]
+                for gpu, row in enumerate(rows):
+                    cells = [stamp]
+                    for (name, unit), v in zip(FIELDS, row):
+                        if math.isnan(v):
+                            cells.append("[N/A]")
+                            continue
+                        v = int(v) if name in ("utilization.gpu", "temperature.gpu") else round(float(v), 2)
+                        cells.append(f"{v} {unit}" if unit else str(v))
+                    cells.append(str(gpu))
+                    f.write(", ".join(cells) + "\n")
+
+
+# Column-wise loading of nvidia-smi style CSV captures, as written by to_csv()
+# above or by nvidia-smi --format=csv. Units are stripped and timestamps parsed
+# per column, nothing loops over rows in Python.
+
+# turns one chunk of the raw CSV into numeric columns named like FIELDS, plus
+# "timestamp" in seconds since the epoch and "index" (GPU id, 0 if not captured)
+def parse_power_frame(df):
+    df.columns = [c.strip().split(" [")[0] for c in df.columns]
+    out = pd.DataFrame(index=df.index)
+    if "timestamp" in df.columns:
+        stamps = pd.to_datetime(df["timestamp"].astype(str).str.strip(), format="%Y/%m/%d %H:%M:%S.%f", errors="coerce")
+        out["timestamp"] = (stamps - pd.Timestamp(0)).dt.total_seconds()
+    for name in [f for f, _ in FIELDS] + ["index"]:
+        if name in df.columns:
+            col = df[name]
+            if not pd.api.types.is_numeric_dtype(col):
+                # "300.12 W" -> 300.12, "[N/A]" -> NaN
+                col = col.str.strip().str.split(" ", n=1).str[0]
+            out[name] = pd.to_numeric(col, errors="coerce")
+    if "index" not in out.columns:
+        out["index"] = 0
+    out["index"] = out["index"].fillna(-1).astype(int)
+    return out
+
+
+def read_power_csv(path: str, chunksize: int = None):
+    if chunksize is None:
+        yield parse_power_frame(pd.read_csv(path, on_bad_lines="skip"))
+        return
+    for chunk in pd.read_csv(path, on_bad_lines="skip", chunksize=chunksize):
+        yield parse_power_frame(chunk)
+
+
+# per GPU NumPy arrays, {gpu: {"timestamp": array, "power.draw": array, ...}}
+def load_power_csv(path: str) -> dict:
+    df = next(read_power_csv(path))
+    df = df.sort_values(["index", "timestamp"] if "timestamp" in df.columns else ["index"], kind="stable")
+    result = {}
+    for gpu, rows in df.groupby("index", sort=True):
+        result[int(gpu)] = {name: rows[name].to_numpy() for name in rows.columns if name != "index"}
+    return result
+
+
+# max/avg/min of every field per GPU and over all GPUs ("all"). only samples with
+# utilization.gpu above min_utilization are counted, so idle time before and after a
+# run does not pull the averages down. with chunksize set the file is processed
+# chunk by chunk and only the running sums are kept in memory
+def summarize_power_csv(path: str, chunksize: int = None, min_utilization: float = None) -> dict:
+    names = [f for f, _ in FIELDS]
+    totals = None
+    for df in read_power_csv(path, chunksize):
+        if min_utilization is not None and "utilization.gpu" in df.columns:
+            df = df[df["utilization.gpu"] > min_utilization]
+        cols = [n for n in names if n in df.columns]
+        grouped = df.groupby("index")[cols]
+        stats = pd.concat({"count": grouped.count(), "sum": grouped.sum(), "max": grouped.max(), "min": grouped.min()}, axis=1)
+        if totals is None:
+            totals = stats
+            continue
+        totals = totals.reindex(totals.index.union(stats.index))
+        stats = stats.reindex(totals.index)
+        totals["count"] = totals["count"].fillna(0) + stats["count"].fillna(0)
+        totals["sum"] = totals["sum"].fillna(0) + stats["sum"].fillna(0)
+        totals["max"] = np.fmax(totals["max"], stats["max"])
+        totals["min"] = np.fmin(totals["min"], stats["min"])
+
+    result = {}
+    if totals is None or totals.empty:
+        return result
+    groups = [(int(gpu), totals.loc[[gpu]]) for gpu in totals.index] + [("all", totals)]
+    for key, t in groups:
+        count = t["count"].sum()
+        result[key] = {}
+        for name in t["count"].columns:
+            n = count[name]
+            result[key]["max_" + name] = float(t["max"][name].max())
+            result[key]["min_" + name] = float(t["min"][name].min())
+            result[key]["avg_" + name] = float(t["sum"][name].sum() / n) if n > 0 else math.nan
+            # fields can be [N/A] in some samples, so every field has its own count
+            result[key]["samples_" + name] = int(n)
+        result[key]["samples"] = int(count.max())
+    return result
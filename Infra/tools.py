@@ -1,4 +1,6 @@
+import hashlib
 import os
+import subprocess
 
 
 def create_dir(name: str):
@@ -9,3 +11,36 @@ def create_dir(name: str):
         os.mkdir(outdir)
 
     return outdir
+
+
+# short content hash of a file, empty string if the file does not exist
+def file_hash(path: str) -> str:
+    if not os.path.isfile(path):
+        return ""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+
+# identifies the machine a result was measured on: GPU model, VBIOS, driver and
+# memory of every GPU, so results are not reused across different hardware
+def machine_fingerprint(machine: str) -> str:
+    try:
+        results = subprocess.run(
+            ["nvidia-smi", "--query-gpu=gpu_name,vbios_version,driver_version,memory.total", "--format=csv,noheader"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        gpus = results.stdout.decode('utf-8')
+    except FileNotFoundError:
+        gpus = ""
+    return hashlib.sha256((machine + "\n" + gpus).encode()).hexdigest()[:16]
+
+
+# CUDA arch the benchmarks are built for
+def gpu_arch(machine: str) -> str:
+    if "A100" in machine:
+        return "sm_80"
+    return "sm_90"
@@ -0,0 +1,58 @@
+# GEMMs of a decoder-only transformer (Llama, Mistral and friends) from its
+# Hugging Face config.json
+
+# model precision in config.json -> cublaslt_gemm datatype
+GEMM_DATATYPES = {"fp8": "fp8e4m3", "float16": "fp16", "bfloat16": "bf16", "float32": "fp32"}
+
+
+# the dimensions the GEMMs depend on, with the defaults of the Llama config
+def block_dims(hf_config: dict) -> dict:
+    hidden = hf_config["hidden_size"]
+    heads = hf_config["num_attention_heads"]
+    return {
+        "hidden": hidden,
+        "heads": heads,
+        "kv_heads": hf_config.get("num_key_value_heads", heads),
+        "head_dim": hf_config.get("head_dim") or hidden // heads,
+        "intermediate": hf_config["intermediate_size"],
+        "vocab": hf_config["vocab_size"],
+        "layers": hf_config["num_hidden_layers"],
+    }
+
+
+# every GEMM of one forward pass on one tensor-parallel rank, as dicts with the
+# layer, m, n, k and how many times it runs (once per block, lm_head once).
+# prefill runs the whole prompt at once (m = batch x input length), decode one
+# token per sequence (m = batch). the weights are split column-wise (QKV,
+# gate/up, lm_head: N / tp) or row-wise (O, down: K / tp) like TensorRT-LLM does;
+# KV heads are replicated when there are fewer of them than ranks. QKV and
+# gate/up are fused into one GEMM each, and only the logits of the last token
+# are computed, so lm_head has m = batch in both phases
+def gemm_shapes(hf_config: dict, batch_size: int, input_length: int, tp_size: int = 1, phase: str = "prefill") -> list:
+    if phase not in ("prefill", "decode"):
+        raise ValueError(f"unknown phase {phase}")
+    d = block_dims(hf_config)
+    tokens = batch_size * input_length if phase == "prefill" else batch_size
+    q = d["heads"] // tp_size * d["head_dim"]
+    kv = max(d["kv_heads"] // tp_size, 1) * d["head_dim"]
+    inter = d["intermediate"] // tp_size
+    shapes = [
+        ("qkv", tokens, q + 2 * kv, d["hidden"], d["layers"]),
+        ("o", tokens, d["hidden"], q, d["layers"]),
+        ("gate_up", tokens, 2 * inter, d["hidden"], d["layers"]),
+        ("down", tokens, d["hidden"], inter, d["layers"]),
+        ("lm_head", batch_size, -(-d["vocab"] // tp_size), d["hidden"], 1),
+    ]
+    return [{"phase": phase, "layer": layer, "m": m, "n": n, "k": k, "count": count} for layer, m, n, k, count in shapes]
+
+
+# GEMM time of a forward pass (us), times maps (m, n, k) to the time of one GEMM
+def forward_time(shapes: list, times: dict) -> float:
+    return sum(times[(s["m"], s["n"], s["k"])] * s["count"] for s in shapes)
+
+
+# tokens/sec if the GEMMs were all the work: one prefill produces the first
+# token of every sequence, each further token takes a decode step
+def gemm_tokens_per_sec(batch_size: int, output_length: int, prefill_us: float, decode_us: float) -> float:
+    total_us = prefill_us + (output_length - 1) * decode_us
+    return batch_size * output_length / total_us * 1e6
@@ -14,7 +14,7 @@ git reset --hard fc667f35c147ad203225bda2813081954c9ebb84 # smaller models w/o -
 git log --oneline -5
 
 git status
-sudo  rm -rf engines/*
+# engines are kept between configs, only the ones whose build parameters changed get rebuilt
 
 mv results results-old.$(date +%s)
 mkdir results
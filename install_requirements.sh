@@ -13,6 +13,7 @@ pip3 install --no-cache-dir torchvision
 pip3 install --no-cache-dir flash-attn
 pip3 install --no-cache-dir docker
 pip3 install --no-cache-dir prettytable
+pip3 install --no-cache-dir nvidia-ml-py
 
 sudo apt install -y fio zstd
 
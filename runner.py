@@ -1,7 +1,12 @@
+import argparse
 import json
 import os
 import logging
 import subprocess
+import sys
+import matplotlib
+# benchmarks plot from scheduler threads
+matplotlib.use("Agg")
 from Benchmarks import GEMMCublasLt as gemm
 from Benchmarks import HBMBandwidth as HBM
 from Benchmarks import NVBandwidth as NV
@@ -9,17 +14,13 @@ from Benchmarks import NCCLBandwidth as NCCL
 from Benchmarks import FlashAttention as FA
 from Benchmarks import FIO
 from Infra import tools
+from Infra import baselines
+from Infra import roofline
+from Infra.scheduler import Scheduler
 from Benchmarks import LLMBenchmark as llmb
 
 machine_name = ""
 current = os.getcwd()
-tools.create_dir("Outputs")
-LOGLEVEL = os.environ.get('LOGLEVEL', 'INFO').upper()
-logging.basicConfig(filename="Outputs/runner.log",
-                    filemode='w',
-                    format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
-                    datefmt='%H:%M:%S',
-                    level=LOGLEVEL)
 
 
 def get_system_specs():
@@ -58,68 +59,164 @@ def get_system_specs():
     return output[0].strip()
 
 
-def run_CublasLt():
+# Each benchmark adds its steps to the scheduler. Build and download steps take no
+# resources and overlap with whatever else is running, steps that measure hold the
+# "gpu" resource so only one measurement runs at a time.
+
+def add_gemm_build(scheduler):
+    if "gemm_build" not in scheduler.tasks:
+        test = gemm.GEMMCublastLt("config.json",machine_name)
+        # builds the CublasLt binary 
+        scheduler.add("gemm_build", test.build)
+    return "gemm_build"
+
+
+def run_CublasLt(scheduler):
     test = gemm.GEMMCublastLt("config.json",machine_name)
+    build = add_gemm_build(scheduler)
 
-    # builds the CublasLt binary 
-    test.build()
+    def run():
+        # generates the table with predetermined m,n,k values
+        test.run_model_sizes()
 
-    # generates the table with predetermined m,n,k values
-    test.run_model_sizes()
+        # generates power, clock, and gpu temperature plots
+        test.run_nvml()
 
-    # generates power, clock, and gpu temperature plots
-    test.run_nvml()
+    scheduler.add("gemm", run, [build], ["gpu"])
 
-    # runs GEMM sweep and generates shmoo plots (takes about 20 minutes)
-    # test.run_shmoo()
-    
 
-def run_HBMBandwidth():
+# runs GEMM sweep and generates shmoo plots (takes about 20 minutes)
+def run_Shmoo(scheduler):
+    test = gemm.GEMMCublastLt("config.json",machine_name)
+    build = add_gemm_build(scheduler)
+    scheduler.add("shmoo", test.run_shmoo, [build], ["gpu"])
+
+
+def add_hbm_build(scheduler):
+    if "hbm_build" not in scheduler.tasks:
+        test = HBM.HBMBandwidth("config.json", machine_name)
+        scheduler.add("hbm_build", test.build)
+    return "hbm_build"
+
+def run_HBMBandwidth(scheduler):
     test = HBM.HBMBandwidth("config.json", machine_name)
-    test.build()
-    test.run()
+    build = add_hbm_build(scheduler)
+    scheduler.add("hbm", test.run, [build], ["gpu"])
 
-def run_NVBandwidth():
+# bandwidth against working set size, from L2 resident to most of the HBM
+def run_HBMSizeSweep(scheduler):
+    test = HBM.HBMBandwidth("config.json", machine_name)
+    build = add_hbm_build(scheduler)
+    scheduler.add("hbm_sweep", test.run_size_sweep, [build], ["gpu"])
+
+def run_NVBandwidth(scheduler):
     test = NV.NVBandwidth("config.json", machine_name)
-    test.build()
-    test.run()
+    build = scheduler.add("nvbandwidth_build", test.build)
+    scheduler.add("nvbandwidth", test.run, [build], ["gpu"])
+
+def add_nccl_build(scheduler):
+    if "nccl_build" not in scheduler.tasks:
+        test = NCCL.NCCLBandwidth("config.json", machine_name)
+        scheduler.add("nccl_build", test.build)
+    return "nccl_build"
+
+def run_NCCLBandwidth(scheduler):
+    test = NCCL.NCCLBandwidth("config.json", machine_name)
+    build = add_nccl_build(scheduler)
+    scheduler.add("nccl", test.run, [build], ["gpu"])
+
+# searches NCCL algorithm, protocol and channel settings per message size
+def run_NCCLTuning(scheduler):
+    test = NCCL.NCCLBandwidth("config.json", machine_name)
+    build = add_nccl_build(scheduler)
+    scheduler.add("nccl_tune", test.tune, [build], ["gpu"])
 
-def run_NCCLBandwidth():
+# NCCL across the nodes of the multinode hostfile, through mpirun
+def run_NCCLMultinode(scheduler):
     test = NCCL.NCCLBandwidth("config.json", machine_name)
-    test.build()
-    test.run()
+    build = add_nccl_build(scheduler)
+    scheduler.add("nccl_multinode", test.run_multinode, [build], ["gpu"])
 
-def run_FlashAttention():
+def run_FlashAttention(scheduler):
     test = FA.FlashAttention("config.json", machine_name)
-    test.run()
+    download = scheduler.add("flashattention_download", test.download)
+    scheduler.add("flashattention", test.run, [download], ["gpu"])
     
-def run_FIO():
+def run_FIO(scheduler):
     test = FIO.FIO("config.json", machine_name)
-    test.run()
+    # not a GPU test, but it is a measurement and should not share the machine with another one
+    scheduler.add("fio", test.run, [], ["gpu"])
     
-def run_LLMBenchmark():
+def run_LLMBenchmark(scheduler):
     test = llmb.LLMBenchmark("config.json", current, machine_name)
-    test_cublaslt = gemm.GEMMCublastLt("config.json",machine_name)
-    test_cublaslt.build()
-    test.create_container()
-    test.download_models()
-    test.build_engines()
-    test.run_benchmark()
-    test.cleanup_container()
-
-machine_name = get_system_specs()
-
-# Tests (comment out the ones you don't want to run)
-run_CublasLt()
-os.chdir(current)
-run_NCCLBandwidth()
-os.chdir(current)
-run_HBMBandwidth()
-os.chdir(current)
-run_NVBandwidth()
-os.chdir(current)
-run_FlashAttention()
-os.chdir(current)
-run_FIO()
-
-# run_LLMBenchmark()
+    build = add_gemm_build(scheduler)
+    container = scheduler.add("llm_container", test.create_container)
+    # the downloads only need the network and run while other tests have the GPUs
+    download = scheduler.add("llm_download", test.download_models, [container])
+    # checkpoint conversions and engine builds, pipelined across models
+    prepare = scheduler.add("llm_prepare", test.prepare_models, [download, build], ["gpu"])
+    benchmark = scheduler.add("llm_benchmark", test.run_benchmark, [prepare], ["gpu"])
+    scheduler.add("llm_cleanup", test.cleanup_container, [benchmark], always=True)
+
+
+# roofline of the GEMM results against the measured HBM bandwidth, once both are
+# in Outputs
+def add_roofline(scheduler):
+    gemm_tasks = [name for name in ("gemm", "shmoo") if name in scheduler.tasks]
+    if not gemm_tasks or "hbm" not in scheduler.tasks:
+        return
+    datatype = gemm.GEMMCublastLt("config.json", machine_name).datatype
+    scheduler.add("roofline", lambda: roofline.analyze("Outputs", machine_name, datatype), gemm_tasks + ["hbm"])
+
+
+BENCHMARKS = {
+    "gemm": run_CublasLt,
+    "shmoo": run_Shmoo,
+    "nccl": run_NCCLBandwidth,
+    "nccl_tune": run_NCCLTuning,
+    "nccl_multinode": run_NCCLMultinode,
+    "hbm": run_HBMBandwidth,
+    "hbm_sweep": run_HBMSizeSweep,
+    "nvbandwidth": run_NVBandwidth,
+    "flashattention": run_FlashAttention,
+    "fio": run_FIO,
+    "llm": run_LLMBenchmark,
+}
+DEFAULT_BENCHMARKS = ["gemm", "nccl", "hbm", "nvbandwidth", "flashattention", "fio"]
+
+
+def main(argv=None):
+    global machine_name
+    parser = argparse.ArgumentParser(description="Azure AI Benchmarking Guide")
+    parser.add_argument("benchmarks", nargs="*", choices=list(BENCHMARKS), default=DEFAULT_BENCHMARKS,
+                        help="benchmarks to run, default: " + " ".join(DEFAULT_BENCHMARKS))
+    parser.add_argument("-j", "--jobs", type=int, default=4, help="steps to run at the same time")
+    parser.add_argument("--gate", action="store_true", help="compare the results with the published Azure results and fail on regressions")
+    args = parser.parse_args(argv)
+
+    tools.create_dir("Outputs")
+    LOGLEVEL = os.environ.get('LOGLEVEL', 'INFO').upper()
+    logging.basicConfig(filename="Outputs/runner.log",
+                        filemode='w',
+                        format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        level=LOGLEVEL)
+
+    machine_name = get_system_specs()
+
+    scheduler = Scheduler(args.jobs)
+    for name in args.benchmarks:
+        BENCHMARKS[name](scheduler)
+    add_roofline(scheduler)
+    status = scheduler.run()
+
+    for name, result in status.items():
+        print(f"{name}: {result} ({scheduler.tasks[name].duration:.0f}s)")
+    failed = not all(result == "done" for result in status.values())
+    if args.gate and baselines.main(["--machine", machine_name]) != 0:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
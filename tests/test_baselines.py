@@ -0,0 +1,40 @@
+import os
+
+import pytest
+
+from Benchmarks.NVBandwidth import NVBandwidth
+from Infra import baselines
+from Infra.results_store import ResultsStore
+from test_nvbandwidth import ROOT, nvbandwidth_logs
+
+MACHINE = "NVIDIA H100 80GB HBM3"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"), MACHINE, run_id="test")
+    yield store
+    store.close()
+
+
+def test_compare_nvbandwidth_log(store):
+    NVBandwidth(os.path.join(ROOT, "config.json"), MACHINE).record(store, nvbandwidth_logs())
+    baseline = baselines.parse_baseline(os.path.join(ROOT, "Azure_Results", "ND_H100_v5_results.md"))
+    report = baselines.compare(baseline, baselines.latest_results(store, MACHINE), {})
+    rows = {r["test"]: r for r in report if r["benchmark"] == "NVBandwidth"}
+    assert set(rows) == {"Host to Device", "Device to Host", "Device to Device read"}
+    # a healthy machine is within a percent of the published numbers
+    for row in rows.values():
+        assert row["status"] == "pass"
+        assert abs(row["delta"]) < 1
+    assert rows["Device to Host"]["measured"] == pytest.approx(52.36, abs=0.01)
+
+
+def test_compare_fails_slow_nvbandwidth(store):
+    slow = [log.replace("52.", "38.") for log in nvbandwidth_logs()]
+    NVBandwidth(os.path.join(ROOT, "config.json"), MACHINE).record(store, slow)
+    baseline = baselines.parse_baseline(os.path.join(ROOT, "Azure_Results", "ND_H100_v5_results.md"))
+    report = baselines.compare(baseline, baselines.latest_results(store, MACHINE), {})
+    rows = {r["test"]: r for r in report if r["benchmark"] == "NVBandwidth"}
+    assert rows["Device to Host"]["status"] == "fail"
+    assert rows["Host to Device"]["status"] == "pass"
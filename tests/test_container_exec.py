@@ -0,0 +1,54 @@
+import time
+
+from Infra.container_exec import Exec, LocalContainer
+
+
+def run(cmd, **kwargs):
+    lines = []
+    result = Exec(LocalContainer(), ["sh", "-c", cmd], on_line=lambda line, stream: lines.append(line), **kwargs).start().wait()
+    return result, lines
+
+
+# a pid that is gone or only left as a zombie nobody reaped
+def dead(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] == "Z"
+    except FileNotFoundError:
+        return True
+
+
+def test_exit_code_and_lines():
+    result, lines = run("echo one; echo two; exit 3", timeout=10)
+    assert result.exit_code == 3
+    assert result.timed_out is None
+    assert lines == ["one", "two"]
+    assert result.output == b"one\ntwo\n"
+
+
+def test_wall_clock_timeout():
+    # prints all the time, so only the wall-clock limit stops it
+    result, lines = run("while true; do echo tick; sleep 0.1; done", timeout=1, idle_timeout=5, grace=1)
+    assert result.exit_code == 124
+    assert result.timed_out.startswith("no exit")
+    assert lines and result.duration < 5
+
+
+def test_idle_timeout():
+    result, lines = run("echo started; sleep 30", idle_timeout=1, grace=1)
+    assert result.exit_code == 124
+    assert result.timed_out.startswith("no output")
+    assert lines == ["started"]
+    assert result.duration < 10
+
+
+def test_timeout_kills_process_group():
+    # the shell and its background child ignore SIGTERM, so the grandchild is only
+    # gone if SIGKILL went to the whole group after the grace period
+    result, lines = run("trap '' TERM; sleep 30 & echo $!; wait", timeout=1, grace=0.5)
+    assert result.exit_code == 124
+    child = int(lines[0])
+    deadline = time.monotonic() + 5
+    while not dead(child) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert dead(child)
@@ -0,0 +1,35 @@
+from Infra import gemm_compare
+from Infra.gemm_oracle import GEMMOracle
+
+SHMOO = """M,N,K,Batch,Time(us),TFLOPS,GPU,Backend
+4096,4096,1024,1,100.0,343.6,0,cublaslt
+4096,4096,2048,1,190.0,361.7,0,cublaslt
+4096,4096,1024,1,150.0,229.1,1,torch
+"""
+
+
+def write_shmoo(tmp_path, text=SHMOO):
+    path = tmp_path / "GEMMCublasLt_Shmoo_H100_fp16.csv"
+    path.write_text(text)
+    return str(path)
+
+
+def test_runs_are_split_by_backend(tmp_path):
+    runs = gemm_compare.load_runs(["H100=" + write_shmoo(tmp_path)])
+    assert sorted(runs) == ["H100", "H100 (torch)"]
+    assert list(runs["H100"]["tflops"]) == [343.6, 361.7]
+    assert list(runs["H100 (torch)"]["tflops"]) == [229.1]
+
+
+def test_csv_without_backend_is_cublaslt(tmp_path):
+    old = "\n".join(line.rsplit(",", 1)[0] for line in SHMOO.splitlines()[:3]) + "\n"
+    path = write_shmoo(tmp_path, old)
+    assert len(gemm_compare.load_results(path)) == 2
+    assert len(gemm_compare.load_results(path, "torch")) == 0
+
+
+def test_oracle_ignores_torch_results(tmp_path):
+    write_shmoo(tmp_path)
+    table = GEMMOracle.from_outputs(str(tmp_path), "H100").table("fp16")
+    # the torch row of 4096x4096x1024 would pull the median of the shape down
+    assert sorted(table.tflops) == [343.6, 361.7]
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+from Benchmarks.NVBandwidth import NVBandwidth
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# the three logs NVBandwidth.run() captures on an ND H100 v5, one per test
+def nvbandwidth_logs():
+    with open(os.path.join(ROOT, "tests", "data", "nvbandwidth_H100.txt")) as f:
+        text = f.read()
+    return ["Running " + log for log in text.split("Running ")[1:]]
+
+
+@pytest.fixture
+def nvb():
+    return NVBandwidth(os.path.join(ROOT, "config.json"), "NVIDIA H100 80GB HBM3")
+
+
+def test_parse_matrix_skips_gpu_header(nvb):
+    d2d, d2h, h2d = (nvb.parse_matrix(log) for log in nvbandwidth_logs())
+    # 8x8 minus the N/A diagonal, and one CPU row of 8 GPUs for the host copies
+    assert len(d2d) == 56
+    assert len(d2h) == 8
+    assert len(h2d) == 8
+    assert min(d2d) > 671 and max(d2d) < 673
+    assert sum(d2h) / len(d2h) == pytest.approx(52.36, abs=0.01)
+    assert sum(h2d) / len(h2d) == pytest.approx(51.29, abs=0.01)
+
+
+def test_parse_matrix_without_matrix(nvb):
+    assert nvb.parse_matrix("") == []
+    assert nvb.parse_matrix("Running device_to_host_memcpy_sm.\nERROR: no CUDA devices\n") == []